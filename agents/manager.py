@@ -1,26 +1,52 @@
 # Controls overall flow
 # Fetches important news (non-personalized)
+import asyncio
+
 from google.genai import types
 
 from google.adk.agents import LlmAgent
-from google.adk.models.google_llm import Gemini
 from google.adk.tools import AgentTool
 
 from agents.base import BaseAgent
+from agents.memory_validator import flush_memory_service
+from utils.fetch_tools import close_http_client, RateLimitedGemini, retry_config
+from utils.llm import run_agent
+from utils.runner_pool import get_runner_pool
 from utils.session import (
-    KEY_USER_NAME, KEY_LOCATION, KEY_INTERESTS, 
+    KEY_USER_ID, KEY_USER_NAME, KEY_LOCATION, KEY_INTERESTS, 
     KEY_NEWS_DATA, KEY_WEATHER_DATA, KEY_TRAFFIC_DATA,
     KEY_ORIGIN, KEY_DESTINATION
 )
 
+# Gathering modes:
+# - "llm": the ManagerOrchestrator LLM decides which tools to call (one round-trip per tool).
+# - "direct": all four sources are fetched concurrently, without an orchestrator conversation.
+GATHERING_MODES = ("llm", "direct")
+# Session inputs that can be fetched independently (see gather_sources)
+SOURCES = ("news", "weather", "traffic")
+
 class ManagerAgent(BaseAgent):
-    def __init__(self, session):
+    def __init__(self, session, mode: str = "llm"):
         """
         We inject the session here so the Manager can read user prefs
         and write the results.
         """
         super().__init__(name="ManagerAgent")
+        if mode not in GATHERING_MODES:
+            raise ValueError(f"Unknown gathering mode '{mode}'. Expected one of {GATHERING_MODES}.")
         self.session = session
+        self.mode = mode
+
+    def _location_query(self) -> str:
+        """
+        Builds the news query the orchestrator would use for the user's location.
+        """
+        location_data = self.session.state.get(KEY_LOCATION, "Unknown Location")
+        if isinstance(location_data, dict):
+            city = location_data.get('city', 'Unknown City')
+            country = location_data.get('country', '')
+            return f"{city}, {country}" if country else city
+        return str(location_data)
 
     def _build_system_instruction(self) -> str:
         """
@@ -29,11 +55,7 @@ class ManagerAgent(BaseAgent):
         # 1. Read Context from Session (Safe access with .get)
         user_name = self.session.state.get(KEY_USER_NAME, "User")
         # Handle location if it's a dict (from preferences) or string
-        location_data = self.session.state.get(KEY_LOCATION, "Unknown Location")
-        if isinstance(location_data, dict):
-            location_str = f"{location_data.get('city', 'Unknown City')}, {location_data.get('country', '')}"
-        else:
-            location_str = str(location_data)
+        location_str = self._location_query()
 
         # 2. Inject into Prompt
         return f"""
@@ -68,7 +90,7 @@ class ManagerAgent(BaseAgent):
 
         return LlmAgent(
             name="ManagerOrchestrator",
-            model=Gemini(model="gemini-2.0-flash-exp"), 
+            model=RateLimitedGemini(model="gemini-2.0-flash-exp", retry_options=retry_config, agent_name="ManagerOrchestrator"), 
             instruction=instructions,
             tools=tools,
         )
@@ -81,7 +103,8 @@ class ManagerAgent(BaseAgent):
         
         print(f"Manager: Fetching news for {query}...")
         
-        agent = NewsAgent()
+        # Validated against this user's memory partition
+        agent = NewsAgent(user_id=self.session.state.get(KEY_USER_ID))
         # Use the validated fetch
         news_items = await agent.fetch_and_validate_news(query)
         
@@ -109,7 +132,7 @@ class ManagerAgent(BaseAgent):
             
         print(f"Manager: Fetching tailored news for interests: {interests}...")
         
-        agent = TailoredNewsAgent()
+        agent = TailoredNewsAgent(user_id=self.session.state.get(KEY_USER_ID))
         results = await agent.get_news_for_interests(interests)
         
         # Append to existing news data
@@ -129,7 +152,7 @@ class ManagerAgent(BaseAgent):
         self.session.state[KEY_NEWS_DATA] = current_news
         return f"Found {count} tailored news stories across {len(results)} interests. Saved to session."
 
-    def _wrap_weather_tool(self):
+    async def _wrap_weather_tool(self):
         """Fetches weather for the user's stored location."""
         from agents.weather import WeatherAgent
         
@@ -150,14 +173,14 @@ class ManagerAgent(BaseAgent):
              return "Error: Latitude or Longitude missing in location data."
         
         try:
-            results = weather_agent.get_weather_insights(lat, lon)
+            results = await weather_agent.get_weather_insights_async(lat, lon)
         except Exception as e:
             results = f"Error fetching weather: {e}"
             
         self.session.state[KEY_WEATHER_DATA] = results
         return "Weather data saved."
 
-    def _wrap_traffic_tool(self):
+    async def _wrap_traffic_tool(self):
         """Fetches traffic for the user's stored commute."""
         from agents.traffic import TrafficAgent
         
@@ -171,35 +194,95 @@ class ManagerAgent(BaseAgent):
             return "Error: Origin or Destination missing in session."
         
         try:
-            results = traffic_agent.get_traffic_data(origin, destination)
+            results = await traffic_agent.get_traffic_data_async(origin, destination)
         except Exception as e:
             results = f"Error fetching traffic: {e}"
 
         self.session.state[KEY_TRAFFIC_DATA] = results
         return "Traffic data saved."
 
-    def execute_gathering(self):
+    def _source_fetchers(self) -> dict:
+        """
+        Tool calls that fill each session input.
+        News covers both the local headlines and the tailored interests.
+        """
+        return {
+            "weather": {"weather": self._wrap_weather_tool},
+            "traffic": {"traffic": self._wrap_traffic_tool},
+            "news": {
+                "news": lambda: self._wrap_news_tool(self._location_query()),
+                "tailored_news": self._wrap_tailored_news_tool,
+            },
+        }
+
+    async def gather_sources(self, sources=SOURCES):
+        """
+        Fetches only the given session inputs, concurrently.
+        Writes into the same session keys as the LLM orchestrator; a failing
+        source is logged and does not cancel the others.
         """
-        Orchestrates the data gathering process by running the Manager Agent.
+        fetchers = self._source_fetchers()
+        if "news" in sources:
+            # The news tools append, so start from a clean list
+            self.session.state[KEY_NEWS_DATA] = []
+        calls = {name: fetch for source in sources for name, fetch in fetchers[source].items()}
+        results = await asyncio.gather(*(fetch() for fetch in calls.values()), return_exceptions=True)
+
+        for source, result in zip(calls, results):
+            if isinstance(result, Exception):
+                self.logger.error(f"Direct gathering failed for {source}: {result}")
+            else:
+                print(f"Manager: {source} -> {result}")
+
+    async def _gather_direct(self):
+        """
+        Fetches weather, traffic, local news and tailored news concurrently.
+        """
+        print("Manager: Starting direct data gathering...")
+        await self.gather_sources(SOURCES)
+
+    async def _gather_with_orchestrator(self):
+        """
+        Lets the ManagerOrchestrator LLM decide which tools to call.
         """
         from google.adk.runners import InMemoryRunner
-        import asyncio
-        
+
         print("Manager: Starting data gathering...")
-        orchestrator = self.create_orchestrator()
-        runner = InMemoryRunner(agent=orchestrator)
-        
+        # Not pooled: the instruction and tools belong to this user's session
+        runner = get_runner_pool().build("ManagerOrchestrator", lambda: InMemoryRunner(agent=self.create_orchestrator()))
+
+        # Trigger the agent to use its tools
+        await run_agent(runner, "Please gather all necessary information for the morning briefing.",
+                        agent=runner.agent.name)
+
+    async def execute_gathering_async(self):
+        """
+        Runs the configured gathering mode on the current event loop.
+        Used by batch mode, where many users share one loop.
+        """
+        if self.mode == "direct":
+            await self._gather_direct()
+        else:
+            await self._gather_with_orchestrator()
+
+    def execute_gathering(self):
+        """
+        Orchestrates the data gathering process using the configured mode.
+        Inside a running event loop the run is scheduled and its task returned.
+        """
         async def _run():
-            # Trigger the agent to use its tools
-            await runner.run_debug("Please gather all necessary information for the morning briefing.")
-            
+            try:
+                await self.execute_gathering_async()
+            finally:
+                # The shared HTTP client is bound to this loop
+                await close_http_client()
+                await flush_memory_service()
+
         try:
-            asyncio.run(_run())
+            loop = asyncio.get_running_loop()
         except RuntimeError:
-            # If we are already in a loop (e.g. notebook), we await if possible or fail
             # For a script like main.py, asyncio.run is correct.
-            loop = asyncio.get_event_loop()
-            if loop.is_running():
-                loop.create_task(_run())
-            else:
-                raise
+            asyncio.run(_run())
+            return None
+        # Already in a loop (e.g. notebook): schedule the run, with the same cleanup, for the caller to await
+        return loop.create_task(_run())
@@ -1,77 +1,370 @@
-import json
-import os
+import asyncio
+import atexit
+import hashlib
 import logging
+import os
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
 
+from db.memory_store import GLOBAL_PARTITION, create_memory_store, partition_path
+from utils.metrics import get_metrics
+from utils.minhash import LSHIndex, story_text
+
 logger = logging.getLogger(__name__)
 
+# Pending entries of the shared service are written when either limit is hit
+MEMORY_FLUSH_EVERY = int(os.getenv("MEMORY_FLUSH_EVERY", 50))
+MEMORY_FLUSH_INTERVAL_SECONDS = float(os.getenv("MEMORY_FLUSH_INTERVAL_SECONDS", 5))
+# Estimated Jaccard similarity of headline+summary shingles above which a
+# story counts as already covered (0 disables near-duplicate detection)
+MEMORY_SIMILARITY_THRESHOLD = float(os.getenv("MEMORY_SIMILARITY_THRESHOLD", 0.6))
+# Hard cap per partition (user); the oldest entries are dropped beyond it
+MEMORY_MAX_ENTRIES = int(os.getenv("MEMORY_MAX_ENTRIES", 500))
+# Partitions (users) the shared service keeps in memory; the least recently used are written and dropped
+MEMORY_MAX_PARTITIONS = int(os.getenv("MEMORY_MAX_PARTITIONS", 256))
+
+
+def _count_items(result: str, count: int = 1):
+    get_metrics().inc("memory_items_total", count, result=result,
+                      help="Stories checked by the MemoryValidator: new, duplicate or near_duplicate.")
+
+
+def _content_id(item: dict) -> str:
+    """Stable id for items the LLM returned without one."""
+    digest = hashlib.sha1(" ".join(story_text(item).lower().split()).encode("utf-8")).hexdigest()
+    return f"auto-{digest[:16]}"
+
 class MemoryValidator:
-    def __init__(self, log_file="db/memory_log.json", retention_days=7):
+    def __init__(self, log_file="db/memory_log.json", retention_days=7, backend=None, store=None,
+                 similarity_threshold=MEMORY_SIMILARITY_THRESHOLD, partition=GLOBAL_PARTITION,
+                 max_entries=MEMORY_MAX_ENTRIES):
+        """
+        `backend` picks the storage engine ("sqlite" or "json", default from
+        MEMORY_BACKEND); pass `store` to supply one directly.
+        `partition` is the user id whose memory is checked; the default global
+        partition is shared by non-personalized headlines. Each partition keeps
+        at most `max_entries` stories for at most `retention_days`.
+        The near-duplicate index is kept next to the log (memory_log.minhash.json).
+        """
         self.log_file = log_file
         self.retention_days = retention_days
-        self.memory_data = self._load_memory()
-
-    def _load_memory(self):
-        if not os.path.exists(self.log_file):
-            return {"recent_topics": []}
-        try:
-            with open(self.log_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except json.JSONDecodeError:
-            return {"recent_topics": []}
-
-    def _save_memory(self):
-        # Ensure directory exists
-        os.makedirs(os.path.dirname(self.log_file), exist_ok=True)
-        with open(self.log_file, 'w', encoding='utf-8') as f:
-            json.dump(self.memory_data, f, indent=2)
+        self.partition = partition
+        self.max_entries = max_entries
+        self.store = store if store is not None else create_memory_store(log_file, backend)
+
+        # Absolute, since the index may be saved at exit under another working directory
+        self.index_file = os.path.abspath(partition_path(log_file, partition, ".minhash.json"))
+        self.near_duplicates = None
+        # Index changes not saved yet; the index is written by `persist`/`flush` (or at exit), not per batch
+        self._index_dirty = False
+        self._flush_registered = False
+        if similarity_threshold:
+            self.near_duplicates = LSHIndex(threshold=similarity_threshold)
+            if os.path.exists(self.index_file):
+                self.near_duplicates.load(self.index_file)
+            else:
+                self._rebuild_index()
 
     def validate_and_log(self, news_items: list) -> list:
         """
         Filters out news items that have been seen recently.
         Logs the new items.
         """
+        with get_metrics().track("MemoryValidator", "validate_and_log"):
+            return self._validate_and_log(news_items)
+
+    def _validate_and_log(self, news_items: list) -> list:
         self._cleanup_old_entries()
-        
+
+        # Only look up the IDs in this batch, via the store's index
+        existing_ids = self.store.existing_ids(
+            self.partition, (item.get('id') or _content_id(item) for item in news_items)
+        )
+        valid_items, new_entries = self._filter_new(news_items, existing_ids)
+
+        self.store.add(self.partition, new_entries)
+        if new_entries:
+            self._enforce_cap()
+            self._mark_index_dirty()
+        return valid_items
+
+    def flush(self):
+        """Saves the near-duplicate index if it changed since the last save."""
+        if self._index_dirty:
+            self._save_index()
+
+    def _mark_index_dirty(self):
+        if self.near_duplicates is None:
+            return
+        self._index_dirty = True
+        if not self._flush_registered:
+            # Standalone validators have no flush point of their own
+            atexit.register(self.flush)
+            self._flush_registered = True
+
+    def _filter_new(self, news_items: list, existing_ids: set) -> tuple:
+        """
+        Splits the batch into items to keep and entries to log.
+        `existing_ids` is updated in place.
+        """
         valid_items = []
-        # Create a set of existing IDs for fast lookup
-        existing_ids = {item.get('id') for item in self.memory_data.get("recent_topics", []) if item.get('id')}
-        
+        new_entries = []
+
         for item in news_items:
-            item_id = item.get('id')
-            if not item_id:
-                # If no ID, we can't reliably dedupe by ID. 
-                # We could check headline similarity, but for now let's allow it 
-                # or generate a hash. Let's assume the LLM follows instructions to generate IDs.
-                valid_items.append(item)
-                continue
+            # Items without an ID get one derived from their text so they are logged too
+            item_id = item.get('id') or _content_id(item)
 
-            if item_id not in existing_ids:
-                valid_items.append(item)
-                # Add to memory immediately to prevent duplicates within the same batch
-                self._add_to_memory(item)
-                existing_ids.add(item_id)
-            else:
+            if item_id in existing_ids:
                 logger.info(f"Skipping duplicate news: {item.get('headline')} (ID: {item_id})")
-        
-        self._save_memory()
-        return valid_items
+                _count_items("duplicate")
+                continue
+
+            signature = None
+            if self.near_duplicates is not None:
+                signature = self.near_duplicates.signature_for(story_text(item))
+                matches = self.near_duplicates.query(signature)
+                if matches:
+                    match_id, similarity = matches[0]
+                    logger.info(f"Skipping near-duplicate news: {item.get('headline')} "
+                                f"(ID: {item_id}, {similarity:.0%} similar to {match_id})")
+                    _count_items("near_duplicate")
+                    continue
+
+            valid_items.append(item)
+            _count_items("new")
+            # Track immediately to prevent duplicates within the same batch
+            entry = self._to_entry(item)
+            entry['id'] = item_id
+            new_entries.append(entry)
+            existing_ids.add(item_id)
+            if signature:
+                self.near_duplicates.add(item_id, signature, datetime.now().timestamp())
+
+        return valid_items, new_entries
 
-    def _add_to_memory(self, item):
+    def _to_entry(self, item):
         entry = item.copy()
         entry['timestamp'] = datetime.now().isoformat()
-        self.memory_data.setdefault("recent_topics", []).append(entry)
-
-    def _cleanup_old_entries(self):
-        cutoff = datetime.now() - timedelta(days=self.retention_days)
-        recent = []
-        for item in self.memory_data.get("recent_topics", []):
-            ts_str = item.get('timestamp')
-            if ts_str:
+        return entry
+
+    def _cutoff(self) -> datetime:
+        return datetime.now() - timedelta(days=self.retention_days)
+
+    def _cleanup_old_entries(self) -> list:
+        """Applies retention; returns the removed ids."""
+        cutoff = self._cutoff()
+        removed = self.store.prune(self.partition, cutoff)
+        if self.near_duplicates is not None:
+            self.near_duplicates.prune(cutoff.timestamp())
+        return removed
+
+    def _enforce_cap(self) -> list:
+        """Drops the oldest entries beyond `max_entries`; returns the removed ids."""
+        removed = self.store.trim(self.partition, self.max_entries)
+        if self.near_duplicates is not None:
+            for item_id in removed:
+                self.near_duplicates.remove(item_id)
+        return removed
+
+    def persist(self, entries: list) -> list:
+        """
+        Writes `entries` to the partition, then applies retention and the size
+        cap and saves the near-duplicate index. Returns the removed ids.
+        """
+        self.store.add(self.partition, entries)
+        removed = self._cleanup_old_entries() + self._enforce_cap()
+        self._save_index()
+        return removed
+
+    def _rebuild_index(self):
+        """Indexes stories already in the log (first run with near-duplicate detection)."""
+        for entry in self.store.entries(self.partition):
+            try:
+                timestamp = datetime.fromisoformat(entry['timestamp']).timestamp()
+            except (KeyError, TypeError, ValueError):
+                continue
+            signature = self.near_duplicates.signature_for(story_text(entry))
+            self.near_duplicates.add(entry['id'], signature, timestamp)
+
+    def _save_index(self):
+        if self.near_duplicates is not None:
+            self.near_duplicates.save(self.index_file)
+        self._index_dirty = False
+
+
+class _SeenIds:
+    """In-memory id -> epoch timestamp map that behaves like a set for `_filter_new`."""
+
+    def __init__(self, id_timestamps: dict):
+        self.id_timestamps = id_timestamps
+
+    def __contains__(self, item_id):
+        return item_id in self.id_timestamps
+
+    def add(self, item_id):
+        self.id_timestamps[item_id] = time.time()
+
+    def discard(self, item_ids):
+        for item_id in item_ids:
+            self.id_timestamps.pop(item_id, None)
+
+
+class _Partition:
+    """Per-partition state of the shared service."""
+
+    def __init__(self, validator: MemoryValidator):
+        self.validator = validator
+        self.seen = None
+        self.pending = []
+
+    def load_seen(self) -> _SeenIds:
+        if self.seen is None:
+            self.validator._cleanup_old_entries()
+            self.seen = _SeenIds(self.validator.store.id_timestamps(self.validator.partition))
+        return self.seen
+
+
+class MemoryValidatorService:
+    """
+    Process-wide validator shared by every NewsAgent run.
+    Seen ids live in memory per partition and check-and-insert runs under an
+    asyncio lock, so parallel runs never lose or duplicate each other's
+    entries. New entries are written to the store in batches (by count or
+    interval); call `flush()` on pipeline shutdown.
+    """
+
+    def __init__(self, log_file="db/memory_log.json", retention_days=7, backend=None, store=None,
+                 flush_every: int = MEMORY_FLUSH_EVERY,
+                 flush_interval: float = MEMORY_FLUSH_INTERVAL_SECONDS,
+                 max_partitions: int = MEMORY_MAX_PARTITIONS,
+                 **validator_options):
+        self.log_file = log_file
+        self.retention_days = retention_days
+        # One store for all partitions; each partition only touches its own rows/files
+        self.store = store if store is not None else create_memory_store(log_file, backend)
+        self.validator_options = validator_options
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+
+        self.max_partitions = max(1, max_partitions)
+
+        # Least recently used first
+        self._partitions: OrderedDict[str, _Partition] = OrderedDict()
+        self._pending_count = 0
+        self._last_flush = time.monotonic()
+        self._lock = None
+        self._lock_loop = None
+
+        # Safety net for scripts that never call flush()
+        atexit.register(self._flush_at_exit)
+
+    def _get_lock(self) -> asyncio.Lock:
+        # asyncio locks are bound to one event loop (main.py may run several in sequence)
+        loop = asyncio.get_running_loop()
+        if self._lock is None or self._lock_loop is not loop:
+            self._lock = asyncio.Lock()
+            self._lock_loop = loop
+        return self._lock
+
+    def _partition(self, partition: str) -> _Partition:
+        if partition in self._partitions:
+            self._partitions.move_to_end(partition)
+            return self._partitions[partition]
+
+        validator = MemoryValidator(
+            log_file=self.log_file,
+            retention_days=self.retention_days,
+            store=self.store,
+            partition=partition,
+            **self.validator_options,
+        )
+        state = self._partitions[partition] = _Partition(validator)
+        self._evict()
+        return state
+
+    def _evict(self):
+        """Writes and drops the least recently used partitions beyond `max_partitions`."""
+        while len(self._partitions) > self.max_partitions:
+            name, state = next(iter(self._partitions.items()))
+            if state.pending:
                 try:
-                    ts = datetime.fromisoformat(ts_str)
-                    if ts > cutoff:
-                        recent.append(item)
-                except ValueError:
-                    pass # Drop invalid timestamps
-        self.memory_data["recent_topics"] = recent
+                    state.validator.persist(state.pending)
+                except Exception as e:
+                    # Stays loaded so its entries go out with the next flush
+                    logger.error(f"Could not write {len(state.pending)} memory entries for {name}: {e}")
+                    return
+                self._pending_count -= len(state.pending)
+            del self._partitions[name]
+            self.store.release(name)
+
+    async def validate_and_log(self, news_items: list, partition: str | None = None) -> list:
+        """
+        Same contract as `MemoryValidator.validate_and_log` for the given
+        partition (user id; default global), without touching the store
+        unless a flush is due.
+        """
+        with get_metrics().track("MemoryValidator", "validate_and_log"):
+            return await self._validate_and_log(news_items, partition)
+
+    async def _validate_and_log(self, news_items: list, partition: str | None) -> list:
+        async with self._get_lock():
+            state = self._partition(partition or GLOBAL_PARTITION)
+            valid_items, new_entries = state.validator._filter_new(news_items, state.load_seen())
+            state.pending.extend(new_entries)
+            self._pending_count += len(new_entries)
+
+            flush_due = (
+                self._pending_count >= self.flush_every
+                or time.monotonic() - self._last_flush >= self.flush_interval
+            )
+            if flush_due:
+                self._flush_pending()
+            return valid_items
+
+    async def flush(self):
+        """Writes pending entries and applies retention and size caps to their partitions."""
+        async with self._get_lock():
+            self._flush_pending()
+
+    def _flush_at_exit(self):
+        if self._pending_count:
+            self._flush_pending()
+
+    def _flush_pending(self):
+        with get_metrics().track("MemoryValidator", "flush"):
+            self._write_pending()
+
+    def _write_pending(self):
+        self._last_flush = time.monotonic()
+        self._pending_count = 0
+        for state in self._partitions.values():
+            # Untouched partitions had retention applied when they were loaded
+            if not state.pending:
+                continue
+            try:
+                removed = state.validator.persist(state.pending)
+            except Exception as e:
+                # Kept for the next flush, otherwise these stories would be served again
+                logger.error(f"Could not write {len(state.pending)} memory entries for "
+                             f"{state.validator.partition}: {e}")
+                self._pending_count += len(state.pending)
+                continue
+            state.pending = []
+            if state.seen is not None:
+                state.seen.discard(removed)
+
+
+_shared_service = None
+
+def get_memory_service() -> MemoryValidatorService:
+    """Returns the process-wide MemoryValidatorService, creating it on first use."""
+    global _shared_service
+    if _shared_service is None:
+        _shared_service = MemoryValidatorService()
+    return _shared_service
+
+async def flush_memory_service():
+    """Flushes the shared service if it was ever used. Call on pipeline shutdown."""
+    if _shared_service is not None:
+        await _shared_service.flush()
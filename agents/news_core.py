@@ -1,23 +1,189 @@
 # Fetches important news (non-personalized)
 from google.genai import types
+import asyncio
 import json
 import logging
+import math
+import os
+import re
+import threading
 
 from google.adk.agents import LlmAgent
-from google.adk.models.google_llm import Gemini
 from google.adk.tools import google_search
 from google.adk.runners import InMemoryRunner
 
-from utils.fetch_tools import retry_config
+from utils.fetch_tools import RateLimitedGemini, retry_config
 from agents.base import BaseAgent
-from agents.memory_validator import MemoryValidator
+from agents.memory_validator import get_memory_service
+from utils.cache import DiskTTLCache
+from utils.llm import run_agent
+from utils.metrics import get_metrics
+from utils.runner_pool import get_runner_pool
+from utils.singleflight import SingleFlight, normalize_query
+
+NEWS_MODEL = "gemini-2.5-flash-lite"
+
+# Parsed (pre-validation) news lists, keyed by model + normalized query.
+# Set NEWS_CACHE_TTL_SECONDS=0 to disable the cache.
+NEWS_CACHE_FILE = os.getenv("NEWS_CACHE_FILE", "db/news_cache.json")
+NEWS_CACHE_TTL_SECONDS = float(os.getenv("NEWS_CACHE_TTL_SECONDS", 3600))
+NEWS_CACHE_MAX_ENTRIES = int(os.getenv("NEWS_CACHE_MAX_ENTRIES", 512))
+# The cache file is rewritten at most this often (and at exit), not on every lookup
+NEWS_CACHE_FLUSH_INTERVAL_SECONDS = float(os.getenv("NEWS_CACHE_FLUSH_INTERVAL_SECONDS", 30))
+
+# Batched runs (several queries, one JSON object keyed by label). Set NEWS_BATCH_MAX_SIZE=1
+# to run every query on its own.
+NEWS_BATCH_MAX_SIZE = int(os.getenv("NEWS_BATCH_MAX_SIZE", 8))
+NEWS_BATCH_INITIAL_SIZE = int(os.getenv("NEWS_BATCH_INITIAL_SIZE", 4))
+# Batches are sized so the expected response stays under this, long outputs get truncated
+NEWS_BATCH_MAX_RESPONSE_CHARS = int(os.getenv("NEWS_BATCH_MAX_RESPONSE_CHARS", 16000))
+
+# Process-wide: identical queries from different users/interests share one LLM run
+_news_flight = SingleFlight()
+_news_cache = None
+
+
+def get_news_cache():
+    """
+    Returns the process-wide news cache, or None when caching is disabled.
+    """
+    global _news_cache
+    if NEWS_CACHE_TTL_SECONDS <= 0:
+        return None
+    if _news_cache is None:
+        _news_cache = DiskTTLCache(
+            NEWS_CACHE_FILE,
+            max_entries=NEWS_CACHE_MAX_ENTRIES,
+            ttl_seconds=NEWS_CACHE_TTL_SECONDS,
+            name="news",
+            flush_interval=NEWS_CACHE_FLUSH_INTERVAL_SECONDS,
+        )
+    return _news_cache
+
+
+class NewsBatchSizer:
+    """
+    How many queries go into one batched news run. Grows by one after a
+    batch that came back complete and halves after one that failed or
+    missed queries. It is also capped so that the expected response size
+    (the running average of characters per query) stays under
+    `max_response_chars`.
+    """
+
+    def __init__(self, initial: int = NEWS_BATCH_INITIAL_SIZE, max_size: int = NEWS_BATCH_MAX_SIZE,
+                 max_response_chars: int = NEWS_BATCH_MAX_RESPONSE_CHARS):
+        self.max_size = max(1, max_size)
+        self.max_response_chars = max_response_chars
+        self._size = float(min(max(1, initial), self.max_size))
+        self._chars_per_query = None
+        self._lock = threading.Lock()
+
+    @property
+    def size(self) -> int:
+        size = int(self._size)
+        if self._chars_per_query:
+            size = min(size, int(self.max_response_chars // self._chars_per_query))
+        return max(1, size)
+
+    def record(self, requested: int, complete: int, response_chars: int):
+        """Adapts the size to a batch of `requested` queries that returned `complete` usable lists."""
+        with self._lock:
+            if complete >= requested:
+                self._size = min(float(self.max_size), self._size + 1)
+            else:
+                self._size = max(1.0, self._size / 2)
+            if complete:
+                per_query = response_chars / complete
+                if self._chars_per_query is None:
+                    self._chars_per_query = per_query
+                else:
+                    self._chars_per_query = 0.8 * self._chars_per_query + 0.2 * per_query
+
+    def split(self, labels: list) -> list:
+        """`labels` in as few batches of at most `size` as possible, evenly filled."""
+        if not labels:
+            return []
+        count = math.ceil(len(labels) / self.size)
+        per_batch, extra = divmod(len(labels), count)
+        batches, start = [], 0
+        for i in range(count):
+            end = start + per_batch + (1 if i < extra else 0)
+            batches.append(labels[start:end])
+            start = end
+        return batches
+
+
+_news_batch_sizer = NewsBatchSizer()
+
+
+def _is_story_list(items) -> bool:
+    return isinstance(items, list) and bool(items) and all(isinstance(item, dict) for item in items)
+
+
+def parse_news_batch(text: str, labels: list) -> dict:
+    """
+    Story lists by label from a batched response (a JSON object keyed by
+    label, keys matched case-insensitively). When the object is cut off or
+    malformed, each label's list is recovered on its own. Labels without a
+    usable (non-empty) list map to None.
+    """
+    clean_text = text.replace("```json", "").replace("```", "").strip()
+    by_key = {}
+    start = clean_text.find("{")
+    if start != -1:
+        try:
+            parsed, _ = json.JSONDecoder().raw_decode(clean_text[start:])
+            if isinstance(parsed, dict):
+                by_key = {normalize_query(str(key)): value for key, value in parsed.items()}
+        except ValueError:
+            pass
+
+    results = {}
+    for label in labels:
+        items = by_key.get(normalize_query(label))
+        if items is None:
+            items = _recover_list(clean_text, label)
+        results[label] = items if _is_story_list(items) else None
+    return results
+
+
+def _recover_list(text: str, label: str):
+    """The JSON list following `"label":` in `text`, if it parses on its own."""
+    match = re.search(re.escape(json.dumps(label, ensure_ascii=False)) + r"\s*:\s*\[", text, re.IGNORECASE)
+    if match is None:
+        return None
+    try:
+        items, _ = json.JSONDecoder().raw_decode(text[match.end() - 1:])
+    except ValueError:
+        return None
+    return items
+
+
+def _response_text(events) -> str:
+    text = ""
+    for event in events:
+        if hasattr(event, 'content') and event.content:
+            for part in getattr(event.content, 'parts', None) or []:
+                if hasattr(part, 'text') and part.text:
+                    text += part.text
+    return text
 
 
 class NewsAgent(BaseAgent):
-    def __init__(self):
+    def __init__(self, cache=None, user_id=None):
+        """
+        `user_id` selects the memory partition used for deduplication;
+        without one the shared global partition is used.
+        """
         super().__init__(name="NewsAgent")
+        self.cache = cache if cache is not None else get_news_cache()
+        self.user_id = user_id
 
-    def create_news_agent(self) -> LlmAgent:
+    def create_news_agent(self, batched: bool = False) -> LlmAgent:
+        """
+        `batched` switches the output to a JSON object with one story list
+        per requested topic (see `fetch_and_validate_news_batch`).
+        """
         # We force the LLM to output a structured list for the Validator
         instructions = """
         You are a News Aggregator.
@@ -34,57 +200,187 @@ class NewsAgent(BaseAgent):
           }
         ]
         """
+        if batched:
+            instructions = instructions.replace("2. You MUST output a Valid JSON list of objects.", (
+                "2. The request names several topics. You MUST output a Valid JSON object with one key per "
+                "topic, spelled exactly as in the request, whose value is the JSON list of objects for that topic."
+            ))
 
         return LlmAgent(
             name="NewsAgent",
-            model=Gemini(model="gemini-2.5-flash-lite"),
+            model=RateLimitedGemini(model=NEWS_MODEL, retry_options=retry_config, agent_name="NewsAgent"),
             instruction=instructions,
             tools=[google_search],
         )
 
+    def _runner(self, batched: bool = False):
+        # Built once per process (and event loop), each run gets its own session
+        return get_runner_pool().get(
+            (self.name, NEWS_MODEL, batched), lambda: InMemoryRunner(agent=self.create_news_agent(batched))
+        )
+
+    async def _fetch_news_items(self, query: str) -> list:
+        """
+        Runs the news agent and parses its JSON output. No validation.
+        """
+        # Run the agent
+        events = await run_agent(self._runner(), f"Find news about: {query}", agent=self.name)
+        response_text = _response_text(events)
+
+        # Parse JSON
+        # Clean up markdown code blocks if present
+        clean_text = response_text.replace("```json", "").replace("```", "").strip()
+        # Find the first [ and last ]
+        start = clean_text.find("[")
+        end = clean_text.rfind("]")
+        if start != -1 and end != -1:
+            clean_text = clean_text[start:end+1]
+            return json.loads(clean_text)
+
+        self.logger.warning(f"Could not find JSON list in response: {response_text[:100]}...")
+        return []
+
+    def _cache_key(self, query: str) -> str:
+        return f"{NEWS_MODEL}|{normalize_query(query)}"
+
+    async def _fetch_news_items_cached(self, query: str) -> list:
+        """
+        Serves the parsed news list from the cache, or fetches and stores it.
+        Empty results are not cached so a failed run is retried next time.
+        """
+        if self.cache is not None:
+            cached = self.cache.get(self._cache_key(query))
+            if cached is not None:
+                print(f"[{self.name}] Cache hit for: {query}")
+                return cached
+
+        async def _fetch_and_store():
+            # Runs once per in-flight query, so only the leader writes the cache
+            news_items = await self._fetch_news_items(query)
+            if self.cache is not None and news_items:
+                self.cache.set(self._cache_key(query), news_items)
+            return news_items
+
+        return await _news_flight.do(normalize_query(query), _fetch_and_store)
+
+    async def _fetch_news_batch(self, batch: dict) -> dict:
+        """
+        One run for several queries ({label: query}). Returns the parsed list
+        per label, or None for labels the response had no usable list for.
+        """
+        topics = "\n".join(f"- {json.dumps(label, ensure_ascii=False)}: {query}" for label, query in batch.items())
+        try:
+            events = await run_agent(self._runner(batched=True), f"Find news for each of these topics:\n{topics}",
+                                     agent=self.name)
+        except Exception as e:
+            self.logger.warning(f"Batched news run for {len(batch)} topics failed: {e}")
+            _news_batch_sizer.record(len(batch), 0, 0)
+            return {}
+
+        response_text = _response_text(events)
+        parsed = parse_news_batch(response_text, list(batch))
+        complete = sum(1 for items in parsed.values() if items is not None)
+        _news_batch_sizer.record(len(batch), complete, len(response_text))
+        if complete < len(batch):
+            self.logger.warning(f"Batched news response covered {complete} of {len(batch)} topics, "
+                                f"retrying the rest individually")
+        return parsed
+
+    async def _fetch_news_items_batched(self, queries: dict) -> dict:
+        """
+        Parsed news lists for {label: query}: cached ones are served from the
+        cache, queries already in flight (single or batched) are joined, and
+        the rest are fetched in batches of the adaptive batch size. A query
+        the batch did not return a usable list for is retried on its own.
+        Values are lists, or the exception that query failed with.
+        """
+        results = {}
+        pending = []
+        for label, query in queries.items():
+            cached = self.cache.get(self._cache_key(query)) if self.cache is not None else None
+            if cached is not None:
+                print(f"[{self.name}] Cache hit for: {query}")
+                results[label] = cached
+            elif not _news_flight.in_flight(normalize_query(query)):
+                pending.append(label)
+
+        batch_of = {}
+        for labels in _news_batch_sizer.split(pending):
+            if len(labels) > 1:
+                task = asyncio.ensure_future(self._fetch_news_batch({label: queries[label] for label in labels}))
+                batch_of.update({label: task for label in labels})
+
+        metrics = get_metrics()
+
+        def _fetch(label: str):
+            query = queries[label]
+
+            async def _fetch_and_store():
+                news_items = None
+                task = batch_of.get(label)
+                if task is not None:
+                    # Shielded, the batch is shared with the other labels in it
+                    news_items = (await asyncio.shield(task)).get(label)
+                    metrics.inc("news_batch_queries_total", result="batched" if news_items is not None else "retried",
+                                help="Queries sent in batched news runs, by whether the batch answered them.")
+                if news_items is None:
+                    news_items = await self._fetch_news_items(query)
+                if self.cache is not None and news_items:
+                    self.cache.set(self._cache_key(query), news_items)
+                return news_items
+
+            # Claimed right away, so other users' batches join these queries instead of repeating them
+            return asyncio.shield(_news_flight.start(normalize_query(query), _fetch_and_store))
+
+        labels = [label for label in queries if label not in results]
+        fetched = await asyncio.gather(*[_fetch(label) for label in labels], return_exceptions=True)
+        results.update(zip(labels, fetched))
+        return results
+
+    async def _validate(self, news_items: list) -> list:
+        # On a private copy, the fetched list is shared between callers
+        validator = get_memory_service()
+        valid_news = await validator.validate_and_log(
+            [dict(item) for item in news_items], partition=self.user_id
+        )
+        print(f"[{self.name}] Found {len(news_items)} items, {len(valid_news)} valid after deduplication.")
+        return valid_news
+
     async def fetch_and_validate_news(self, query: str) -> list:
         """
         Runs the news agent, parses the JSON output, and validates against memory.
+        Parsed results are served from the TTL cache when fresh, and concurrent
+        calls with the same (normalized) query share one fetch; memory
+        validation still runs separately for every caller.
         """
-        blueprint = self.create_news_agent()
-        runner = InMemoryRunner(agent=blueprint)
-        
         print(f"[{self.name}] Fetching news for: {query}")
         
         try:
-            # Run the agent
-            events = await runner.run_debug(f"Find news about: {query}")
-            
-            # Extract text
-            response_text = ""
-            for event in events:
-                if hasattr(event, 'content') and event.content:
-                    parts = getattr(event.content, 'parts', [])
-                    if parts:
-                        for part in parts:
-                            if hasattr(part, 'text') and part.text:
-                                response_text += part.text
-            
-            # Parse JSON
-            # Clean up markdown code blocks if present
-            clean_text = response_text.replace("```json", "").replace("```", "").strip()
-            # Find the first [ and last ]
-            start = clean_text.find("[")
-            end = clean_text.rfind("]")
-            if start != -1 and end != -1:
-                clean_text = clean_text[start:end+1]
-                news_items = json.loads(clean_text)
-            else:
-                self.logger.warning(f"Could not find JSON list in response: {response_text[:100]}...")
-                return []
-
-            # Validate
-            validator = MemoryValidator()
-            valid_news = validator.validate_and_log(news_items)
-            
-            print(f"[{self.name}] Found {len(news_items)} items, {len(valid_news)} valid after deduplication.")
-            return valid_news
+            news_items = await self._fetch_news_items_cached(query)
+            return await self._validate(news_items)
 
         except Exception as e:
             self.logger.error(f"Error fetching/validating news: {e}")
-            return []
\ No newline at end of file
+            return []
+
+    async def fetch_and_validate_news_batch(self, queries: dict) -> dict:
+        """
+        `fetch_and_validate_news` for several queries ({label: query}) with
+        fewer LLM runs: uncached queries are asked for together, several per
+        run. Returns the validated list per label ([] for a failed query).
+        """
+        print(f"[{self.name}] Fetching news for {len(queries)} queries (batch size {_news_batch_sizer.size})")
+        fetched = await self._fetch_news_items_batched(queries)
+
+        async def _validate_one(label: str):
+            news_items = fetched[label]
+            try:
+                if isinstance(news_items, Exception):
+                    raise news_items
+                return await self._validate(news_items)
+            except Exception as e:
+                self.logger.error(f"Error fetching/validating news for {label}: {e}")
+                return []
+
+        validated = await asyncio.gather(*(_validate_one(label) for label in queries))
+        return dict(zip(queries, validated))
@@ -0,0 +1,137 @@
+# Fits the SuperWriter's input payload into a token budget
+import json
+import math
+import os
+import re
+from datetime import datetime
+
+# Rough chars-per-token ratio for English text and JSON
+CHARS_PER_TOKEN = 4
+# Input tokens allowed per minute of podcast: ~150 spoken words/min,
+# with room for the writer to choose between stories
+PAYLOAD_TOKENS_PER_MINUTE = int(os.getenv("PAYLOAD_TOKENS_PER_MINUTE", 600))
+PAYLOAD_MIN_TOKENS = int(os.getenv("PAYLOAD_MIN_TOKENS", 800))
+DEFAULT_TIME_LIMIT_SECONDS = 5 * 60
+# Summaries that don't fit are cut to this many sentences before the story is dropped
+TRIMMED_SUMMARY_SENTENCES = 2
+
+_TIME_UNITS = {"s": 1, "sec": 1, "second": 1, "m": 60, "min": 60, "minute": 60, "h": 3600, "hr": 3600, "hour": 3600}
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+
+def estimate_tokens(value) -> int:
+    """Approximate token count of a string, or of a value's compact JSON."""
+    text = value if isinstance(value, str) else _compact(value)
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def _compact(value) -> str:
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False, default=str)
+
+
+def parse_time_limit(time_limit) -> int:
+    """'5 minutes' / '90 seconds' / '1 hour' / 5 (minutes) -> seconds."""
+    if isinstance(time_limit, (int, float)):
+        return int(time_limit * 60)
+    match = re.match(r"\s*(\d+(?:\.\d+)?)\s*([a-z]*)", str(time_limit or "").lower())
+    if not match:
+        return DEFAULT_TIME_LIMIT_SECONDS
+    amount, unit = float(match.group(1)), match.group(2)
+    # Bare numbers and unknown units count as minutes
+    seconds_per_unit = _TIME_UNITS.get(unit) or _TIME_UNITS.get(unit.rstrip("s"), 60)
+    return int(amount * seconds_per_unit)
+
+
+def budget_for(time_limit) -> int:
+    minutes = parse_time_limit(time_limit) / 60
+    return max(PAYLOAD_MIN_TOKENS, int(minutes * PAYLOAD_TOKENS_PER_MINUTE))
+
+
+def _interest_words(interests: list) -> set:
+    return {w for interest in interests or [] for w in _WORD_RE.findall(interest.lower()) if len(w) > 2}
+
+
+def _story_time(story: dict):
+    for key in ("published", "published_at", "date", "timestamp"):
+        try:
+            return datetime.fromisoformat(str(story[key]).replace("Z", "+00:00")).timestamp()
+        except (KeyError, ValueError):
+            continue
+    return None
+
+
+def rank_stories(stories: list, interests: list) -> list:
+    """
+    Orders stories by interest match, then recency. Stories without a date
+    keep their gathered order (the news agent lists the most important first).
+    """
+    words = _interest_words(interests)
+    interest_queries = {f"Interest: {i}".lower() for i in interests or []}
+
+    def score(position_story):
+        position, story = position_story
+        text_words = set(_WORD_RE.findall(f"{story.get('headline', '')} {story.get('summary', '')}".lower()))
+        from_interest = any(str(q).lower() in interest_queries for q in story.get("queries", []))
+        match = (2 if from_interest else 0) + len(words & text_words) / max(len(words), 1)
+        published = _story_time(story)
+        return (-match, -(published or 0), position)
+
+    return [story for _, story in sorted(enumerate(stories), key=score)]
+
+
+def _trim_story(story: dict) -> dict:
+    sentences = _SENTENCE_END.split(story.get("summary") or "")
+    trimmed = dict(story, summary=" ".join(sentences[:TRIMMED_SUMMARY_SENTENCES]))
+    trimmed.pop("id", None)
+    return trimmed
+
+
+def _compact_location(location):
+    # Coordinates are for the fetchers, the writer only needs the place name
+    if isinstance(location, dict):
+        city, country = location.get("city"), location.get("country")
+        return ", ".join(p for p in (city, country) if p) or "Unknown"
+    return location
+
+
+def build_writer_payload(payload: dict, time_limit=None, budget_tokens: int | None = None) -> tuple:
+    """
+    Builds the compact JSON sent to the SuperWriter.
+    Non-news fields are always kept; stories are added in rank order, first
+    in full, then with a trimmed summary, and dropped once the budget
+    (derived from the time limit) is exhausted.
+    Returns (payload_json, report) where the report has before/after token estimates.
+    """
+    budget = budget_tokens or budget_for(time_limit)
+    stories = payload.get("news") or []
+
+    base = {key: value for key, value in payload.items() if key != "news"}
+    base["location"] = _compact_location(base.get("location"))
+    if time_limit is not None:
+        base["time_limit"] = time_limit
+
+    kept, trimmed, dropped = [], 0, 0
+    used = estimate_tokens(dict(base, news=[]))
+    for story in rank_stories(stories, payload.get("interests")):
+        full = {key: value for key, value in story.items() if value not in (None, "", [])}
+        for candidate in (full, _trim_story(full)):
+            cost = estimate_tokens(candidate) + 1  # separating comma
+            if used + cost <= budget:
+                kept.append(candidate)
+                used += cost
+                trimmed += candidate is not full
+                break
+        else:
+            dropped += 1
+
+    payload_json = _compact(dict(base, news=kept))
+    report = {
+        "tokens_before": estimate_tokens(json.dumps(payload, indent=2, default=str)),
+        "tokens_after": estimate_tokens(payload_json),
+        "budget": budget,
+        "stories_kept": len(kept),
+        "stories_trimmed": trimmed,
+        "stories_dropped": dropped,
+    }
+    return payload_json, report
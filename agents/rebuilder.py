@@ -0,0 +1,194 @@
+# Incremental rebuild: refetches only expired inputs and rewrites only the sections whose data changed
+import asyncio
+import hashlib
+import json
+import os
+import re
+import time
+
+from agents.base import BaseAgent
+from agents.manager import ManagerAgent, SOURCES
+from agents.memory_validator import flush_memory_service
+from agents.summarizer import SuperWriterAgent, SCRIPT_SECTIONS, SECTION_SOURCES
+from utils.fetch_tools import close_http_client
+from utils.session import (
+    KEY_USER_ID, KEY_USER_NAME, KEY_LOCATION, KEY_INTERESTS,
+    KEY_NEWS_DATA, KEY_WEATHER_DATA, KEY_TRAFFIC_DATA,
+    KEY_ORIGIN, KEY_DESTINATION, KEY_TONE, KEY_TIME_LIMIT
+)
+
+# Last build per user: input hashes + data, and the script split into sections
+PODCAST_STATE_DIR = os.getenv("PODCAST_STATE_DIR", "db/podcast_state")
+# How long each fetched input is reused before a rebuild refetches it
+REBUILD_TTL_SECONDS = {
+    "news": float(os.getenv("REBUILD_NEWS_TTL_SECONDS", 3600)),
+    "weather": float(os.getenv("REBUILD_WEATHER_TTL_SECONDS", 3600)),
+    "traffic": float(os.getenv("REBUILD_TRAFFIC_TTL_SECONDS", 300)),
+}
+# Builds older than this (e.g. yesterday's) are not refreshed but rebuilt from scratch
+REBUILD_MAX_AGE_SECONDS = float(os.getenv("REBUILD_MAX_AGE_SECONDS", 12 * 3600))
+# Stories kept per news query across refreshes (newest first), so the stored list stays bounded
+REBUILD_MAX_STORIES_PER_QUERY = int(os.getenv("REBUILD_MAX_STORIES_PER_QUERY", 10))
+
+SOURCE_SESSION_KEYS = {"news": KEY_NEWS_DATA, "weather": KEY_WEATHER_DATA, "traffic": KEY_TRAFFIC_DATA}
+# Profile fields the whole script depends on; changing any of them forces a full build
+PROFILE_KEYS = (KEY_USER_NAME, KEY_LOCATION, KEY_INTERESTS, KEY_ORIGIN, KEY_DESTINATION, KEY_TONE, KEY_TIME_LIMIT)
+
+
+def content_hash(value) -> str:
+    """Stable hash of a JSON-like value (key order does not matter)."""
+    canonical = json.dumps(value, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def merge_news(stored: list, fresh: list, max_per_query: int = REBUILD_MAX_STORIES_PER_QUERY) -> list:
+    """
+    Adds freshly fetched stories to the stored news entries ({"query", "result"}),
+    one entry per query with the newest stories first, deduplicated by id and
+    capped at `max_per_query`. Fresh entries without stories change nothing.
+    """
+    merged = {}
+    for entry in stored or []:
+        if isinstance(entry, dict) and entry.get("result"):
+            merged[entry.get("query")] = list(entry["result"])
+    for entry in fresh or []:
+        if not isinstance(entry, dict) or not entry.get("result"):
+            continue
+        items = merged.get(entry.get("query"), [])
+        known = {item.get("id") for item in items if isinstance(item, dict)}
+        new_items = [item for item in entry["result"] if not isinstance(item, dict) or item.get("id") not in known]
+        merged[entry.get("query")] = new_items + items
+    return [{"query": query, "result": items[:max_per_query]} for query, items in merged.items()]
+
+
+class PodcastRebuilder(BaseAgent):
+    """
+    Refreshes a user's podcast from the last build. Inputs still within their
+    TTL are reused as stored, expired ones are refetched, and only sections
+    whose input hash changed are rewritten; the rest of the script is kept
+    verbatim.
+    """
+
+    def __init__(self, session, state_dir: str = PODCAST_STATE_DIR, ttls: dict | None = None, clock=time.time):
+        super().__init__(name="Rebuilder")
+        self.session = session
+        self.state_dir = state_dir
+        self.ttls = {**REBUILD_TTL_SECONDS, **(ttls or {})}
+        self._clock = clock
+
+    def _state_path(self) -> str:
+        user_id = self.session.state.get(KEY_USER_ID) or "default"
+        return os.path.join(self.state_dir, re.sub(r"[^A-Za-z0-9_.-]", "_", user_id) + ".json")
+
+    def _load_state(self):
+        path = self._state_path()
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (json.JSONDecodeError, OSError) as e:
+            self.logger.warning(f"Ignoring unreadable build state {path}: {e}")
+            return None
+
+    def _save_state(self, state: dict):
+        path = self._state_path()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, default=str)
+        os.replace(tmp_path, path)
+
+    def _profile_hash(self) -> str:
+        return content_hash({key: self.session.state.get(key) for key in PROFILE_KEYS})
+
+    def _is_full_build(self, previous, now: float) -> bool:
+        return (
+            previous is None
+            or previous.get("profile_hash") != self._profile_hash()
+            or not previous.get("sections")
+            or now - previous.get("built_at", 0) > REBUILD_MAX_AGE_SECONDS
+        )
+
+    async def rebuild_async(self) -> dict:
+        """
+        Returns {"script", "refetched", "rewritten", "reused"} where the last
+        three list sources / sections.
+        """
+        now = self._clock()
+        previous = self._load_state()
+        full = self._is_full_build(previous, now)
+        previous_sources = {} if full else previous.get("sources", {})
+        built_at = now if full else previous["built_at"]
+
+        # 1. Reuse inputs within their TTL, refetch the rest
+        expired = []
+        for source in SOURCES:
+            stored = previous_sources.get(source)
+            if stored and now - stored["fetched_at"] < self.ttls[source]:
+                self.session.state[SOURCE_SESSION_KEYS[source]] = stored["data"]
+            else:
+                expired.append(source)
+        if expired:
+            await ManagerAgent(self.session, mode="direct").gather_sources(expired)
+
+        # 2. Hash every input to find what changed since the last build
+        sources_state, changed = {}, []
+        for source in SOURCES:
+            key = SOURCE_SESSION_KEYS[source]
+            stored = previous_sources.get(source)
+            if source == "news" and source in expired and stored:
+                # The memory validator only returns stories not covered yet, so add them to the earlier ones
+                self.session.state[key] = merge_news(stored["data"], self.session.state.get(key))
+            data = self.session.state.get(key)
+            digest = content_hash(data)
+            sources_state[source] = {
+                "hash": digest,
+                "fetched_at": now if source in expired else stored["fetched_at"],
+                "data": data,
+            }
+            if stored is None or stored["hash"] != digest:
+                changed.append(source)
+
+        # 3. Rewrite only the sections fed by changed inputs
+        writer = SuperWriterAgent(self.session)
+        if full:
+            to_write = list(SCRIPT_SECTIONS)
+            sections = {}
+        else:
+            to_write = [section for section in SCRIPT_SECTIONS if SECTION_SOURCES.get(section) in changed]
+            sections = dict(previous["sections"])
+
+        if to_write:
+            try:
+                sections.update(await writer.generate_sections_async(to_write, previous_sections=sections or None))
+            except (ValueError, json.JSONDecodeError) as e:
+                # Without sections the next rebuild is a full one
+                self.logger.warning(f"Sectioned writing failed ({e}), generating the whole script")
+                script = await writer.generate_script_async()
+                self._save_state({"built_at": built_at, "profile_hash": self._profile_hash(),
+                                  "sources": sources_state, "sections": None, "script": script})
+                return {"script": script, "refetched": expired, "rewritten": list(SCRIPT_SECTIONS), "reused": []}
+
+        script = "\n\n".join(sections[section] for section in SCRIPT_SECTIONS if sections.get(section))
+        reused = [section for section in SCRIPT_SECTIONS if section not in to_write]
+        self._save_state({"built_at": built_at, "profile_hash": self._profile_hash(),
+                          "sources": sources_state, "sections": sections, "script": script})
+
+        print(f"Rebuilder: refetched {', '.join(expired) or 'nothing'}; "
+              f"rewrote {', '.join(to_write) or 'nothing'}; reused {', '.join(reused) or 'nothing'}.")
+        return {"script": script, "refetched": expired, "rewritten": to_write, "reused": reused}
+
+    def rebuild(self) -> dict:
+        """
+        Synchronous entry point for main.py.
+        """
+        async def _run():
+            try:
+                return await self.rebuild_async()
+            finally:
+                # The shared HTTP client is bound to this loop
+                await close_http_client()
+                await flush_memory_service()
+
+        return asyncio.run(_run())
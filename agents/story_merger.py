@@ -0,0 +1,70 @@
+# Merges duplicate stories gathered by different news queries
+import os
+
+from utils.minhash import LSHIndex, story_text
+
+# Estimated headline+summary similarity at which two items are the same story
+MERGE_SIMILARITY_THRESHOLD = float(os.getenv("MERGE_SIMILARITY_THRESHOLD", 0.5))
+
+
+def merge_news_data(news_data: list, similarity_threshold: float = MERGE_SIMILARITY_THRESHOLD) -> list:
+    """
+    Clusters duplicate items across all `news_data` entries ({"query", "result"}).
+    Items with the same id or near-identical text form one story; the item
+    with the richest summary is kept, with every query that found it attached:
+
+        [{"id", "headline", "summary", "source", "queries": [...]}, ...]
+
+    Stories keep the order in which they were first found.
+    """
+    items = []
+    queries = []
+    for entry in news_data or []:
+        if not isinstance(entry, dict) or not isinstance(entry.get("result"), list):
+            continue
+        for item in entry["result"]:
+            if isinstance(item, dict):
+                items.append(item)
+                queries.append(entry.get("query"))
+
+    # Union-find over item positions
+    parent = list(range(len(items)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def union(i, j):
+        root_i, root_j = find(i), find(j)
+        if root_i != root_j:
+            parent[max(root_i, root_j)] = min(root_i, root_j)
+
+    index = LSHIndex(threshold=similarity_threshold)
+    first_by_id = {}
+    for position, item in enumerate(items):
+        item_id = item.get('id')
+        if item_id:
+            if item_id in first_by_id:
+                union(position, first_by_id[item_id])
+            else:
+                first_by_id[item_id] = position
+
+        signature = index.signature_for(story_text(item))
+        for match, _ in index.query(signature):
+            union(position, int(match))
+        index.add(str(position), signature, 0)
+
+    clusters = {}
+    for position in range(len(items)):
+        clusters.setdefault(find(position), []).append(position)
+
+    merged = []
+    for root in sorted(clusters):
+        members = clusters[root]
+        canonical = max(members, key=lambda p: len(items[p].get('summary') or ""))
+        story = dict(items[canonical])
+        story["queries"] = list(dict.fromkeys(queries[p] for p in members if queries[p]))
+        merged.append(story)
+    return merged
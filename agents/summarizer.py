@@ -2,78 +2,233 @@
 from google.genai import types
 
 from google.adk.agents import LlmAgent
-from google.adk.models.google_llm import Gemini
 from google.adk.tools import google_search
-from utils.fetch_tools import retry_config
+from utils.fetch_tools import RateLimitedGemini, retry_config
 import requests
 import os
 from datetime import datetime, timedelta
 from agents.base import BaseAgent
+from agents.story_merger import merge_news_data
+from agents.payload_builder import build_writer_payload
 from utils.session import (
     KEY_USER_NAME, KEY_LOCATION, KEY_INTERESTS, 
-    KEY_NEWS_DATA, KEY_WEATHER_DATA, KEY_TRAFFIC_DATA
+    KEY_NEWS_DATA, KEY_WEATHER_DATA, KEY_TRAFFIC_DATA,
+    KEY_TONE, KEY_TIME_LIMIT, KEY_USER_ID
 )
 from google.adk.runners import InMemoryRunner
+from utils.cassette import get_cassette, llm_request
+from utils.llm import record_usage, release_session, run_agent
+from utils.runner_pool import get_runner_pool
+from utils.metrics import get_metrics
+from utils.text import SentenceBuffer
 import json
 
+# Script sections, in speaking order, and the session input each one is written from
+SCRIPT_SECTIONS = ("intro", "weather", "traffic", "news", "outro")
+SECTION_SOURCES = {"weather": "weather", "traffic": "traffic", "news": "news"}
+# Payload keys holding fetched data (the rest is the user's profile)
+SOURCE_KEYS = ("news", "weather", "traffic")
+
+
+def _event_text(event) -> str:
+    """Concatenated text parts of an event, skipping model thoughts."""
+    content = getattr(event, 'content', None)
+    parts = getattr(content, 'parts', None) or []
+    return "".join(part.text for part in parts if getattr(part, 'text', None) and not getattr(part, 'thought', False))
+
 class SuperWriterAgent(BaseAgent):
     def __init__(self, session):
         super().__init__(name="SuperWriter")
         self.session = session
 
-    def generate_script(self):
+    def _build_payload(self) -> dict:
         """
-        Reads all data from the session and generates the final script.
+        Reads all data from the session into the writer's input payload.
         """
         # 1. Gather Data from Session
         user_name = self.session.state.get(KEY_USER_NAME, "User")
         location = self.session.state.get(KEY_LOCATION, "Unknown")
         interests = self.session.state.get(KEY_INTERESTS, [])
+        tone = self.session.state.get(KEY_TONE)
         
         news_data = self.session.state.get(KEY_NEWS_DATA, [])
+        # Local news and interest queries often return the same story
+        merged_news = merge_news_data(news_data)
+        raw_count = sum(len(e.get("result", [])) for e in news_data if isinstance(e, dict) and isinstance(e.get("result"), list))
+        print(f"SuperWriter: Merged {raw_count} news items into {len(merged_news)} stories.")
+
         weather_data = self.session.state.get(KEY_WEATHER_DATA, {})
         traffic_data = self.session.state.get(KEY_TRAFFIC_DATA, {})
         
         # 2. Construct the Input Payload
-        payload = {
+        return {
             "user_name": user_name,
             "location": location,
             "interests": interests,
-            "news": news_data,
+            "tone": tone,
+            "news": merged_news,
             "weather": weather_data,
             "traffic": traffic_data
         }
+
+    def _writer_prompt(self, sources=None, request: str = "Generate the morning briefing script") -> str:
+        """
+        Builds the writer's user message from the budgeted payload.
+        `sources` limits the data to those inputs (news, weather, traffic).
+        """
+        payload = self._build_payload()
+        if sources is not None:
+            payload = {key: value for key, value in payload.items() if key not in SOURCE_KEYS or key in sources}
+        # Only send what fits the user's time limit
+        payload_str, report = build_writer_payload(
+            payload, time_limit=self.session.state.get(KEY_TIME_LIMIT)
+        )
+        print(f"SuperWriter: Payload ~{report['tokens_before']} -> ~{report['tokens_after']} tokens "
+              f"(budget {report['budget']}; {report['stories_kept']} stories kept, "
+              f"{report['stories_trimmed']} trimmed, {report['stories_dropped']} dropped).")
+        return f"Here is the collected data. {request}:\n\n{payload_str}"
+
+    async def generate_script_async(self) -> str:
+        """
+        Generates the final script on the current event loop.
+        Used by batch mode, where many users share one loop.
+        """
+        prompt = self._writer_prompt()
         
-        payload_str = json.dumps(payload, indent=2, default=str)
-        
-        # 3. Create the Agent
-        writer = self.create_writer_agent()
-        runner = InMemoryRunner(agent=writer)
+        # 3. Get the (pooled) Agent
+        runner = self._writer_runner()
         
         # 4. Run the Agent
         print("SuperWriter: Generating script...")
-        
+        return await self._run_writer(runner, prompt)
+
+    def _writer_runner(self, sections=None):
+        """The pooled writer runner; each sections variant has its own instruction."""
+        variant = tuple(sections) if sections else None
+        return get_runner_pool().get(
+            (self.name, variant), lambda: InMemoryRunner(agent=self.create_writer_agent(sections=sections))
+        )
+
+    async def _run_writer(self, runner, prompt: str) -> str:
+        events = await run_agent(runner, prompt, agent=self.name)
+        texts = []
+        for event in events:
+            if hasattr(event, 'content') and event.content:
+                parts = getattr(event.content, 'parts', [])
+                if parts:
+                    for part in parts:
+                        if hasattr(part, 'text'):
+                            texts.append(part.text)
+        return "\n".join(texts)
+
+    async def generate_sections_async(self, sections=SCRIPT_SECTIONS, previous_sections: dict | None = None) -> dict:
+        """
+        Writes only the requested script sections, returned as {section: text}.
+        The payload carries only the inputs those sections need; unchanged
+        `previous_sections` are passed along for continuity but not rewritten.
+        Raises ValueError if the model does not return the sections as JSON.
+        """
+        sources = [SECTION_SOURCES[section] for section in sections if section in SECTION_SOURCES]
+        request = f"Write these sections of the morning briefing script: {', '.join(sections)}"
+        prompt = self._writer_prompt(sources=sources, request=request)
+        if previous_sections:
+            kept = {name: text for name, text in previous_sections.items() if name not in sections}
+            prompt += ("\n\nThese sections stay as they are. Do not rewrite them, "
+                       f"but keep your transitions consistent with them:\n{json.dumps(kept)}")
+
+        runner = self._writer_runner(sections=sections)
+        print(f"SuperWriter: Writing sections {', '.join(sections)}...")
+        response_text = await self._run_writer(runner, prompt)
+
+        # Clean up markdown code blocks if present
+        clean_text = response_text.replace("```json", "").replace("```", "").strip()
+        start = clean_text.find("{")
+        end = clean_text.rfind("}")
+        if start == -1 or end == -1:
+            raise ValueError(f"Could not find JSON sections in response: {response_text[:100]}...")
+        written = json.loads(clean_text[start:end+1])
+        missing = [section for section in sections if not isinstance(written.get(section), str)]
+        if missing:
+            raise ValueError(f"Writer response is missing sections: {missing}")
+        return {section: written[section].strip() for section in sections}
+
+    async def stream_script(self):
+        """
+        Async iterator over the script, one sentence at a time, as the model
+        generates it. Lets stdout/TTS start before the whole script is done.
+        """
+        print("SuperWriter: Streaming script...")
+        buffer = SentenceBuffer()
+        streamed = False
+        events = self._stream_events(self._writer_prompt())
+        async for event in events:
+            text = _event_text(event)
+            if not text:
+                continue
+            if getattr(event, 'partial', False):
+                streamed = True
+            elif streamed:
+                # The final event repeats the full text of the partial chunks
+                continue
+            for sentence in buffer.feed(text):
+                yield sentence
+        for sentence in buffer.flush():
+            yield sentence
+
+    async def _stream_events(self, prompt: str):
+        """
+        Runs the writer with SSE streaming, yielding partial and final events.
+        With a cassette (CASSETTE_MODE) the stream is recorded or replayed.
+        """
+        runner = self._writer_runner()
+        cassette = get_cassette()
+        if cassette is None:
+            events = self._run_streaming(runner, prompt)
+        else:
+            events = cassette.stream("llm_stream", self.name, llm_request(runner, prompt, self.name),
+                                     lambda: self._run_streaming(runner, prompt))
+        with get_metrics().track(self.name, "llm_stream"):
+            async for event in events:
+                yield event
+
+    async def _run_streaming(self, runner, prompt: str):
+        """The live stream (replays never get here), counted as a model call with its token usage."""
+        from google.adk.agents.run_config import RunConfig, StreamingMode
+
+        get_metrics().inc("llm_calls_total", agent=self.name, help="LLM agent runs by agent.")
+        user_id = self.session.state.get(KEY_USER_ID) or "writer"
+        session = await runner.session_service.create_session(app_name=runner.app_name, user_id=user_id)
+        try:
+            # The model holds a rate limiter slot for the whole stream (RateLimitedGemini)
+            async for event in runner.run_async(
+                user_id=user_id,
+                session_id=session.id,
+                new_message=types.Content(role="user", parts=[types.Part(text=prompt)]),
+                run_config=RunConfig(streaming_mode=StreamingMode.SSE),
+            ):
+                record_usage(self.name, [event])
+                yield event
+        finally:
+            # The runner is pooled, its session service outlives this run
+            await release_session(runner, session.id, user_id)
+
+    def generate_script(self):
+        """
+        Reads all data from the session and generates the final script.
+        """
         import asyncio
-        
-        async def _run():
-            events = await runner.run_debug(f"Here is the collected data. Generate the morning briefing script:\n\n{payload_str}")
-            texts = []
-            for event in events:
-                if hasattr(event, 'content') and event.content:
-                    parts = getattr(event.content, 'parts', [])
-                    if parts:
-                        for part in parts:
-                            if hasattr(part, 'text'):
-                                texts.append(part.text)
-            return "\n".join(texts)
             
         try:
-            return asyncio.run(_run())
+            return asyncio.run(self.generate_script_async())
         except RuntimeError:
             loop = asyncio.get_event_loop()
-            return loop.run_until_complete(_run())
+            return loop.run_until_complete(self.generate_script_async())
 
-    def create_writer_agent(self) -> LlmAgent:
+    def create_writer_agent(self, sections=None) -> LlmAgent:
+        """
+        `sections` switches the output to a JSON object with one spoken text per
+        requested section (used by incremental rebuilds).
+        """
         # This System Prompt acts as the "Planner" and "Writer" combined
         instructions = """
         You are the Host and Executive Producer of a Daily Morning Podcast.
@@ -105,10 +260,16 @@ class SuperWriterAgent(BaseAgent):
         **OUTPUT:**
         Return ONLY the final script.
         """
+        if sections:
+            instructions = instructions.replace("Return ONLY the final script.", (
+                f"Return ONLY a JSON object with exactly these keys: {', '.join(sections)}. "
+                f"Each value is the spoken text of that section of the script ({', '.join(SCRIPT_SECTIONS)}, in this order). "
+                "Only the requested sections are written; they are spliced into the existing script."
+            ))
 
         return LlmAgent(
             name="SuperWriter",
-            model=Gemini(model="gemini-2.5-flash-lite"), # Use a smarter model (Pro) for the writing
+            model=RateLimitedGemini(model="gemini-2.5-flash-lite", retry_options=retry_config, agent_name="SuperWriter"), # Use a smarter model (Pro) for the writing
             instruction=instructions,
             # No tools needed - it just processes the text input it receives
         )
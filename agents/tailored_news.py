@@ -1,16 +1,26 @@
 from agents.base import BaseAgent
+from agents import news_core
 from agents.news_core import NewsAgent
 import asyncio
 
 class TailoredNewsAgent(BaseAgent):
-    def __init__(self):
+    def __init__(self, user_id=None):
         super().__init__(name="TailoredNewsAgent")
+        self.user_id = user_id
 
     async def get_news_for_interests(self, interests: list[str]) -> dict:
         """
         Fetches news for a list of interests.
         Returns a dictionary where keys are interests and values are the list of validated news items.
         """
+        # Several interests per LLM run, unless batching is off (NEWS_BATCH_MAX_SIZE=1)
+        if len(interests) > 1 and news_core.NEWS_BATCH_MAX_SIZE > 1:
+            print(f"[{self.name}] Fetching news for interests: {', '.join(interests)}...")
+            agent = NewsAgent(user_id=self.user_id)
+            return await agent.fetch_and_validate_news_batch(
+                {interest: self._interest_query(interest) for interest in interests}
+            )
+
         results = {}
         
         # We can run these in parallel for better performance
@@ -29,12 +39,19 @@ class TailoredNewsAgent(BaseAgent):
     async def _fetch_single_interest(self, interest: str):
         """
         Helper to run the NewsAgent for a single topic.
+        Users sharing an interest build the same query, so their concurrent
+        fetches are coalesced by the NewsAgent.
         """
         print(f"[{self.name}] Fetching news for interest: {interest}...")
         
-        agent = NewsAgent()
+        agent = NewsAgent(user_id=self.user_id)
         # Use the new validated fetch method
         # We ask specifically for news about the interest
-        news_items = await agent.fetch_and_validate_news(f"Find the top 3 most important news stories specifically about: {interest}")
+        news_items = await agent.fetch_and_validate_news(self._interest_query(interest))
         
         return news_items
+
+    @staticmethod
+    def _interest_query(interest: str) -> str:
+        # The same query in single and batched runs, so both share the news cache
+        return f"Find the top 3 most important news stories specifically about: {interest}"
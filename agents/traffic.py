@@ -2,52 +2,199 @@
 from google.genai import types
 
 from google.adk.agents import LlmAgent
-from google.adk.models.google_llm import Gemini
 from google.adk.tools import google_search
-from utils.fetch_tools import retry_config
-import requests
+from utils.fetch_tools import RateLimitedGemini, retry_config, fetch_json, fetch_json_sync
+import asyncio
 import os
+import re
+import threading
+import time
 from datetime import datetime
 from typing import Dict, Any
 
 from pathlib import Path
 from agents.base import BaseAgent# (Optional) Traffic report based on location
+from utils.cache import KeyedLocks, TTLCache
+from utils.singleflight import SingleFlight
+
+DIRECTIONS_API_URL = os.getenv("DIRECTIONS_API_URL", "https://maps.googleapis.com/maps/api/directions/json")
+
+# Departure times are bucketed: commutes sharing origin/destination within
+# the same bucket reuse one Directions API result.
+TRAFFIC_BUCKET_SECONDS = int(os.getenv("TRAFFIC_BUCKET_SECONDS", 300))
+# After its bucket ends, a result is still served for this long while a
+# background refresh fetches the new bucket (stale-while-revalidate).
+TRAFFIC_STALE_SECONDS = int(os.getenv("TRAFFIC_STALE_SECONDS", 300))
+TRAFFIC_CACHE_MAX_ENTRIES = int(os.getenv("TRAFFIC_CACHE_MAX_ENTRIES", 4096))
+
+# Process-wide: normalized route -> {"bucket": int, "data": traffic facts}
+_traffic_cache = TTLCache(max_entries=TRAFFIC_CACHE_MAX_ENTRIES, name="traffic")
+_route_locks = KeyedLocks()
+_route_flight = SingleFlight()
+_revalidating: set[str] = set()
+_revalidating_guard = threading.Lock()
+_background_tasks: set = set()
+
+
+def normalize_place(place: str) -> str:
+    """Case-, whitespace- and comma-spacing-insensitive form of an address."""
+    place = re.sub(r"\s*,\s*", ", ", place.strip().lower())
+    return " ".join(place.split())
+
 
 class TrafficAgent(BaseAgent):
-    def __init__(self):
+    def __init__(self, cache: TTLCache | None = None,
+                 bucket_seconds: int = TRAFFIC_BUCKET_SECONDS,
+                 stale_seconds: int = TRAFFIC_STALE_SECONDS, clock=time.time):
         super().__init__(name="TrafficAgent")
         self.api_key = os.getenv("DIRECTIONS_API_KEY")
+        self.cache = cache if cache is not None else _traffic_cache
+        self.bucket_seconds = bucket_seconds
+        self.stale_seconds = stale_seconds
+        self._clock = clock
+
+    def _departure_bucket(self, now: float) -> int:
+        return int(now // self.bucket_seconds)
 
     def get_traffic_data(self, origin: str, destination: str) -> Dict[str, Any]:
         """
         Fetches raw traffic statistics. Does NOT write a summary.
+        Results are shared per route and departure-time bucket; a result from
+        the previous bucket is returned immediately and refreshed in the background.
         """
-        url = (
-            "https://maps.googleapis.com/maps/api/directions/json"
-            f"?origin={origin}&destination={destination}&departure_time=now&key={self.api_key}"
-        )
+        route_key = f"{normalize_place(origin)}|{normalize_place(destination)}"
+        bucket = self._departure_bucket(self._clock())
+
+        entry = self.cache.get(route_key)
+        if entry is None:
+            # Concurrent misses for the same route wait for a single fetch
+            with _route_locks(route_key):
+                entry = self.cache.get(route_key)
+                if entry is None:
+                    return dict(self._fetch_and_store(route_key, origin, destination))
+
+        if entry["bucket"] != bucket:
+            self._revalidate_in_background(route_key, origin, destination)
+        return dict(entry["data"])
+
+    async def get_traffic_data_async(self, origin: str, destination: str) -> Dict[str, Any]:
+        """
+        Async variant of `get_traffic_data` using the shared HTTP client.
+        """
+        route_key = f"{normalize_place(origin)}|{normalize_place(destination)}"
+        bucket = self._departure_bucket(self._clock())
+
+        entry = self.cache.get(route_key)
+        if entry is None:
+            data = await _route_flight.do(
+                route_key, lambda: self._fetch_and_store_async(route_key, origin, destination)
+            )
+            return dict(data)
+
+        if entry["bucket"] != bucket:
+            self._revalidate_async(route_key, origin, destination)
+        return dict(entry["data"])
+
+    def _store(self, route_key: str, data: Dict[str, Any], fetched_at: float):
+        # Errors are not cached, the next caller retries
+        if "error" in data:
+            return
+        bucket = self._departure_bucket(fetched_at)
+        bucket_end = (bucket + 1) * self.bucket_seconds
+        ttl = bucket_end - fetched_at + self.stale_seconds
+        self.cache.set(route_key, {"bucket": bucket, "data": data}, ttl_seconds=ttl)
+
+    def _fetch_and_store(self, route_key: str, origin: str, destination: str) -> Dict[str, Any]:
+        fetched_at = self._clock()
+        data = self._fetch_traffic(origin, destination)
+        self._store(route_key, data, fetched_at)
+        return data
+
+    async def _fetch_and_store_async(self, route_key: str, origin: str, destination: str) -> Dict[str, Any]:
+        fetched_at = self._clock()
+        data = await self._fetch_traffic_async(origin, destination)
+        self._store(route_key, data, fetched_at)
+        return data
 
+    def _start_revalidation(self, route_key: str) -> bool:
+        """Marks the route as refreshing; False if a refresh is already running."""
+        with _revalidating_guard:
+            if route_key in _revalidating:
+                return False
+            _revalidating.add(route_key)
+            return True
+
+    def _finish_revalidation(self, route_key: str):
+        with _revalidating_guard:
+            _revalidating.discard(route_key)
+
+    def _revalidate_in_background(self, route_key: str, origin: str, destination: str):
+        if not self._start_revalidation(route_key):
+            return
+
+        def _refresh():
+            try:
+                self._fetch_and_store(route_key, origin, destination)
+            finally:
+                self._finish_revalidation(route_key)
+
+        threading.Thread(target=_refresh, name=f"traffic-refresh-{route_key}", daemon=True).start()
+
+    def _revalidate_async(self, route_key: str, origin: str, destination: str):
+        if not self._start_revalidation(route_key):
+            return
+
+        async def _refresh():
+            try:
+                await self._fetch_and_store_async(route_key, origin, destination)
+            finally:
+                self._finish_revalidation(route_key)
+
+        # Keep a reference so the task isn't garbage collected mid-flight
+        task = asyncio.get_running_loop().create_task(_refresh())
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+
+    def _directions_request(self, origin: str, destination: str) -> tuple:
+        params = {
+            "origin": origin,
+            "destination": destination,
+            "departure_time": "now",
+            "key": self.api_key,
+        }
+        return DIRECTIONS_API_URL, params
+
+    def _parse_directions(self, data: dict) -> Dict[str, Any]:
+        route = data["routes"][0]
+        leg = route["legs"][0]
+
+        # We return a dictionary of FACTS
+        return {
+            "type": "traffic",
+            "route_summary": route.get("summary", "main route"),
+            "duration_in_traffic_text": leg["duration_in_traffic"]["text"],
+            "duration_in_traffic_value": leg["duration_in_traffic"]["value"], # Seconds
+            "normal_duration_text": leg["duration"]["text"],
+            "normal_duration_value": leg["duration"]["value"], # Seconds
+            "start_address": leg["start_address"],
+            "end_address": leg["end_address"],
+            "has_delay": leg["duration_in_traffic"]["value"] > leg["duration"]["value"]
+        }
+
+    def _fetch_traffic(self, origin: str, destination: str) -> Dict[str, Any]:
+        """
+        Calls the Directions API for a departure time of now.
+        """
         try:
-            res = requests.get(url)
-            res.raise_for_status()
-            data = res.json()
-
-            route = data["routes"][0]
-            leg = route["legs"][0]
-
-            # We return a dictionary of FACTS
-            return {
-                "type": "traffic",
-                "route_summary": route.get("summary", "main route"),
-                "duration_in_traffic_text": leg["duration_in_traffic"]["text"],
-                "duration_in_traffic_value": leg["duration_in_traffic"]["value"], # Seconds
-                "normal_duration_text": leg["duration"]["text"],
-                "normal_duration_value": leg["duration"]["value"], # Seconds
-                "start_address": leg["start_address"],
-                "end_address": leg["end_address"],
-                "has_delay": leg["duration_in_traffic"]["value"] > leg["duration"]["value"]
-            }
+            url, params = self._directions_request(origin, destination)
+            return self._parse_directions(fetch_json_sync(url, params, agent=self.name))
+        except Exception as e:
+            return {"error": str(e)}
 
+    async def _fetch_traffic_async(self, origin: str, destination: str) -> Dict[str, Any]:
+        try:
+            url, params = self._directions_request(origin, destination)
+            return self._parse_directions(await fetch_json(url, params, agent=self.name))
         except Exception as e:
             return {"error": str(e)}
 
@@ -61,7 +208,7 @@ class TrafficAgent(BaseAgent):
         
         return LlmAgent(
             name="TrafficAgent",
-            model=Gemini(model="gemini-2.5-flash-lite"),
+            model=RateLimitedGemini(model="gemini-2.5-flash-lite", retry_options=retry_config, agent_name="TrafficAgent"),
             instruction=instructions,
             tools=[self.get_traffic_data], 
         )
\ No newline at end of file
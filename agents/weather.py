@@ -2,143 +2,457 @@
 from google.genai import types
 
 from google.adk.agents import LlmAgent
-from google.adk.models.google_llm import Gemini
 from google.adk.tools import google_search
-from utils.fetch_tools import retry_config
-import requests
+from utils.fetch_tools import RateLimitedGemini, retry_config, fetch_json, fetch_json_sync
+import asyncio
+import calendar
 import os
+import copy
+import numpy as np
 from datetime import datetime, timedelta
 from agents.base import BaseAgent
+from utils.cache import KeyedLocks, TTLCache
+from utils.singleflight import SingleFlight
 
-class WeatherAgent(BaseAgent):
-    def __init__(self):
-        super().__init__(name="WeatherAgent")
-        self.api_key = os.getenv("WEATHER_API_KEY")
+WEATHER_API_BASE_URL = os.getenv("WEATHER_API_BASE_URL", "https://weather.googleapis.com/v1")
 
-    def get_weather_insights(self, latitude: float, longitude: float, unit: str = "metric"):
-        api_key = os.getenv("WEATHER_API_KEY")
+# Users are bucketed into grid cells by rounding coordinates to this many
+# decimal places (2 -> ~1.1 km cells). Everyone in a cell shares one forecast.
+WEATHER_GRID_PRECISION = int(os.getenv("WEATHER_GRID_PRECISION", 2))
+WEATHER_CACHE_MAX_ENTRIES = int(os.getenv("WEATHER_CACHE_MAX_ENTRIES", 4096))
+
+# Process-wide: grid cell -> raw daily/hourly payloads + computed insights
+_forecast_cache = TTLCache(max_entries=WEATHER_CACHE_MAX_ENTRIES, name="weather_forecast")
+_cell_locks = KeyedLocks()
+_cell_flight = SingleFlight()
+
+
+def grid_cell(latitude: float, longitude: float, precision: int = WEATHER_GRID_PRECISION) -> tuple:
+    """Snaps coordinates to the grid point that identifies their cell."""
+    return (round(latitude, precision), round(longitude, precision))
+
+
+def seconds_until_next_hour(now: datetime | None = None) -> float:
+    """
+    The forecast API publishes hourly, so cached forecasts expire at the top of the hour.
+    """
+    now = now or datetime.now()
+    next_hour = now.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+    return (next_hour - now).total_seconds()
+
+
+def _daily_summary(daily_data: dict) -> dict:
+    today = daily_data.get("forecastDays", [{}])[0]
+    day_forecast = today.get("daytimeForecast", {})
+    night_forecast = today.get("nighttimeForecast", {})
+    
+    return {
+        "day_condition": day_forecast.get("weatherCondition", {}).get("description", {}).get("text", "Unknown"),
+        "night_condition": night_forecast.get("weatherCondition", {}).get("description", {}).get("text", "Unknown"),
+        "temp_max": today.get("maxTemperature", {}).get("degrees", "N/A"),
+        "temp_min": today.get("minTemperature", {}).get("degrees", "N/A"),
+        "uv_index": day_forecast.get("uvIndex", 0)
+    }
+
+
+def compute_weather_insights(daily_data: dict, hourly_data: dict) -> dict:
+    """
+    Turns the raw daily/hourly forecast payloads into the insights dict.
+    """
+    result = {
+        "max_uv_time": None,
+        "max_uv_value": 0, 
+        "max_temp_time": None,
+        "max_temp_value": float("-inf"),
+        # Added "peak_time" to the structure
+        "rain_window": {"start": None, "end": None, "peak_chance": 0, "peak_time": None},
+        "daily_summary": {}
+    }
+
+    result["daily_summary"] = _daily_summary(daily_data)
+
+    peak_uv = -1
+    peak_temp = float("-inf")
+    rain_times = []
+    rain_threshold = 30 
+
+    # NEW: Track absolute peak regardless of threshold
+    absolute_peak_rain = 0
+    absolute_peak_rain_time = None
+
+    for hour in hourly_data.get("forecastHours", []):
+        time_str = hour.get("interval", {}).get("startTime")
+        if not time_str:
+            continue
         
-        units_param = "METRIC" if unit.lower() == "metric" else "IMPERIAL"
+        try:
+            time_obj = datetime.strptime(time_str, "%Y-%m-%dT%H:%M:%SZ")
+            time_local = time_obj.strftime("%H:%M")
+        except ValueError:
+            continue
 
-        daily_url = (
-            f"https://weather.googleapis.com/v1/forecast/days:lookup"
-            f"?key={api_key}&location.latitude={latitude}&location.longitude={longitude}"
-            f"&days=1&unitsSystem={units_param}"
-        )
+        uv = hour.get("uvIndex", 0)
+        temp = hour.get("temperature", {}).get("degrees", 0)
+        rain_chance = hour.get("precipitation", {}).get("probability", {}).get("percent", 0)
 
-        hourly_url = (
-            f"https://weather.googleapis.com/v1/forecast/hours:lookup"
-            f"?key={api_key}&location.latitude={latitude}&location.longitude={longitude}"
-            f"&hours=24&unitsSystem={units_param}"
-        )
+        # 1. Update Absolute Peak Rain (Global Tracker)
+        if rain_chance > absolute_peak_rain:
+            absolute_peak_rain = rain_chance
+            absolute_peak_rain_time = time_local
 
-        daily_response = requests.get(daily_url)
-        hourly_response = requests.get(hourly_url)
+        # 2. Update Max UV
+        if uv > peak_uv:
+            peak_uv = uv
+            result["max_uv_time"] = time_local
+            result["max_uv_value"] = uv
 
-        daily_response.raise_for_status()
-        daily_data = daily_response.json()
+        # 3. Update Max Temp
+        if temp > peak_temp:
+            peak_temp = temp
+            result["max_temp_time"] = time_local
+            result["max_temp_value"] = temp
+
+        # 4. Collect Rain Window Candidates
+        if rain_chance >= rain_threshold:
+            rain_times.append((time_obj, rain_chance))
+
+    # Determine rain window
+    if rain_times:
+        rain_times.sort(key=lambda x: x[0])
+        
+        start_time = rain_times[0][0].strftime("%H:%M")
+        end_time = rain_times[-1][0].strftime("%H:%M")
         
-        hourly_response.raise_for_status()
-        hourly_data = hourly_response.json()
+        # Find the max tuple inside the window to get the specific time
+        peak_tuple = max(rain_times, key=lambda x: x[1])
+        peak_val = peak_tuple[1]
+        peak_time_str = peak_tuple[0].strftime("%H:%M")
+        
+        result["rain_window"] = {
+            "start": start_time,
+            "end": end_time,
+            "peak_chance": round(peak_val, 2),
+            "peak_time": peak_time_str # Added
+        }
+    else:
+        # Even if threshold wasn't met, show the highest chance found
+        result["rain_window"] = {
+            "start": None,
+            "end": None,
+            "peak_chance": absolute_peak_rain,
+            "peak_time": absolute_peak_rain_time # Added
+        }
+
+    return result
+
+
+def compute_weather_insights_batch(daily_payloads: list, hourly_payloads: list) -> list:
+    """
+    Vectorized `compute_weather_insights` for many locations at once.
+    Returns one insights dict per location, identical to the per-location result.
+    Raises ValueError if any location has a missing (None) or non-numeric reading.
+    """
+    n_locations = len(hourly_payloads)
+    if n_locations == 0:
+        return []
+
+    # 1. Flatten every valid hour. Locations share the same forecast hours,
+    # so each distinct timestamp is parsed only once.
+    parsed_times = {}
+    rows, cols = [], []
+    uvs, temps, rains, epochs, labels = [], [], [], [], []
+    counts = [0] * n_locations
+
+    for row, hourly_data in enumerate(hourly_payloads):
+        for hour in hourly_data.get("forecastHours", []):
+            time_str = hour.get("interval", {}).get("startTime")
+            if not time_str:
+                continue
+
+            if time_str not in parsed_times:
+                try:
+                    time_obj = datetime.strptime(time_str, "%Y-%m-%dT%H:%M:%SZ")
+                    parsed_times[time_str] = (int(calendar.timegm(time_obj.timetuple())), time_obj.strftime("%H:%M"))
+                except ValueError:
+                    parsed_times[time_str] = None
+            parsed = parsed_times[time_str]
+            if parsed is None:
+                continue
+
+            rows.append(row)
+            cols.append(counts[row])
+            counts[row] += 1
+            uvs.append(hour.get("uvIndex", 0))
+            temps.append(hour.get("temperature", {}).get("degrees", 0))
+            rains.append(hour.get("precipitation", {}).get("probability", {}).get("percent", 0))
+            epochs.append(parsed[0])
+            labels.append(parsed[1])
+
+    # 2. Scatter into padded (locations x hours) matrices
+    width = max(max(counts), 1)
+    rows_arr = np.asarray(rows, dtype=np.int64)
+    cols_arr = np.asarray(cols, dtype=np.int64)
+    flat_index = np.full((n_locations, width), -1, dtype=np.int64)
+    flat_index[rows_arr, cols_arr] = np.arange(len(rows), dtype=np.int64)
+    valid = flat_index >= 0
+
+    def _matrix(values, fill):
+        values = np.asarray(values, dtype=np.float64)
+        if np.isnan(values).any():
+            # A None reading would become NaN here, where the per-location scan raises
+            raise ValueError("Forecast has a missing or non-numeric hourly value")
+        matrix = np.full((n_locations, width), fill, dtype=np.float64)
+        matrix[rows_arr, cols_arr] = values
+        return matrix
+
+    uv = _matrix(uvs, -np.inf)
+    temp = _matrix(temps, -np.inf)
+    rain = _matrix(rains, -np.inf)
+    epoch = _matrix(epochs, np.inf)
+    all_rows = np.arange(n_locations)
+
+    # 3. Peaks: argmax returns the first maximum, like the strict ">" scan
+    uv_idx = np.argmax(uv, axis=1)
+    has_uv = uv[all_rows, uv_idx] > -1
+    temp_idx = np.argmax(temp, axis=1)
+    has_temp = temp[all_rows, temp_idx] > -np.inf
+    rain_idx = np.argmax(rain, axis=1)
+    has_rain = rain[all_rows, rain_idx] > 0
+
+    # 4. Rain window: hours at/above the threshold, ordered by time
+    in_window = valid & (rain >= 30)
+    has_window = in_window.any(axis=1)
+    start_idx = np.argmin(np.where(in_window, epoch, np.inf), axis=1)
+    end_idx = np.argmax(np.where(in_window, epoch, -np.inf), axis=1)
+    window_peak = np.where(in_window, rain, -np.inf).max(axis=1, keepdims=True)
+    # Earliest hour holding the window's peak chance
+    is_peak = in_window & (rain == window_peak)
+    peak_idx = np.argmin(np.where(is_peak, epoch, np.inf), axis=1)
+
+    # 5. Build the dicts from the original values (keeps ints as ints)
+    results = []
+    for row in range(n_locations):
+        def _hour(col):
+            return flat_index[row, col]
 
         result = {
             "max_uv_time": None,
-            "max_uv_value": 0, 
+            "max_uv_value": 0,
             "max_temp_time": None,
             "max_temp_value": float("-inf"),
-            # Added "peak_time" to the structure
             "rain_window": {"start": None, "end": None, "peak_chance": 0, "peak_time": None},
-            "daily_summary": {}
+            "daily_summary": _daily_summary(daily_payloads[row]),
         }
 
-        today = daily_data.get("forecastDays", [{}])[0]
-        day_forecast = today.get("daytimeForecast", {})
-        night_forecast = today.get("nighttimeForecast", {})
+        if has_uv[row]:
+            i = _hour(uv_idx[row])
+            result["max_uv_time"] = labels[i]
+            result["max_uv_value"] = uvs[i]
+
+        if has_temp[row]:
+            i = _hour(temp_idx[row])
+            result["max_temp_time"] = labels[i]
+            result["max_temp_value"] = temps[i]
+
+        if has_window[row]:
+            peak = _hour(peak_idx[row])
+            result["rain_window"] = {
+                "start": labels[_hour(start_idx[row])],
+                "end": labels[_hour(end_idx[row])],
+                "peak_chance": round(rains[peak], 2),
+                "peak_time": labels[peak]
+            }
+        elif has_rain[row]:
+            i = _hour(rain_idx[row])
+            result["rain_window"]["peak_chance"] = rains[i]
+            result["rain_window"]["peak_time"] = labels[i]
+
+        results.append(result)
+
+    return results
+
+
+async def _wait_for(future):
+    return await future
+
+
+class WeatherAgent(BaseAgent):
+    def __init__(self, cache: TTLCache | None = None, grid_precision: int = WEATHER_GRID_PRECISION):
+        super().__init__(name="WeatherAgent")
+        self.api_key = os.getenv("WEATHER_API_KEY")
+        self.cache = cache if cache is not None else _forecast_cache
+        self.grid_precision = grid_precision
+
+    def _forecast_requests(self, latitude: float, longitude: float, unit: str = "metric") -> tuple:
+        """
+        Builds the (url, params) pairs for the daily and hourly forecast endpoints.
+        """
+        api_key = os.getenv("WEATHER_API_KEY")
         
-        result["daily_summary"] = {
-            "day_condition": day_forecast.get("weatherCondition", {}).get("description", {}).get("text", "Unknown"),
-            "night_condition": night_forecast.get("weatherCondition", {}).get("description", {}).get("text", "Unknown"),
-            "temp_max": today.get("maxTemperature", {}).get("degrees", "N/A"),
-            "temp_min": today.get("minTemperature", {}).get("degrees", "N/A"),
-            "uv_index": day_forecast.get("uvIndex", 0)
+        units_param = "METRIC" if unit.lower() == "metric" else "IMPERIAL"
+        location = {
+            "key": api_key,
+            "location.latitude": latitude,
+            "location.longitude": longitude,
+            "unitsSystem": units_param,
         }
 
-        peak_uv = -1
-        peak_temp = float("-inf")
-        rain_times = []
-        rain_threshold = 30 
+        daily = (f"{WEATHER_API_BASE_URL}/forecast/days:lookup", {**location, "days": 1})
+        hourly = (f"{WEATHER_API_BASE_URL}/forecast/hours:lookup", {**location, "hours": 24})
+        return daily, hourly
 
-        # NEW: Track absolute peak regardless of threshold
-        absolute_peak_rain = 0
-        absolute_peak_rain_time = None
+    def _fetch_forecast(self, latitude: float, longitude: float, unit: str = "metric") -> tuple:
+        """
+        Fetches the raw daily and hourly forecast payloads.
+        """
+        (daily_url, daily_params), (hourly_url, hourly_params) = self._forecast_requests(latitude, longitude, unit)
+
+        daily_data = fetch_json_sync(daily_url, daily_params, agent=self.name)
+        hourly_data = fetch_json_sync(hourly_url, hourly_params, agent=self.name)
+        return daily_data, hourly_data
+
+    async def _fetch_forecast_async(self, latitude: float, longitude: float, unit: str = "metric") -> tuple:
+        """
+        Fetches the daily and hourly forecast payloads concurrently.
+        """
+        (daily_url, daily_params), (hourly_url, hourly_params) = self._forecast_requests(latitude, longitude, unit)
+
+        daily_data, hourly_data = await asyncio.gather(
+            fetch_json(daily_url, daily_params, agent=self.name),
+            fetch_json(hourly_url, hourly_params, agent=self.name),
+        )
+        return daily_data, hourly_data
+
+    def _cell_key(self, latitude: float, longitude: float, unit: str) -> tuple:
+        lat, lon = grid_cell(latitude, longitude, self.grid_precision)
+        return lat, lon, f"{lat},{lon}|{unit.lower()}"
+
+    def _store_forecast(self, cache_key: str, daily_data: dict, hourly_data: dict) -> dict:
+        entry = {
+            "daily": daily_data,
+            "hourly": hourly_data,
+            "insights": compute_weather_insights(daily_data, hourly_data),
+        }
+        self.cache.set(cache_key, entry, ttl_seconds=seconds_until_next_hour())
+        return entry
+
+    def get_weather_insights(self, latitude: float, longitude: float, unit: str = "metric"):
+        """
+        Returns weather insights for the grid cell containing the coordinates.
+        Nearby users share one cached fetch until the next forecast hour.
+        """
+        lat, lon, cache_key = self._cell_key(latitude, longitude, unit)
+
+        # One fetch per cell, even when many users in it ask at the same time
+        with _cell_locks(cache_key):
+            entry = self.cache.get(cache_key)
+            if entry is None:
+                daily_data, hourly_data = self._fetch_forecast(lat, lon, unit)
+                entry = self._store_forecast(cache_key, daily_data, hourly_data)
+
+        # Callers get their own copy, the cached dict is shared
+        return copy.deepcopy(entry["insights"])
+
+    async def get_weather_insights_async(self, latitude: float, longitude: float, unit: str = "metric"):
+        """
+        Async variant of `get_weather_insights` using the shared HTTP client.
+        """
+        lat, lon, cache_key = self._cell_key(latitude, longitude, unit)
+
+        entry = self.cache.get(cache_key)
+        if entry is None:
+            async def _fetch_and_store():
+                daily_data, hourly_data = await self._fetch_forecast_async(lat, lon, unit)
+                return self._store_forecast(cache_key, daily_data, hourly_data)
+
+            entry = await _cell_flight.do(cache_key, _fetch_and_store)
+
+        return copy.deepcopy(entry["insights"])
+
+    async def get_weather_insights_batch_async(self, locations: list, unit: str = "metric") -> list:
+        """
+        Returns insights for many (latitude, longitude) pairs, in order.
+        Uncached cells are fetched concurrently and their insights computed
+        in a single vectorized pass. Cells already being fetched (by another
+        batch or `get_weather_insights_async`) are joined, not fetched again.
+        A cell whose fetch failed, or whose forecast could not be turned into
+        insights, gets {"error": "..."} and the others are still returned.
+        """
+        cells = [self._cell_key(lat, lon, unit) for lat, lon in locations]
+
+        entries = {}
+        missing = {}
+        for lat, lon, cache_key in cells:
+            entry = self.cache.get(cache_key)
+            if entry is not None:
+                entries[cache_key] = entry
+            else:
+                missing[cache_key] = (lat, lon)
+
+        if missing:
+            # Claim the cells nobody is fetching yet; their flights wait for this batch
+            loop = asyncio.get_running_loop()
+            owned = {}
+            flights = {}
+            for cache_key in missing:
+                if not _cell_flight.in_flight(cache_key):
+                    owned[cache_key] = loop.create_future()
+                flights[cache_key] = _cell_flight.start(cache_key, lambda f=owned.get(cache_key): _wait_for(f))
 
-        for hour in hourly_data.get("forecastHours", []):
-            time_str = hour.get("interval", {}).get("startTime")
-            if not time_str:
-                continue
-            
             try:
-                time_obj = datetime.strptime(time_str, "%Y-%m-%dT%H:%M:%SZ")
-                time_local = time_obj.strftime("%H:%M")
-            except ValueError:
-                continue
+                await self._fetch_cells(owned, {key: missing[key] for key in owned}, unit)
+            finally:
+                # Cancelled midway: release anyone waiting on the cells this batch claimed
+                for future in owned.values():
+                    if not future.done():
+                        future.cancel()
 
-            uv = hour.get("uvIndex", 0)
-            temp = hour.get("temperature", {}).get("degrees", 0)
-            rain_chance = hour.get("precipitation", {}).get("probability", {}).get("percent", 0)
-
-            # 1. Update Absolute Peak Rain (Global Tracker)
-            if rain_chance > absolute_peak_rain:
-                absolute_peak_rain = rain_chance
-                absolute_peak_rain_time = time_local
-
-            # 2. Update Max UV
-            if uv > peak_uv:
-                peak_uv = uv
-                result["max_uv_time"] = time_local
-                result["max_uv_value"] = uv
-
-            # 3. Update Max Temp
-            if temp > peak_temp:
-                peak_temp = temp
-                result["max_temp_time"] = time_local
-                result["max_temp_value"] = temp
-
-            # 4. Collect Rain Window Candidates
-            if rain_chance >= rain_threshold:
-                rain_times.append((time_obj, rain_chance))
-
-        # Determine rain window
-        if rain_times:
-            rain_times.sort(key=lambda x: x[0])
-            
-            start_time = rain_times[0][0].strftime("%H:%M")
-            end_time = rain_times[-1][0].strftime("%H:%M")
-            
-            # Find the max tuple inside the window to get the specific time
-            peak_tuple = max(rain_times, key=lambda x: x[1])
-            peak_val = peak_tuple[1]
-            peak_time_str = peak_tuple[0].strftime("%H:%M")
-            
-            result["rain_window"] = {
-                "start": start_time,
-                "end": end_time,
-                "peak_chance": round(peak_val, 2),
-                "peak_time": peak_time_str # Added
-            }
-        else:
-            # Even if threshold wasn't met, show the highest chance found
-            result["rain_window"] = {
-                "start": None,
-                "end": None,
-                "peak_chance": absolute_peak_rain,
-                "peak_time": absolute_peak_rain_time # Added
-            }
+            results = await asyncio.gather(*(asyncio.shield(flights[key]) for key in missing), return_exceptions=True)
+            for cache_key, result in zip(missing, results):
+                if isinstance(result, BaseException):
+                    self.logger.error(f"Weather fetch failed for cell {cache_key}: {result}")
+                    entries[cache_key] = {"insights": {"error": str(result)}}
+                else:
+                    entries[cache_key] = result
 
-        return result
+        return [copy.deepcopy(entries[cache_key]["insights"]) for _, _, cache_key in cells]
+
+    async def _fetch_cells(self, futures: dict, cells: dict, unit: str):
+        """Fetches `cells` ({cache_key: (lat, lon)}) and resolves each cell's future with its entry or error."""
+        payloads = await asyncio.gather(
+            *(self._fetch_forecast_async(lat, lon, unit) for lat, lon in cells.values()), return_exceptions=True
+        )
+        fetched = []
+        for cache_key, payload in zip(cells, payloads):
+            if isinstance(payload, BaseException):
+                futures[cache_key].set_exception(payload)
+            else:
+                fetched.append((cache_key, payload))
+
+        try:
+            insights = compute_weather_insights_batch([daily for _, (daily, _) in fetched],
+                                                      [hourly for _, (_, hourly) in fetched])
+        except Exception as e:
+            # A malformed payload fails the whole vectorized pass; only its own cell should fail
+            self.logger.warning(f"Batch weather insights failed ({e}), computing each cell separately")
+            insights = [self._cell_insights(daily_data, hourly_data) for _, (daily_data, hourly_data) in fetched]
+        ttl = seconds_until_next_hour()
+        for (cache_key, (daily_data, hourly_data)), cell_insights in zip(fetched, insights):
+            if isinstance(cell_insights, Exception):
+                futures[cache_key].set_exception(cell_insights)
+                continue
+            entry = {"daily": daily_data, "hourly": hourly_data, "insights": cell_insights}
+            self.cache.set(cache_key, entry, ttl_seconds=ttl)
+            futures[cache_key].set_result(entry)
+
+    @staticmethod
+    def _cell_insights(daily_data: dict, hourly_data: dict):
+        """`compute_weather_insights`, returning the exception instead of raising it."""
+        try:
+            return compute_weather_insights(daily_data, hourly_data)
+        except Exception as e:
+            return e
 
-       
-    
     def create_weather_agent(self) -> LlmAgent:
             # Changed instructions to force Tool usage over Google Search
             instructions = """
@@ -150,7 +464,7 @@ class WeatherAgent(BaseAgent):
             
             return LlmAgent(
                 name="WeatherAgent",
-                model=Gemini(model="gemini-2.5-flash-lite"),
+                model=RateLimitedGemini(model="gemini-2.5-flash-lite", retry_options=retry_config, agent_name="WeatherAgent"),
                 instruction=instructions,
                 tools=[self.get_weather_insights], # Explicitly use your custom tool
             )
\ No newline at end of file
@@ -0,0 +1 @@
+# Offline benchmark suite: fake LLM backend and local stand-ins for the weather/directions APIs
@@ -0,0 +1,250 @@
+# Fake InMemoryRunner: canned responses with configurable latency, no Gemini key needed
+import asyncio
+import hashlib
+import importlib
+import itertools
+import json
+import math
+import random
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+from utils.rate_limiter import get_rate_limiter, runner_model
+
+# Modules that construct runners, with the attribute the runner class is read from
+RUNNER_MODULES = ("agents.news_core", "agents.summarizer", "google.adk.runners")
+
+
+class LatencyModel:
+    """
+    Log-normal latency: `median` seconds, spread by `sigma` (0 = always the
+    median). Real LLM and API latencies are right-skewed, which a normal
+    distribution would not reproduce in p95/p99.
+    """
+
+    def __init__(self, median: float, sigma: float = 0.0):
+        self.median = median
+        self.sigma = sigma
+
+    def sample(self, rng: random.Random, scale: float = 1.0) -> float:
+        if self.median <= 0 or scale <= 0:
+            return 0.0
+        return self.median * scale * math.exp(self.sigma * rng.gauss(0.0, 1.0))
+
+    def __repr__(self):
+        return f"LatencyModel(median={self.median}, sigma={self.sigma})"
+
+
+# Measured-ish defaults per agent: news runs include a search grounding round-trip
+DEFAULT_LATENCIES = {
+    "NewsAgent": LatencyModel(1.5, 0.5),
+    "SuperWriter": LatencyModel(6.0, 0.35),
+    "ManagerOrchestrator": LatencyModel(1.0, 0.3),
+}
+DEFAULT_LATENCY = LatencyModel(1.0, 0.3)
+
+_VOCABULARY = tuple(
+    "agency analysts announced approved budget board capital council court data deal demand district "
+    "economy election energy estimate experts federal forecast funding growth housing industry inflation "
+    "investors launch leaders market measure officials outlook plan policy prices project proposal "
+    "rates record report research revenue risk sales schedule sector senate shares spending startup "
+    "study supply survey talks target tariffs team transit trial union vote wages workers".split()
+)
+_TOPICS = ("markets", "city council", "transit", "startups", "weather service", "local sports", "research", "energy")
+
+
+def _digest(text: str) -> int:
+    return int(hashlib.sha1(text.encode("utf-8")).hexdigest()[:8], 16)
+
+
+def _summary(topic: str, rng: random.Random) -> str:
+    # Random wording per story, so distinct stories don't read as near-duplicates to the MemoryValidator
+    sentences = []
+    for _ in range(3):
+        words = rng.sample(_VOCABULARY, 12)
+        sentences.append(" ".join(words).capitalize() + ".")
+    return f"The {topic} story moved {rng.randint(2, 19)}% this week. " + " ".join(sentences)
+
+
+BATCHED_NEWS_PROMPT = "Find news for each of these topics:"
+
+
+def canned_news(prompt: str, count: int = 5) -> str:
+    """
+    A JSON list of stories in the NewsAgent's output format. Stories are
+    derived from the query, so identical queries return identical stories.
+    A batched request gets a JSON object with the same list per topic.
+    """
+    if prompt.startswith(BATCHED_NEWS_PROMPT):
+        batch = {}
+        for line in prompt.splitlines()[1:]:
+            label, _, query = line[2:].partition(": ")
+            batch[json.loads(label)] = json.loads(canned_news(f"Find news about: {query}", count))
+        return json.dumps(batch)
+
+    query = prompt.split(":", 1)[-1].strip()
+    seed = _digest(query)
+    stories = []
+    for i in range(count):
+        topic = _TOPICS[(seed + i) % len(_TOPICS)]
+        slug = f"{seed:08x}-{i}"
+        stories.append({
+            "id": slug,
+            "headline": f"{query[:60]}: {topic} update {i + 1}",
+            "summary": _summary(topic, random.Random(seed * 31 + i)),
+            "source": ("Reuters", "AP", "Bloomberg", "Local Desk")[(seed + i) % 4],
+        })
+    return json.dumps(stories)
+
+
+def _writer_payload(prompt: str) -> dict:
+    start = prompt.find("{")
+    end = prompt.find("\n\n", start)
+    try:
+        return json.loads(prompt[start:end if end != -1 else None])
+    except ValueError:
+        return {}
+
+
+def canned_script(prompt: str, sentences: int = 40) -> str:
+    """
+    A podcast script (or, for a sectioned request, a JSON object of
+    sections) about the stories in the writer's payload.
+    """
+    payload = _writer_payload(prompt)
+    name = payload.get("user_name") or "there"
+    headlines = [story.get("headline", "") for story in payload.get("news") or [] if isinstance(story, dict)]
+    lines = [f"Good morning, {name}!"]
+    for i in range(sentences - 2):
+        topic = headlines[i % len(headlines)] if headlines else "the day ahead"
+        lines.append(f"Next up, {topic}, and here is why it matters for your morning.")
+    lines.append("That's your briefing, have a great day.")
+
+    if "Write these sections" not in prompt:
+        return " ".join(lines)
+    requested = prompt.split("Write these sections of the morning briefing script:", 1)[1].split(":\n", 1)[0]
+    sections = [section.strip() for section in requested.split(",") if section.strip()]
+    per_section = max(1, len(lines) // max(1, len(sections)))
+    return json.dumps({
+        section: " ".join(lines[i * per_section:(i + 1) * per_section]) or lines[-1]
+        for i, section in enumerate(sections)
+    })
+
+
+DEFAULT_RESPONDERS = {
+    "NewsAgent": canned_news,
+    "SuperWriter": canned_script,
+}
+
+
+def _event(text: str, partial: bool = False, prompt_tokens: int = 0, completion_tokens: int = 0):
+    """Shaped like an ADK Event as far as the pipeline reads it."""
+    usage = None
+    if not partial:
+        usage = SimpleNamespace(prompt_token_count=prompt_tokens, candidates_token_count=completion_tokens)
+    return SimpleNamespace(
+        partial=partial,
+        content=SimpleNamespace(role="model", parts=[SimpleNamespace(text=text, thought=False)]),
+        usage_metadata=usage,
+    )
+
+
+class _FakeSessionService:
+    def __init__(self):
+        self._ids = itertools.count(1)
+
+    async def create_session(self, app_name: str, user_id: str, **kwargs):
+        return SimpleNamespace(id=f"fake-session-{next(self._ids)}", app_name=app_name, user_id=user_id)
+
+
+class FakeRunner:
+    """
+    Stands in for `InMemoryRunner(agent=...)`: sleeps for a sampled latency
+    and answers with the backend's canned response for the agent's name.
+    Each answer is one model request through the model's rate limiter, as
+    `RateLimitedGemini` would send it.
+    """
+
+    def __init__(self, backend: "FakeLLMBackend", agent=None, app_name: str | None = None, **kwargs):
+        self.backend = backend
+        self.agent = agent
+        self.agent_name = getattr(agent, "name", None) or "agent"
+        self.app_name = app_name or "fake_app"
+        self.session_service = _FakeSessionService()
+
+    async def run_debug(self, prompt: str, **kwargs) -> list:
+        limiter = get_rate_limiter(runner_model(self))
+        text = await limiter.run(lambda: self.backend.respond(self.agent_name, prompt), agent=self.agent_name)
+        return [_event(text, prompt_tokens=len(prompt) // 4, completion_tokens=len(text) // 4)]
+
+    async def run_async(self, user_id=None, session_id=None, new_message=None, run_config=None, **kwargs):
+        """Streams the response as partial events, then the final event with the full text."""
+        parts = getattr(new_message, "parts", None) or []
+        prompt = "".join(getattr(part, "text", None) or "" for part in parts)
+        # Streams hold their slot throughout and are not retried
+        async with get_rate_limiter(runner_model(self)).slot(self.agent_name):
+            latency = self.backend.sample_latency(self.agent_name)
+            text = self.backend.response(self.agent_name, prompt)
+
+            chunks = [text[i:i + 80] for i in range(0, len(text), 80)] or [""]
+            # First token after ~30% of the latency, the rest spread over the remainder
+            await asyncio.sleep(latency * 0.3)
+            for chunk in chunks:
+                yield _event(chunk, partial=True)
+                await asyncio.sleep(latency * 0.7 / len(chunks))
+            yield _event(text, prompt_tokens=len(prompt) // 4, completion_tokens=len(text) // 4)
+
+
+class FakeLLMBackend:
+    """
+    Canned responses and latencies per agent name. `responders` maps an agent
+    name to a fixed string or a `prompt -> text` function; `latency_scale`
+    shrinks every latency (e.g. 0.01 for a quick run with the same shape).
+    `error_rate` makes that fraction of runs raise, like exhausted retries.
+    """
+
+    def __init__(self, latencies: dict | None = None, responders: dict | None = None,
+                 latency_scale: float = 1.0, error_rate: float = 0.0, seed: int = 0):
+        self.latencies = {**DEFAULT_LATENCIES, **(latencies or {})}
+        self.responders = {**DEFAULT_RESPONDERS, **(responders or {})}
+        self.latency_scale = latency_scale
+        self.error_rate = error_rate
+        self._rng = random.Random(seed)
+        self.calls: dict[str, int] = {}
+
+    def sample_latency(self, agent_name: str) -> float:
+        return self.latencies.get(agent_name, DEFAULT_LATENCY).sample(self._rng, self.latency_scale)
+
+    def response(self, agent_name: str, prompt: str) -> str:
+        self.calls[agent_name] = self.calls.get(agent_name, 0) + 1
+        if self.error_rate and self._rng.random() < self.error_rate:
+            raise RuntimeError(f"Fake LLM error for {agent_name} (503 UNAVAILABLE)")
+        responder = self.responders.get(agent_name)
+        if responder is None:
+            return "OK"
+        return responder(prompt) if callable(responder) else str(responder)
+
+    async def respond(self, agent_name: str, prompt: str) -> str:
+        latency = self.sample_latency(agent_name)
+        text = self.response(agent_name, prompt)
+        await asyncio.sleep(latency)
+        return text
+
+    def runner(self, agent=None, app_name: str | None = None, **kwargs) -> FakeRunner:
+        """Drop-in for the `InMemoryRunner` constructor."""
+        return FakeRunner(self, agent=agent, app_name=app_name, **kwargs)
+
+
+@contextmanager
+def use_fake_llm(backend: FakeLLMBackend):
+    """Routes every `InMemoryRunner(...)` in the pipeline to `backend` for the duration of the block."""
+    patched = []
+    try:
+        for module_name in RUNNER_MODULES:
+            module = importlib.import_module(module_name)
+            patched.append((module, getattr(module, "InMemoryRunner", None)))
+            module.InMemoryRunner = backend.runner
+        yield backend
+    finally:
+        for module, original in reversed(patched):
+            module.InMemoryRunner = original
@@ -0,0 +1,200 @@
+# Local HTTP stand-ins for the weather forecast and Directions APIs
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from benchmarks.fake_llm import LatencyModel
+
+# Typical round-trips of the real endpoints
+DEFAULT_API_LATENCY = LatencyModel(0.15, 0.4)
+
+# The agents send these as the `key` query parameter
+_API_KEY_VARS = ("WEATHER_API_KEY", "DIRECTIONS_API_KEY")
+
+_CONDITIONS = ("Sunny", "Partly cloudy", "Cloudy", "Light rain", "Showers", "Fog")
+
+
+def _seed(*parts) -> int:
+    return int(hashlib.sha1("|".join(map(str, parts)).encode("utf-8")).hexdigest()[:8], 16)
+
+
+def daily_forecast(lat: float, lon: float) -> dict:
+    """`forecast/days:lookup` response for one day, deterministic per location."""
+    rng = random.Random(_seed("days", lat, lon))
+    low = rng.randint(2, 15)
+    return {
+        "forecastDays": [{
+            "daytimeForecast": {
+                "weatherCondition": {"description": {"text": rng.choice(_CONDITIONS)}},
+                "uvIndex": rng.randint(0, 9),
+            },
+            "nighttimeForecast": {
+                "weatherCondition": {"description": {"text": rng.choice(_CONDITIONS)}},
+            },
+            "maxTemperature": {"degrees": low + rng.randint(4, 12)},
+            "minTemperature": {"degrees": low},
+        }]
+    }
+
+
+def hourly_forecast(lat: float, lon: float, hours: int = 24) -> dict:
+    """`forecast/hours:lookup` response starting at the current hour, deterministic per location."""
+    rng = random.Random(_seed("hours", lat, lon))
+    start = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    forecast_hours = []
+    for i in range(hours):
+        hour = start + timedelta(hours=i)
+        daylight = max(0.0, 1 - abs(hour.hour - 13) / 7)
+        forecast_hours.append({
+            "interval": {"startTime": hour.strftime("%Y-%m-%dT%H:%M:%SZ")},
+            "uvIndex": round(8 * daylight),
+            "temperature": {"degrees": round(8 + 10 * daylight + rng.uniform(-1, 1), 1)},
+            "precipitation": {"probability": {"percent": rng.choice((0, 0, 5, 10, 20, 40, 60))}},
+        })
+    return {"forecastHours": forecast_hours}
+
+
+def directions(origin: str, destination: str) -> dict:
+    """Directions API response with one route/leg, deterministic per route."""
+    rng = random.Random(_seed("route", origin, destination))
+    normal = rng.randint(10, 60) * 60
+    in_traffic = int(normal * rng.uniform(0.9, 1.6))
+    return {
+        "status": "OK",
+        "routes": [{
+            "summary": rng.choice(("US-101 S", "I-280 S", "I-80 E", "Main St")),
+            "legs": [{
+                "duration": {"text": f"{normal // 60} mins", "value": normal},
+                "duration_in_traffic": {"text": f"{in_traffic // 60} mins", "value": in_traffic},
+                "start_address": origin,
+                "end_address": destination,
+            }],
+        }],
+    }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: "_StubHTTPServer"
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        stub = self.server.stub
+        stub.count(url.path)
+        stub.wait()
+
+        if url.path.endswith("/forecast/days:lookup"):
+            body = daily_forecast(float(query["location.latitude"]), float(query["location.longitude"]))
+        elif url.path.endswith("/forecast/hours:lookup"):
+            body = hourly_forecast(float(query["location.latitude"]), float(query["location.longitude"]),
+                                   int(query.get("hours", 24)))
+        elif url.path.endswith("/directions/json"):
+            body = directions(query.get("origin", ""), query.get("destination", ""))
+        else:
+            self.send_error(404)
+            return
+
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        # One line per request would drown the benchmark output
+        pass
+
+
+class _StubHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Up to HTTP_MAX_CONNECTIONS clients connect at once
+    request_queue_size = 256
+
+
+class StubAPIServer:
+    """
+    Serves `/v1/forecast/days:lookup`, `/v1/forecast/hours:lookup` and
+    `/maps/api/directions/json` on localhost, each request delayed by a
+    sample from `latency`. Use as a context manager, then `point_agents_at()`.
+    """
+
+    def __init__(self, latency: LatencyModel = DEFAULT_API_LATENCY, latency_scale: float = 1.0,
+                 host: str = "127.0.0.1", port: int = 0, seed: int = 0):
+        self.latency = latency
+        self.latency_scale = latency_scale
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = _StubHTTPServer((host, port), _Handler)
+        self._server.stub = self
+        self._thread = None
+        self.requests: dict[str, int] = {}
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def weather_base_url(self) -> str:
+        return f"{self.base_url}/v1"
+
+    @property
+    def directions_url(self) -> str:
+        return f"{self.base_url}/maps/api/directions/json"
+
+    def count(self, path: str):
+        with self._lock:
+            self.requests[path] = self.requests.get(path, 0) + 1
+
+    def wait(self):
+        with self._lock:
+            delay = self.latency.sample(self._rng, self.latency_scale)
+        if delay:
+            time.sleep(delay)
+
+    def start(self) -> "StubAPIServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="stub-api", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+@contextmanager
+def point_agents_at(server: StubAPIServer):
+    """
+    Sends the weather and traffic agents' requests to `server` for the
+    duration of the block, with placeholder API keys if none are set.
+    """
+    import agents.traffic as traffic
+    import agents.weather as weather
+
+    originals = (weather.WEATHER_API_BASE_URL, traffic.DIRECTIONS_API_URL)
+    original_keys = {name: os.environ.get(name) for name in _API_KEY_VARS}
+    weather.WEATHER_API_BASE_URL = server.weather_base_url
+    traffic.DIRECTIONS_API_URL = server.directions_url
+    for name in _API_KEY_VARS:
+        os.environ.setdefault(name, "benchmark")
+    try:
+        yield server
+    finally:
+        weather.WEATHER_API_BASE_URL, traffic.DIRECTIONS_API_URL = originals
+        for name, value in original_keys.items():
+            if value is None:
+                os.environ.pop(name, None)
@@ -0,0 +1,243 @@
+# End-to-end batch benchmark on the fake LLM and stub APIs, with baseline comparison
+import asyncio
+import atexit
+import contextlib
+import json
+import logging
+import os
+import random
+import tempfile
+import time
+
+from benchmarks.fake_llm import FakeLLMBackend, use_fake_llm
+from benchmarks.stub_servers import StubAPIServer, point_agents_at
+
+BENCHMARK_BASELINE_FILE = os.getenv(
+    "BENCHMARK_BASELINE_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+)
+DEFAULT_USER_COUNTS = (1, 100, 10000)
+# Relative slack before a change counts as a regression (0.2 = 20% slower / lower throughput)
+DEFAULT_TOLERANCE = 0.2
+
+# Lower is better for latencies, higher for throughput
+LATENCY_KEYS = ("p50", "p95", "p99")
+THROUGHPUT_KEY = "throughput"
+# A baseline is only comparable when it was recorded with the same settings
+CONFIG_KEYS = ("latency_scale", "concurrency", "gathering", "seed")
+
+_CITIES = (
+    ("San Francisco", "USA", 37.7749, -122.4194),
+    ("New York", "USA", 40.7128, -74.0060),
+    ("London", "UK", 51.5072, -0.1276),
+    ("Berlin", "Germany", 52.5200, 13.4050),
+    ("Tokyo", "Japan", 35.6762, 139.6503),
+    ("Sydney", "Australia", -33.8688, 151.2093),
+    ("Toronto", "Canada", 43.6532, -79.3832),
+    ("Bangalore", "India", 12.9716, 77.5946),
+)
+_INTERESTS = (
+    "Generative AI Agents", "NVIDIA Stock Performance", "Golden State Warriors Scores", "New Python Frameworks",
+    "Climate Policy", "Formula 1", "Space Exploration", "Electric Vehicles", "Premier League", "Cybersecurity",
+    "Startup Funding", "Quantum Computing", "Housing Market", "Jazz", "Chess", "Interest Rates",
+    "Open Source Software", "Public Transit", "Nutrition Science", "Video Game Releases",
+)
+_TONES = (["Sarcastic", "Informative"], ["Calm"], ["Energetic", "Upbeat"], ["Formal"], None)
+_TIME_LIMITS = ("3 minutes", "5 minutes", "10 minutes", None)
+
+
+def synthetic_profiles(count: int, seed: int = 0) -> dict:
+    """
+    `count` profiles shaped like preferences.json. Users cluster in a few
+    cities and share interests and commutes, like a real user base would,
+    so the benchmark exercises the shared caches and request coalescing.
+    """
+    rng = random.Random(seed)
+    profiles = {}
+    for i in range(count):
+        city, country, lat, lon = rng.choice(_CITIES)
+        profiles[f"bench_{i:05d}"] = {
+            "name": f"User {i}",
+            "location": {
+                "city": city,
+                "country": country,
+                "coordinates": {"lat": round(lat + rng.uniform(-0.05, 0.05), 4),
+                                "lon": round(lon + rng.uniform(-0.05, 0.05), 4)},
+            },
+            "interests": rng.sample(_INTERESTS, rng.randint(2, 4)),
+            "commute": {
+                "origin": f"District {rng.randint(1, 12)}, {city}",
+                "destination": f"Business Park {rng.randint(1, 4)}, {city}",
+            },
+            "tone_preference": rng.choice(_TONES),
+            "time_limit": rng.choice(_TIME_LIMITS),
+            "schedule": {"wake_time": f"{rng.randint(5, 8):02d}:{rng.choice((0, 15, 30, 45)):02d}"},
+        }
+    return profiles
+
+
+def _release_process_state():
+    """
+    Writes the disk-backed news cache and memory service and drops them, so
+    their exit-time flushes never run after the scenario's working directory
+    is gone (or, worse, write stub news into the repo's db/).
+    """
+    import agents.memory_validator as memory_validator
+    import agents.news_core as news_core
+
+    cache = news_core._news_cache
+    if cache is not None:
+        cache.flush()
+        atexit.unregister(cache.flush)
+        news_core._news_cache = None
+    service = memory_validator._shared_service
+    if service is not None:
+        service._flush_at_exit()
+        atexit.unregister(service._flush_at_exit)
+        memory_validator._shared_service = None
+
+
+def _reset_process_state():
+    """Empties the process-wide caches and services so each scenario starts cold."""
+    import agents.news_core as news_core
+    import agents.traffic as traffic
+    import agents.weather as weather
+    from utils.metrics import get_metrics
+    from utils.rate_limiter import clear_rate_limiters
+    from utils.runner_pool import get_runner_pool
+
+    weather._forecast_cache.clear()
+    traffic._traffic_cache.clear()
+    # Recreated on first use, under the scenario's working directory
+    _release_process_state()
+    news_core._news_batch_sizer = news_core.NewsBatchSizer()
+    # Pooled runners hold the previous scenario's fake backend
+    get_runner_pool().clear()
+    # Learned concurrency limits start over
+    clear_rate_limiters()
+    get_metrics().reset()
+
+
+def _operation_latencies() -> dict:
+    """p95 of every timed operation, e.g. {"NewsAgent.llm_run": 0.21}."""
+    from utils.metrics import get_metrics
+
+    histograms = get_metrics().summary()["histograms"].get("pipeline_operation_seconds", [])
+    return {f"{h['labels']['agent']}.{h['labels']['operation']}": h["p95"] for h in histograms}
+
+
+def run_scenario(users: int, backend: FakeLLMBackend, server: StubAPIServer, concurrency: int = 64,
+                 gathering: str = "direct", seed: int = 0) -> dict:
+    """
+    Runs `main.run_batch` for `users` synthetic profiles in a scratch working
+    directory (db/ caches, memory log and metrics land there) and returns
+    latency percentiles, throughput and request counts.
+    """
+    import main
+
+    profiles = synthetic_profiles(users, seed=seed)
+    llm_calls_before = sum(backend.calls.values())
+    http_before = sum(server.requests.values())
+
+    previous_cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="podcast-bench-") as workdir:
+        os.chdir(workdir)
+        root_logger = logging.getLogger()
+        previous_level = root_logger.level
+        try:
+            _reset_process_state()
+            # Agents print progress per user; keep warnings and errors only
+            root_logger.setLevel(logging.WARNING)
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull), \
+                    use_fake_llm(backend), point_agents_at(server):
+                started = time.perf_counter()
+                results = asyncio.run(main.run_batch(concurrency, gathering, profiles=profiles))
+                elapsed = time.perf_counter() - started
+            operations = _operation_latencies()
+        finally:
+            _release_process_state()
+            root_logger.setLevel(previous_level)
+            os.chdir(previous_cwd)
+
+    latencies = [r["latency"] for r in results.values()]
+    failed = sum(1 for r in results.values() if not r["ok"])
+    return {
+        "users": users,
+        "ok": len(results) - failed,
+        "failed": failed,
+        "wall_seconds": round(elapsed, 3),
+        "throughput": round(len(results) / elapsed, 3) if elapsed > 0 else 0.0,
+        "p50": round(main._percentile(latencies, 50), 4),
+        "p95": round(main._percentile(latencies, 95), 4),
+        "p99": round(main._percentile(latencies, 99), 4),
+        "max": round(max(latencies, default=0.0), 4),
+        "llm_calls": sum(backend.calls.values()) - llm_calls_before,
+        "http_requests": sum(server.requests.values()) - http_before,
+        "operations_p95": operations,
+    }
+
+
+def run_suite(user_counts=DEFAULT_USER_COUNTS, latency_scale: float = 0.05, concurrency: int = 64,
+              gathering: str = "direct", seed: int = 0) -> dict:
+    """
+    Runs one scenario per user count against a fresh fake backend and stub
+    server. Returns {"config": {...}, "scenarios": {"<n>_users": result}}.
+    """
+    config = {"latency_scale": latency_scale, "concurrency": concurrency, "gathering": gathering, "seed": seed}
+    scenarios = {}
+    for users in user_counts:
+        backend = FakeLLMBackend(latency_scale=latency_scale, seed=seed)
+        with StubAPIServer(latency_scale=latency_scale, seed=seed) as server:
+            print(f"Benchmark: {users} users (concurrency={concurrency}, latency scale={latency_scale})...")
+            scenarios[f"{users}_users"] = run_scenario(users, backend, server, concurrency, gathering, seed)
+    return {"config": config, "scenarios": scenarios}
+
+
+def load_baseline(path: str = BENCHMARK_BASELINE_FILE):
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_baseline(report: dict, path: str = BENCHMARK_BASELINE_FILE):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def compare_to_baseline(report: dict, baseline: dict, tolerance: float = DEFAULT_TOLERANCE) -> list:
+    """
+    Returns one message per regression: a latency percentile more than
+    `tolerance` above the baseline, throughput more than `tolerance` below it,
+    or new failures. Scenarios missing from the baseline are not compared.
+    Raises ValueError if the baseline was recorded with different settings.
+    """
+    mismatched = [key for key in CONFIG_KEYS if baseline.get("config", {}).get(key) != report["config"].get(key)]
+    if mismatched:
+        raise ValueError(f"Baseline was recorded with different settings: {', '.join(mismatched)}")
+
+    regressions = []
+    for name, result in report["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(name)
+        if base is None:
+            continue
+        for key in LATENCY_KEYS:
+            if base.get(key) and result[key] > base[key] * (1 + tolerance):
+                regressions.append(f"{name}: {key} {result[key]:.3f}s vs baseline {base[key]:.3f}s "
+                                   f"(+{result[key] / base[key] - 1:.0%})")
+        if base.get(THROUGHPUT_KEY) and result[THROUGHPUT_KEY] < base[THROUGHPUT_KEY] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {result[THROUGHPUT_KEY]:.2f} users/s vs baseline "
+                               f"{base[THROUGHPUT_KEY]:.2f} ({result[THROUGHPUT_KEY] / base[THROUGHPUT_KEY] - 1:.0%})")
+        if result["failed"] > base.get("failed", 0):
+            regressions.append(f"{name}: {result['failed']} failed users vs {base.get('failed', 0)} in the baseline")
+    return regressions
+
+
+def format_report(report: dict) -> str:
+    lines = [f"{'scenario':<14}{'users/s':>10}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}{'failed':>8}{'llm':>8}{'http':>8}"]
+    for name, r in report["scenarios"].items():
+        lines.append(f"{name:<14}{r['throughput']:>10.2f}{r['p50']:>9.3f}{r['p95']:>9.3f}{r['p99']:>9.3f}"
+                     f"{r['max']:>9.3f}{r['failed']:>8}{r['llm_calls']:>8}{r['http_requests']:>8}")
+    return "\n".join(lines)
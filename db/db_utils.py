@@ -1,7 +1,13 @@
 # Helper functions to load/save JSONs
 import json
 
+PREFERENCES_FILE = "db/preferences.json"
+
+def load_all_profiles(path: str = PREFERENCES_FILE) -> dict:
+    """Returns every user profile keyed by user id."""
+    with open(path, "r") as f:
+        return json.load(f)
+
 def get_user_profile(user_id: str):
-    with open("db/preferences.json", "r") as f:
-        data = json.load(f)
-    return data.get(user_id, {}) # Returns empty dict if user not found
\ No newline at end of file
+    data = load_all_profiles()
+    return data.get(user_id, {}) # Returns empty dict if user not found
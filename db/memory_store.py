@@ -0,0 +1,281 @@
+# Storage backends for the MemoryValidator's log of recently covered stories
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Shared partition for non-personalized headlines (and the pre-partitioning log)
+GLOBAL_PARTITION = "global"
+
+# Keep IN (...) lists below SQLite's bound-parameter limit
+_SQL_CHUNK_SIZE = 500
+
+_CREATE_TABLE = """
+    CREATE TABLE IF NOT EXISTS memory_log (
+        partition TEXT NOT NULL,
+        id TEXT NOT NULL,
+        timestamp REAL NOT NULL,
+        entry TEXT NOT NULL,
+        PRIMARY KEY (partition, id)
+    )
+"""
+
+
+def _parse_timestamp(ts_str):
+    try:
+        return datetime.fromisoformat(ts_str)
+    except (TypeError, ValueError):
+        return None
+
+
+def partition_path(log_file: str, partition: str, suffix: str) -> str:
+    """
+    File for one partition's data: the global partition keeps the original
+    name (memory_log.json), users live under memory_log/<user_id><suffix>.
+    """
+    base = os.path.splitext(log_file)[0]
+    if partition == GLOBAL_PARTITION:
+        return base + suffix
+    safe_name = re.sub(r"[^A-Za-z0-9_.-]", "_", partition)
+    return os.path.join(base, safe_name + suffix)
+
+
+class JsonMemoryStore:
+    """
+    Original backend: each partition is one JSON document that is loaded
+    on first use and rewritten on every change.
+    """
+
+    def __init__(self, log_file: str):
+        # Partition files may be written at exit, under another working directory
+        self.log_file = os.path.abspath(log_file)
+        self._docs: dict[str, dict] = {}
+
+    def _doc(self, partition: str) -> dict:
+        if partition not in self._docs:
+            self._docs[partition] = self._load(partition_path(self.log_file, partition, ".json"))
+        return self._docs[partition]
+
+    def _load(self, path: str):
+        if not os.path.exists(path):
+            return {"recent_topics": []}
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except json.JSONDecodeError:
+            return {"recent_topics": []}
+
+    def _save(self, partition: str):
+        path = partition_path(self.log_file, partition, ".json")
+        # Ensure directory exists
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self._doc(partition), f, indent=2)
+
+    def existing_ids(self, partition: str, ids) -> set:
+        wanted = set(ids)
+        return {item.get('id') for item in self._doc(partition).get("recent_topics", []) if item.get('id') in wanted}
+
+    def add(self, partition: str, entries: list):
+        if not entries:
+            return
+        self._doc(partition).setdefault("recent_topics", []).extend(entries)
+        self._save(partition)
+
+    def prune(self, partition: str, cutoff: datetime) -> list:
+        """Removes entries at or before `cutoff`; returns their ids."""
+        doc = self._doc(partition)
+        recent, removed = [], []
+        for item in doc.get("recent_topics", []):
+            ts = _parse_timestamp(item.get('timestamp'))
+            # Drop invalid timestamps
+            if ts is not None and ts > cutoff:
+                recent.append(item)
+            else:
+                removed.append(item.get('id'))
+        doc["recent_topics"] = recent
+        if removed:
+            self._save(partition)
+        return removed
+
+    def trim(self, partition: str, max_entries: int) -> list:
+        """Keeps only the newest `max_entries`; returns the removed ids."""
+        doc = self._doc(partition)
+        topics = doc.get("recent_topics", [])
+        if len(topics) <= max_entries:
+            return []
+        topics.sort(key=lambda item: item.get('timestamp', ''))
+        cut = len(topics) - max_entries
+        doc["recent_topics"] = topics[cut:]
+        self._save(partition)
+        return [item.get('id') for item in topics[:cut]]
+
+    def entries(self, partition: str) -> list:
+        return list(self._doc(partition).get("recent_topics", []))
+
+    def id_timestamps(self, partition: str) -> dict:
+        """Maps every logged id in the partition to its epoch timestamp."""
+        result = {}
+        for item in self._doc(partition).get("recent_topics", []):
+            ts = _parse_timestamp(item.get('timestamp'))
+            if item.get('id') and ts is not None:
+                result[item['id']] = ts.timestamp()
+        return result
+
+    def release(self, partition: str):
+        """Forgets the partition's loaded document; it is read from disk again on next use."""
+        self._docs.pop(partition, None)
+
+    def close(self):
+        pass
+
+
+class SQLiteMemoryStore:
+    """
+    Indexed backend: all partitions share one table keyed by (partition, id).
+    Id lookups use the primary key, inserts are single-row appends, and
+    retention pruning is a range delete on the (partition, timestamp) index.
+    """
+
+    def __init__(self, path: str, legacy_json_path: str | None = None):
+        self.path = path
+        is_new = not os.path.exists(path)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._migrate_unpartitioned()
+        self._conn.execute(_CREATE_TABLE)
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_memory_log_partition_timestamp ON memory_log (partition, timestamp)"
+        )
+        self._conn.commit()
+
+        if is_new and legacy_json_path and os.path.exists(legacy_json_path):
+            self._import_json(legacy_json_path)
+
+    def _migrate_unpartitioned(self):
+        """Moves a pre-partitioning memory_log table into the global partition."""
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(memory_log)")]
+        if not columns or "partition" in columns:
+            return
+        self._conn.execute("ALTER TABLE memory_log RENAME TO memory_log_unpartitioned")
+        self._conn.execute("DROP INDEX IF EXISTS idx_memory_log_timestamp")
+        self._conn.execute(_CREATE_TABLE)
+        self._conn.execute(
+            "INSERT INTO memory_log (partition, id, timestamp, entry) "
+            "SELECT ?, id, timestamp, entry FROM memory_log_unpartitioned",
+            (GLOBAL_PARTITION,),
+        )
+        self._conn.execute("DROP TABLE memory_log_unpartitioned")
+        self._conn.commit()
+        logger.info(f"Migrated {self.path} to per-user partitions")
+
+    def _import_json(self, json_path: str):
+        """One-time migration of an existing memory_log.json into the global partition."""
+        entries = JsonMemoryStore(json_path).entries(GLOBAL_PARTITION)
+        self.add(GLOBAL_PARTITION, [e for e in entries if e.get('id') and _parse_timestamp(e.get('timestamp'))])
+        logger.info(f"Imported {len(entries)} entries from {json_path} into {self.path}")
+
+    def existing_ids(self, partition: str, ids) -> set:
+        ids = list(set(ids))
+        found = set()
+        with self._lock:
+            for start in range(0, len(ids), _SQL_CHUNK_SIZE):
+                chunk = ids[start:start + _SQL_CHUNK_SIZE]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT id FROM memory_log WHERE partition = ? AND id IN ({placeholders})",
+                    [partition, *chunk],
+                )
+                found.update(row[0] for row in rows)
+        return found
+
+    def add(self, partition: str, entries: list):
+        rows = [
+            (partition, e['id'], _parse_timestamp(e['timestamp']).timestamp(), json.dumps(e))
+            for e in entries
+        ]
+        if not rows:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO memory_log (partition, id, timestamp, entry) VALUES (?, ?, ?, ?)", rows
+            )
+            self._conn.commit()
+
+    def _delete(self, where: str, params: tuple) -> list:
+        """
+        Deletes the rows matching `where` and returns their ids. A SELECT and a
+        DELETE in one write transaction, since `DELETE ... RETURNING` needs
+        SQLite 3.35+. The caller holds `_lock`.
+        """
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            ids = [row[0] for row in self._conn.execute(f"SELECT id FROM memory_log WHERE {where}", params)]
+            if ids:
+                self._conn.execute(f"DELETE FROM memory_log WHERE {where}", params)
+            self._conn.commit()
+        except Exception:
+            self._conn.rollback()
+            raise
+        return ids
+
+    def prune(self, partition: str, cutoff: datetime) -> list:
+        """Removes entries at or before `cutoff`; returns their ids."""
+        with self._lock:
+            return self._delete("partition = ? AND timestamp <= ?", (partition, cutoff.timestamp()))
+
+    def trim(self, partition: str, max_entries: int) -> list:
+        """Keeps only the newest `max_entries`; returns the removed ids."""
+        with self._lock:
+            return self._delete(
+                "partition = ? AND id IN ("
+                " SELECT id FROM memory_log WHERE partition = ? ORDER BY timestamp DESC LIMIT -1 OFFSET ?)",
+                (partition, partition, max_entries),
+            )
+
+    def entries(self, partition: str) -> list:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT entry FROM memory_log WHERE partition = ? ORDER BY timestamp", (partition,)
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def id_timestamps(self, partition: str) -> dict:
+        """Maps every logged id in the partition to its epoch timestamp."""
+        with self._lock:
+            return dict(self._conn.execute(
+                "SELECT id, timestamp FROM memory_log WHERE partition = ?", (partition,)
+            ))
+
+    def release(self, partition: str):
+        """Nothing to drop: partitions are only read on demand."""
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+MEMORY_BACKENDS = ("sqlite", "json")
+
+
+def create_memory_store(log_file: str, backend: str | None = None):
+    """
+    Builds the configured backend for `log_file`.
+    The SQLite database lives next to the JSON log (memory_log.json -> memory_log.sqlite3)
+    and imports it into the global partition the first time it is created.
+    """
+    backend = backend or os.getenv("MEMORY_BACKEND", "sqlite")
+    if backend == "json":
+        return JsonMemoryStore(log_file)
+    if backend == "sqlite":
+        db_path = os.path.splitext(log_file)[0] + ".sqlite3"
+        return SQLiteMemoryStore(db_path, legacy_json_path=log_file)
+    raise ValueError(f"Unknown memory backend '{backend}'. Expected one of {MEMORY_BACKENDS}.")
@@ -1,6 +1,9 @@
 # Entry point: manager agent triggers pipeline
 # main.py (The "System")
 
+import argparse
+import asyncio
+import math
 import time
 import sys
 import os
@@ -20,12 +23,24 @@ logging.basicConfig(
 # Ensure we can import from the current directory
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from agents.manager import ManagerAgent
+from agents.manager import ManagerAgent, GATHERING_MODES
+from agents.memory_validator import flush_memory_service
+from agents.rebuilder import PodcastRebuilder
 from agents.summarizer import SuperWriterAgent
-from db.db_utils import get_user_profile
-from utils.session import InMemorySessionService
+from db.db_utils import get_user_profile, load_all_profiles
+from utils.fetch_tools import close_http_client
+from utils.metrics import export_run_metrics
+from utils.runner_pool import get_runner_pool
+from utils.rate_limiter import rate_limiters
+from utils.session import InMemorySessionService, KEY_TONE
+from utils.tts import TTSPipeline, save_wav
 
-def main():
+logger = logging.getLogger("main")
+
+# How many users are processed at the same time in batch mode
+DEFAULT_BATCH_CONCURRENCY = 8
+
+def main(gathering_mode: str = "llm", stream: bool = False, audio_path: str | None = None, refresh: bool = False):
     user_id = "user_123"
 
     # 1. INIT SESSION SERVICE
@@ -34,28 +49,206 @@ def main():
     # 2. FETCH DB DATA
     print(f"Fetching profile for {user_id}...")
     user_profile_data = get_user_profile(user_id)
-    
+
     if not user_profile_data:
         print(f"User {user_id} not found in preferences.json")
         return
 
     # 3. INJECT INTO SESSION
-    session_service.initialize_user_context(user_profile_data)
-    
-    # 4. START MANAGER
-    print("Initializing Manager Agent...")
-    manager = ManagerAgent(session_service)
-    manager.execute_gathering() 
-
-    # 5. START SUMMARIZER
-    print("Initializing Summarizer Agent...")
-    summarizer = SuperWriterAgent(session_service)
-    final_script = summarizer.generate_script()
+    session_service.initialize_user_context(user_profile_data, user_id=user_id)
+
+    if refresh:
+        # 4-5. REFETCH EXPIRED INPUTS, REWRITE CHANGED SECTIONS
+        print("Refreshing the last build...")
+        final_script = PodcastRebuilder(session_service).rebuild()["script"]
+    else:
+        # 4. START MANAGER
+        print("Initializing Manager Agent...")
+        manager = ManagerAgent(session_service, mode=gathering_mode)
+        manager.execute_gathering()
+
+        # 5. START SUMMARIZER
+        print("Initializing Summarizer Agent...")
+        summarizer = SuperWriterAgent(session_service)
+        if stream:
+            asyncio.run(stream_podcast(summarizer, audio_path))
+            export_run_metrics(run_name=user_id)
+            return
+        final_script = summarizer.generate_script()
 
     print("\n" + "="*30)
     print(" FINAL PODCAST SCRIPT ")
     print("="*30 + "\n")
     print(final_script)
 
+    # 6. (OPTIONAL) TEXT-TO-SPEECH
+    if audio_path:
+        tone = session_service.state.get(KEY_TONE)
+        _save_audio(asyncio.run(TTSPipeline().synthesize(final_script, tone=tone)), audio_path)
+
+    export_run_metrics(run_name=user_id)
+
+async def echo_script_stream(summarizer: SuperWriterAgent):
+    """Prints the script sentence by sentence as it is generated, passing each sentence on."""
+    print("\n" + "="*30)
+    print(" FINAL PODCAST SCRIPT ")
+    print("="*30 + "\n")
+
+    started = time.perf_counter()
+    first_sentence_at = None
+    async for sentence in summarizer.stream_script():
+        if first_sentence_at is None:
+            first_sentence_at = time.perf_counter() - started
+        print(sentence, end=" ", flush=True)
+        yield sentence
+    print()
+    if first_sentence_at is not None:
+        logger.info(f"First sentence after {first_sentence_at:.2f}s, full script after {time.perf_counter() - started:.2f}s")
+
+async def stream_podcast(summarizer: SuperWriterAgent, audio_path: str | None = None):
+    """Streams the script to stdout and, with `audio_path`, synthesizes each sentence as it arrives."""
+    sentences = echo_script_stream(summarizer)
+    if audio_path:
+        tone = summarizer.session.state.get(KEY_TONE)
+        _save_audio(await TTSPipeline().synthesize_stream(sentences, tone=tone), audio_path)
+    else:
+        async for _ in sentences:
+            pass
+
+def _save_audio(result: dict, audio_path: str):
+    save_wav(audio_path, result["audio"], result["sample_rate"])
+    print(f"Audio: {result['audio_seconds']:.1f}s saved to {audio_path} "
+          f"({result['chunks']} chunks, {result['cached_chunks']} from cache, RTF {result['rtf']:.3f})")
+
+# --- Batch Mode ---
+
+async def run_user_pipeline(user_id: str, user_profile_data: dict, gathering_mode: str = "direct") -> str:
+    """
+    Runs the Manager -> SuperWriter pipeline for one user on the current event loop.
+    Each user gets its own session so state never leaks between users.
+    """
+    session_service = InMemorySessionService()
+    session_service.initialize_user_context(user_profile_data, user_id=user_id)
+
+    manager = ManagerAgent(session_service, mode=gathering_mode)
+    await manager.execute_gathering_async()
+
+    summarizer = SuperWriterAgent(session_service)
+    return await summarizer.generate_script_async()
+
+def _percentile(values: list, pct: float) -> float:
+    """Nearest-rank percentile; returns 0.0 for an empty list."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+async def run_batch(concurrency: int = DEFAULT_BATCH_CONCURRENCY, gathering_mode: str = "direct",
+                    profiles: dict | None = None) -> dict:
+    """
+    Generates a podcast for every user in `profiles` (default: preferences.json) on one event loop.
+    A failing user is logged and recorded, it never cancels the rest of the batch.
+    Returns {user_id: {"ok", "latency", "script" | "error"}}.
+    """
+    profiles = load_all_profiles() if profiles is None else profiles
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    results = {}
+
+    async def _run_one(user_id: str, profile: dict):
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                script = await run_user_pipeline(user_id, profile, gathering_mode)
+                results[user_id] = {"ok": True, "script": script}
+            except Exception as e:
+                logger.exception(f"Podcast generation failed for {user_id}")
+                results[user_id] = {"ok": False, "error": str(e)}
+            results[user_id]["latency"] = time.perf_counter() - started
+
+    print(f"Batch: Generating podcasts for {len(profiles)} users (concurrency={concurrency})...")
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(*(_run_one(user_id, profile) for user_id, profile in profiles.items()))
+    finally:
+        await close_http_client()
+        await flush_memory_service()
+    elapsed = time.perf_counter() - started
+
+    _print_batch_summary(results, elapsed)
+    export_run_metrics(run_name="batch")
+    return results
+
+def _print_batch_summary(results: dict, elapsed: float):
+    latencies = [r["latency"] for r in results.values()]
+    failed = sorted(user_id for user_id, r in results.items() if not r["ok"])
+    throughput = len(results) / elapsed if elapsed > 0 else 0.0
+
+    print("\n" + "="*30)
+    print(" BATCH SUMMARY ")
+    print("="*30 + "\n")
+    print(f"Users:       {len(results)} ({len(results) - len(failed)} ok, {len(failed)} failed)")
+    print(f"Wall time:   {elapsed:.2f}s")
+    print(f"Throughput:  {throughput:.2f} users/s")
+    print(f"Latency p50: {_percentile(latencies, 50):.2f}s")
+    print(f"Latency p95: {_percentile(latencies, 95):.2f}s")
+    print(f"Latency max: {max(latencies, default=0.0):.2f}s")
+    pool = get_runner_pool().stats
+    print(f"Agent setup: {pool['builds']} builds ({pool['setup_seconds']:.2f}s), {pool['reuses']} pooled reuses")
+    for model, limiter in sorted(rate_limiters().items()):
+        stats = limiter.stats
+        print(f"LLM {model}: {stats['acquired']} calls, limit {limiter.limit:.0f} concurrent, "
+              f"queue wait max {stats['max_queue_seconds']:.2f}s, {stats['rate_limited']} rate-limited")
+    if failed:
+        print(f"Failed users: {', '.join(failed)}")
+
+def cli(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description="Generate the daily personalized podcast.")
+    parser.add_argument(
+        "--batch",
+        action="store_true",
+        help="Generate podcasts for every user in preferences.json.",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=DEFAULT_BATCH_CONCURRENCY,
+        help=f"Maximum users processed at once in batch mode (default: {DEFAULT_BATCH_CONCURRENCY}).",
+    )
+    parser.add_argument(
+        "--gathering",
+        choices=GATHERING_MODES,
+        default=None,
+        help="'llm' lets the orchestrator pick tools, 'direct' fetches all sources concurrently "
+             "(default: llm for a single user, direct in batch mode).",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Print the script sentence by sentence while it is generated (single user only).",
+    )
+    parser.add_argument(
+        "--audio",
+        metavar="PATH",
+        default=None,
+        help="Also synthesize the script to a WAV file (single user only; engine from TTS_ENGINE).",
+    )
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="Rebuild from the last run: refetch only expired inputs and rewrite only changed sections "
+             "(single user only).",
+    )
+    args = parser.parse_args(argv)
+
+    if args.batch:
+        single_user = [flag for flag, value in (("--stream", args.stream), ("--audio", args.audio),
+                                                ("--refresh", args.refresh)) if value]
+        if single_user:
+            parser.error(f"{', '.join(single_user)} cannot be combined with --batch (single user only)")
+        asyncio.run(run_batch(args.concurrency, args.gathering or "direct"))
+    else:
+        main(args.gathering or "llm", stream=args.stream, audio_path=args.audio, refresh=args.refresh)
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    cli()
@@ -0,0 +1,95 @@
+"""Offline end-to-end benchmark of the batch pipeline (fake LLM, local weather/directions stand-ins)."""
+
+from __future__ import annotations
+
+import argparse
+import sys
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+from benchmarks.suite import (
+    BENCHMARK_BASELINE_FILE,
+    DEFAULT_TOLERANCE,
+    DEFAULT_USER_COUNTS,
+    compare_to_baseline,
+    format_report,
+    load_baseline,
+    run_suite,
+    save_baseline,
+)
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Benchmark batch podcast generation without API keys and compare it to a stored baseline."
+    )
+    parser.add_argument(
+        "--users",
+        type=int,
+        nargs="+",
+        default=list(DEFAULT_USER_COUNTS),
+        help="Synthetic user counts, one scenario each (default: 1 100 10000).",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=64,
+        help="Users processed at once (run_batch concurrency).",
+    )
+    parser.add_argument(
+        "--latency-scale",
+        type=float,
+        default=0.05,
+        help="Multiplier on the simulated LLM/API latencies (1.0 = realistic, 0 = CPU only).",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Seed for profiles and latency samples.")
+    parser.add_argument(
+        "--baseline",
+        default=BENCHMARK_BASELINE_FILE,
+        help="Baseline results file.",
+    )
+    parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="Store this run as the new baseline instead of comparing against it.",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=DEFAULT_TOLERANCE,
+        help="Relative slack before a change is flagged (default: 0.2).",
+    )
+
+    args = parser.parse_args(argv)
+    report = run_suite(args.users, latency_scale=args.latency_scale, concurrency=args.concurrency, seed=args.seed)
+    print()
+    print(format_report(report))
+
+    if args.save_baseline:
+        save_baseline(report, args.baseline)
+        print(f"\nBaseline saved to {args.baseline}")
+        return 0
+
+    baseline = load_baseline(args.baseline)
+    if baseline is None:
+        print(f"\nNo baseline at {args.baseline}; run with --save-baseline to record one.")
+        return 0
+    try:
+        regressions = compare_to_baseline(report, baseline, args.tolerance)
+    except ValueError as e:
+        print(f"\nNot compared: {e}")
+        return 0
+    if regressions:
+        print("\nREGRESSIONS:")
+        for message in regressions:
+            print(f"  - {message}")
+        return 1
+    print(f"\nNo regressions against {args.baseline} (tolerance {args.tolerance:.0%}).")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
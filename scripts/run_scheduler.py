@@ -0,0 +1,105 @@
+"""Long-running scheduler that has each user's podcast ready before their delivery time."""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+try:
+    from dotenv import load_dotenv  # type: ignore
+except ImportError:  # pragma: no cover - dependency is optional
+    load_dotenv = None
+
+from agents.memory_validator import flush_memory_service
+from db.db_utils import load_all_profiles
+from main import run_user_pipeline
+from utils.fetch_tools import close_http_client
+from utils.metrics import export_run_metrics
+from utils.scheduler import (
+    SCHEDULER_CONCURRENCY,
+    SCHEDULER_LEAD_SECONDS,
+    SCHEDULER_SPREAD_SECONDS,
+    PodcastScheduler,
+    delivery_date,
+)
+
+PODCAST_OUTPUT_DIR = os.getenv("PODCAST_OUTPUT_DIR", "output")
+# The scheduler never finishes a run, so metrics are exported this often and at shutdown
+SCHEDULER_METRICS_INTERVAL_SECONDS = float(os.getenv("SCHEDULER_METRICS_INTERVAL_SECONDS", 300))
+
+
+async def _generate(user_id: str, profile: dict, deadline: float) -> None:
+    script = await run_user_pipeline(user_id, profile, gathering_mode="direct")
+    out_dir = Path(PODCAST_OUTPUT_DIR) / user_id
+    out_dir.mkdir(parents=True, exist_ok=True)
+    # Named by the delivery date in the user's timezone, not the server's
+    out_path = out_dir / f"{delivery_date(profile, deadline):%Y-%m-%d}.txt"
+    out_path.write_text(script, encoding="utf-8")
+    # Batch writes from the memory service would otherwise wait for the next flush
+    await flush_memory_service()
+
+
+async def _export_metrics_periodically(interval: float) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        export_run_metrics(run_name="scheduler")
+
+
+async def _run(lead: float, spread: float, concurrency: int) -> None:
+    scheduler = PodcastScheduler(
+        _generate, lead_seconds=lead, spread_seconds=spread, concurrency=concurrency
+    )
+    scheduler.add_profiles(load_all_profiles())
+    exporter = asyncio.ensure_future(_export_metrics_periodically(SCHEDULER_METRICS_INTERVAL_SECONDS))
+    try:
+        await scheduler.run()
+    finally:
+        exporter.cancel()
+        await close_http_client()
+        await flush_memory_service()
+        export_run_metrics(run_name="scheduler")
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Pre-generate every user's podcast ahead of their delivery time."
+    )
+    parser.add_argument(
+        "--lead",
+        type=float,
+        default=SCHEDULER_LEAD_SECONDS,
+        help="Seconds before delivery at which generation starts.",
+    )
+    parser.add_argument(
+        "--spread",
+        type=float,
+        default=SCHEDULER_SPREAD_SECONDS,
+        help="Window (seconds) over which start times are spread to flatten request peaks.",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=SCHEDULER_CONCURRENCY,
+        help="Maximum podcasts generated at once.",
+    )
+
+    args = parser.parse_args(argv)
+    if load_dotenv is not None:
+        load_dotenv()
+
+    try:
+        asyncio.run(_run(args.lead, args.spread, args.concurrency))
+    except KeyboardInterrupt:  # pragma: no cover - interactive convenience
+        return 130
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
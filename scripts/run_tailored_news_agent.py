@@ -17,6 +17,7 @@ try:
 except ImportError:
     load_dotenv = None
 
+from agents.memory_validator import flush_memory_service
 from agents.tailored_news import TailoredNewsAgent
 
 
@@ -68,6 +69,8 @@ async def main() -> None:
                 
     except Exception as e:
         print(f"Error running tailored news agent: {e}")
+    finally:
+        await flush_memory_service()
 
 if __name__ == "__main__":
     asyncio.run(main())
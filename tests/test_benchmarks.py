@@ -0,0 +1,101 @@
+import asyncio
+import json
+import os
+import random
+
+import pytest
+
+import agents.news_core as news_core
+from agents.traffic import TrafficAgent
+from agents.weather import compute_weather_insights
+from benchmarks.fake_llm import FakeLLMBackend, LatencyModel, canned_script
+from benchmarks.stub_servers import StubAPIServer
+from benchmarks.suite import compare_to_baseline, run_suite
+from utils.fetch_tools import fetch_json_sync
+
+CONFIG = {"latency_scale": 0.05, "concurrency": 64, "gathering": "direct", "seed": 0}
+
+
+def _report(**overrides):
+    result = {"users": 100, "failed": 0, "throughput": 20.0, "p50": 1.0, "p95": 2.0, "p99": 3.0}
+    return {"config": dict(CONFIG), "scenarios": {"100_users": {**result, **overrides}}}
+
+
+def test_fake_runner_returns_canned_news_with_usage():
+    backend = FakeLLMBackend(latency_scale=0)
+    runner = backend.runner(agent=type("Agent", (), {"name": "NewsAgent"})())
+
+    events = asyncio.run(runner.run_debug("Find news about: Formula 1"))
+
+    stories = json.loads(events[0].content.parts[0].text)
+    assert len(stories) == 5 and {"id", "headline", "summary", "source"} <= set(stories[0])
+    assert events[0].usage_metadata.prompt_token_count > 0
+    assert backend.calls == {"NewsAgent": 1}
+
+
+def test_canned_script_answers_sectioned_requests_with_json():
+    prompt = 'Here is the collected data. Write these sections of the morning briefing script: weather, outro:\n\n{"user_name":"Ana"}'
+    sections = json.loads(canned_script(prompt))
+    assert set(sections) == {"weather", "outro"}
+
+
+def test_latency_model_is_lognormal_around_the_median():
+    model, rng = LatencyModel(2.0, 0.5), random.Random(1)
+    samples = sorted(model.sample(rng) for _ in range(2001))
+    assert 1.8 < samples[1000] < 2.2
+    assert samples[1900] > 2 * samples[100]
+    assert model.sample(rng, scale=0) == 0.0
+
+
+def test_stub_server_payloads_parse_like_the_real_apis():
+    with StubAPIServer(latency_scale=0) as server:
+        location = {"location.latitude": 37.77, "location.longitude": -122.42, "key": "x"}
+        daily = fetch_json_sync(f"{server.weather_base_url}/forecast/days:lookup", {**location, "days": 1})
+        hourly = fetch_json_sync(f"{server.weather_base_url}/forecast/hours:lookup", {**location, "hours": 24})
+        route = fetch_json_sync(server.directions_url, {"origin": "A", "destination": "B"})
+
+    insights = compute_weather_insights(daily, hourly)
+    assert insights["daily_summary"]["day_condition"] != "Unknown"
+    assert insights["max_temp_time"] is not None
+    assert TrafficAgent()._parse_directions(route)["start_address"] == "A"
+    assert sum(server.requests.values()) == 3
+
+
+def test_compare_flags_slower_percentiles_and_lower_throughput():
+    baseline = _report()
+    assert compare_to_baseline(_report(p95=2.3), baseline) == []
+
+    regressions = compare_to_baseline(_report(p99=4.0, throughput=10.0, failed=2), baseline)
+    assert len(regressions) == 3
+    assert regressions[0].startswith("100_users: p99")
+
+
+def test_compare_refuses_baselines_recorded_with_other_settings():
+    baseline = _report()
+    baseline["config"]["latency_scale"] = 1.0
+    with pytest.raises(ValueError, match="latency_scale"):
+        compare_to_baseline(_report(), baseline)
+
+
+def _snapshot(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def test_suite_runs_the_batch_pipeline_end_to_end():
+    repo_cache = os.path.abspath(news_core.NEWS_CACHE_FILE)
+    before = _snapshot(repo_cache)
+
+    report = run_suite([3], latency_scale=0, concurrency=2)
+
+    # The scenario's news cache was written in its scratch directory and released,
+    # nothing is left to flush stub stories into the repo's cache at exit
+    assert news_core._news_cache is None
+    assert _snapshot(repo_cache) == before
+
+    result = report["scenarios"]["3_users"]
+    assert result["ok"] == 3 and result["failed"] == 0
+    assert result["llm_calls"] > 0 and result["http_requests"] > 0
+    assert result["p50"] <= result["p95"] <= result["p99"]
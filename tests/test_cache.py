@@ -0,0 +1,119 @@
+import os
+import threading
+import time
+
+from utils.cache import DiskTTLCache, KeyedLocks, TTLCache
+
+
+class FakeClock:
+    def __init__(self, now=1_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def test_entries_expire_after_ttl():
+    clock = FakeClock()
+    cache = TTLCache(ttl_seconds=60, clock=clock)
+    cache.set("berlin", ["story"])
+
+    clock.now += 59
+    assert cache.get("berlin") == ["story"]
+
+    clock.now += 2
+    assert cache.get("berlin") is None
+    assert cache.stats()["expirations"] == 1
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = TTLCache(max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")  # "b" is now the least recently used
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+    stats = cache.stats()
+    assert stats["evictions"] == 1
+    assert stats["hits"] == 3
+    assert stats["misses"] == 1
+
+
+def test_disk_cache_survives_restart(tmp_path):
+    path = str(tmp_path / "news_cache.json")
+    clock = FakeClock()
+
+    cache = DiskTTLCache(path, ttl_seconds=60, clock=clock)
+    cache.set("fresh", [{"id": "a"}])
+    cache.set("stale", [{"id": "b"}], ttl_seconds=10)
+    cache.flush()
+
+    clock.now += 30
+    reloaded = DiskTTLCache(path, ttl_seconds=60, clock=clock)
+
+    assert reloaded.get("fresh") == [{"id": "a"}]
+    assert reloaded.get("stale") is None
+
+
+def test_disk_cache_batches_writes_and_keeps_the_lru_order(tmp_path):
+    path = str(tmp_path / "news_cache.json")
+    clock = FakeClock()
+
+    cache = DiskTTLCache(path, max_entries=2, clock=clock, flush_interval=3600)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    assert cache.writes == 0 and not os.path.exists(path)
+
+    cache.flush()
+    cache.flush()
+    assert cache.writes == 1
+
+    # The hit on "a" was saved, so "b" is the one evicted after a restart
+    reloaded = DiskTTLCache(path, max_entries=2, clock=clock, flush_interval=3600)
+    reloaded.set("c", 3)
+    assert reloaded.get("b") is None
+    assert reloaded.get("a") == 1
+
+
+def test_disk_cache_path_is_resolved_when_created(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    cache = DiskTTLCache("db/news_cache.json")
+    cache.set("a", 1)
+
+    # A flush at exit may run after the working directory changed
+    monkeypatch.chdir(tmp_path.parent)
+    cache.flush()
+    assert (tmp_path / "db" / "news_cache.json").exists()
+
+
+def test_disk_cache_writes_changes_once_the_interval_has_passed(tmp_path):
+    cache = DiskTTLCache(str(tmp_path / "news_cache.json"), flush_interval=0)
+    cache.set("a", 1)
+    cache.get("a")
+    assert cache.writes == 2
+
+
+def test_keyed_locks_serialize_a_key_and_are_dropped_after_use():
+    locks = KeyedLocks()
+    active, peak = [], []
+
+    def work():
+        with locks("berlin"):
+            active.append(1)
+            peak.append(len(active))
+            time.sleep(0.01)
+            active.pop()
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert max(peak) == 1
+    assert len(locks) == 0
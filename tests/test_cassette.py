@@ -0,0 +1,153 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import utils.cassette as cassette_module
+import utils.metrics as metrics
+from utils.cassette import Cassette, CassetteMissError, fingerprint, http_request
+from utils.llm import run_agent
+from utils.metrics import MetricsRegistry
+
+
+def _event(text, prompt_tokens=10, completion_tokens=5, function_call=None):
+    part = SimpleNamespace(text=text, thought=False, function_call=function_call, function_response=None)
+    return SimpleNamespace(author="model", partial=False, content=SimpleNamespace(role="model", parts=[part]),
+                           usage_metadata=SimpleNamespace(prompt_token_count=prompt_tokens,
+                                                          candidates_token_count=completion_tokens))
+
+
+class _Runner:
+    def __init__(self, events, tools=()):
+        self.agent = SimpleNamespace(name="NewsAgent", model=SimpleNamespace(model="gemini-x"),
+                                     instruction="List news.", tools=list(tools))
+        self.events = events
+        self.calls = 0
+
+    async def run_debug(self, prompt, **kwargs):
+        self.calls += 1
+        for tool in self.agent.tools:
+            await tool(query="SF")
+        return self.events
+
+
+def _use(monkeypatch, cassette):
+    monkeypatch.setattr(cassette_module, "CASSETTE_MODE", cassette.mode)
+    monkeypatch.setattr(cassette_module, "_cassette", cassette)
+
+
+def _counter(registry, name, **labels):
+    for row in registry.summary()["counters"].get(name, []):
+        if row["labels"] == labels:
+            return row["value"]
+    return 0
+
+
+def test_llm_runs_are_recorded_then_replayed_without_calling_the_model(tmp_path, monkeypatch):
+    registry = MetricsRegistry()
+    monkeypatch.setattr(metrics, "_registry", registry)
+    path = str(tmp_path / "run.jsonl")
+    recorder = Cassette(path, mode="record")
+    _use(monkeypatch, recorder)
+    recording = _Runner([_event('[{"id": "a"}]')])
+    asyncio.run(run_agent(recording, "Find news about: SF", agent="NewsAgent"))
+    recorder.flush()
+
+    _use(monkeypatch, Cassette(path, mode="replay"))
+    replaying = _Runner([])
+    events = asyncio.run(run_agent(replaying, "Find news about: SF", agent="NewsAgent"))
+
+    assert replaying.calls == 0
+    assert events[0].content.parts[0].text == '[{"id": "a"}]'
+    assert events[0].usage_metadata.prompt_token_count == 10
+    # Only the recorded run reached the model
+    assert _counter(registry, "llm_calls_total", agent="NewsAgent") == 1
+    assert _counter(registry, "llm_tokens_total", agent="NewsAgent", kind="prompt") == 10
+    assert _counter(registry, "cassette_replays_total", kind="llm", agent="NewsAgent") == 1
+
+    with pytest.raises(CassetteMissError):
+        asyncio.run(run_agent(replaying, "Find news about: NYC", agent="NewsAgent"))
+
+
+def test_replayed_tool_calls_run_the_tools_again(tmp_path, monkeypatch):
+    seen = []
+
+    async def _wrap_news_tool(query):
+        seen.append(query)
+
+    path = str(tmp_path / "run.jsonl")
+    call = SimpleNamespace(name="_wrap_news_tool", args={"query": "SF"})
+    recorder = Cassette(path, mode="record")
+    _use(monkeypatch, recorder)
+    asyncio.run(run_agent(_Runner([_event(None, function_call=call)], tools=[_wrap_news_tool]), "Go", agent="Manager"))
+    recorder.flush()
+
+    _use(monkeypatch, Cassette(path, mode="replay"))
+    asyncio.run(run_agent(_Runner([], tools=[_wrap_news_tool]), "Go", agent="Manager"))
+
+    assert seen == ["SF", "SF"]
+
+
+def test_http_fingerprint_ignores_api_keys_and_auto_mode_records_misses(tmp_path):
+    assert fingerprint("http", http_request("u", {"q": 1, "key": "a"})) == \
+        fingerprint("http", http_request("u", {"q": "1", "key": "b"}))
+
+    cassette = Cassette(str(tmp_path / "http.jsonl"), mode="auto")
+    calls = []
+    fetch = lambda: calls.append(1) or {"ok": True}
+    request = http_request("https://api/x", {"q": 1})
+
+    assert cassette.call_sync("http", "WeatherAgent", request, fetch) == {"ok": True}
+    assert cassette.call_sync("http", "WeatherAgent", request, fetch) == {"ok": True}
+    assert calls == [1]
+    assert cassette.stats == {"replayed": 1, "recorded": 1, "missed": 0}
+    cassette.flush()
+    assert len(Cassette(str(tmp_path / "http.jsonl"), mode="replay")) == 1
+
+
+def test_streams_replay_with_partial_events(tmp_path):
+    async def _stream():
+        for chunk in ["Good ", "morning."]:
+            yield SimpleNamespace(partial=True, content=SimpleNamespace(role="model", parts=[SimpleNamespace(text=chunk)]))
+
+    async def _collect(cassette):
+        return [e async for e in cassette.stream("llm_stream", "SuperWriter", {"prompt": "p"}, _stream)]
+
+    path = str(tmp_path / "stream.jsonl")
+    recorder = Cassette(path, mode="record")
+    asyncio.run(_collect(recorder))
+    recorder.flush()
+    replayed = asyncio.run(_collect(Cassette(path, mode="replay", latency="real")))
+
+    assert [(e.partial, e.content.parts[0].text) for e in replayed] == [(True, "Good "), (True, "morning.")]
+
+
+def test_agent_matching_serves_the_agents_recordings_in_turn(tmp_path):
+    path = str(tmp_path / "run.jsonl")
+    recorder = Cassette(path, mode="record")
+    for answer in ("one", "two"):
+        recorder.call_sync("llm", "SuperWriter", {"prompt": answer}, lambda answer=answer: answer)
+    recorder.flush()
+
+    cassette = Cassette(path, mode="replay", match="agent")
+    fallback = [cassette.call_sync("llm", "SuperWriter", {"prompt": "new"}, lambda: "live") for _ in range(3)]
+
+    assert fallback == ["one", "two", "one"]
+    with pytest.raises(CassetteMissError):
+        cassette.call_sync("http", "SuperWriter", {"url": "x"}, lambda: "live")
+
+
+def test_recordings_are_written_in_batches_and_replace_the_old_cassette(tmp_path):
+    path = tmp_path / "http.jsonl"
+    path.write_text('{"key": "old"}\n', encoding="utf-8")
+
+    cassette = Cassette(str(path), mode="record", flush_every=2)
+    cassette.call_sync("http", "WeatherAgent", {"url": "a"}, lambda: 1)
+    assert path.read_text(encoding="utf-8") == '{"key": "old"}\n'
+
+    cassette.call_sync("http", "WeatherAgent", {"url": "b"}, lambda: 2)
+    cassette.call_sync("http", "WeatherAgent", {"url": "c"}, lambda: 3)
+    assert len(path.read_text(encoding="utf-8").splitlines()) == 2
+
+    cassette.flush()
+    assert len(Cassette(str(path), mode="replay")) == 3
@@ -0,0 +1,64 @@
+import asyncio
+import logging
+
+import aiohttp
+import pytest
+
+import utils.fetch_tools as fetch_tools
+from benchmarks.stub_servers import StubAPIServer, daily_forecast, directions
+from utils.fetch_tools import close_http_client, fetch_json
+
+
+@pytest.fixture
+def server():
+    with StubAPIServer(latency_scale=0) as server:
+        yield server
+    fetch_tools._http_client = None
+    fetch_tools._http_client_loop = None
+
+
+def test_fetch_json_reuses_one_client_per_loop(server):
+    async def main():
+        first = await fetch_json(server.directions_url, {"origin": "a", "destination": "b"})
+        client = fetch_tools.get_http_client()
+        second = await fetch_json(f"{server.weather_base_url}/forecast/days:lookup",
+                                  {"location.latitude": 1.5, "location.longitude": 2.5})
+        assert fetch_tools.get_http_client() is client
+        await close_http_client()
+        return first, second, client
+
+    first, second, client = asyncio.run(main())
+    assert first == directions("a", "b")
+    assert second == daily_forecast(1.5, 2.5)
+    assert client.closed
+
+
+def test_fetch_json_raises_on_http_errors(server):
+    async def main():
+        try:
+            await fetch_json(f"{server.base_url}/missing")
+        finally:
+            await close_http_client()
+
+    with pytest.raises(aiohttp.ClientResponseError):
+        asyncio.run(main())
+
+
+def test_a_client_left_open_by_an_earlier_loop_is_closed(server, caplog, recwarn):
+    async def fetch():
+        return await fetch_json(server.directions_url, {"origin": "a", "destination": "b"})
+
+    # The first loop ends without close_http_client()
+    asyncio.run(fetch())
+    stale = fetch_tools._http_client
+
+    async def main():
+        await fetch()
+        await close_http_client()
+
+    with caplog.at_level(logging.WARNING, logger="utils.fetch_tools"):
+        asyncio.run(main())
+
+    assert stale.closed
+    assert "left open by another event loop" in caplog.text
+    assert not [w for w in recwarn if issubclass(w.category, ResourceWarning)]
@@ -0,0 +1,69 @@
+import asyncio
+
+import pytest
+
+import main
+
+
+@pytest.mark.parametrize("flags", [["--stream"], ["--audio", "podcast.wav"], ["--refresh"]])
+def test_single_user_options_are_rejected_in_batch_mode(flags, monkeypatch, capsys):
+    monkeypatch.setattr(main, "run_batch", lambda *args: pytest.fail("batch mode should not start"))
+
+    with pytest.raises(SystemExit) as exit_info:
+        main.cli(["--batch", *flags])
+
+    assert exit_info.value.code == 2
+    assert f"{flags[0]} cannot be combined with --batch" in capsys.readouterr().err
+
+
+def test_percentile_uses_the_nearest_rank():
+    assert main._percentile([], 95) == 0.0
+    assert main._percentile([3.0], 50) == main._percentile([3.0], 95) == 3.0
+    values = [float(v) for v in range(20, 0, -1)]
+    assert main._percentile(values, 50) == 10.0
+    assert main._percentile(values, 95) == 19.0
+
+
+@pytest.mark.asyncio
+async def test_batch_isolates_failures_and_bounds_concurrency(monkeypatch, capsys):
+    running = []
+    peak = 0
+
+    async def run_user_pipeline(user_id, profile, gathering_mode):
+        nonlocal peak
+        running.append(user_id)
+        peak = max(peak, len(running))
+        await asyncio.sleep(0.01)
+        running.remove(user_id)
+        if user_id == "bob":
+            raise RuntimeError("feed down")
+        return f"script for {user_id}"
+
+    monkeypatch.setattr(main, "run_user_pipeline", run_user_pipeline)
+    monkeypatch.setattr(main, "export_run_metrics", lambda **kwargs: None)
+    profiles = {user_id: {} for user_id in ("alice", "bob", "carol", "dave", "erin")}
+
+    results = await main.run_batch(concurrency=2, profiles=profiles)
+
+    assert peak == 2
+    assert results["bob"]["ok"] is False and results["bob"]["error"] == "feed down"
+    assert {user_id: r["script"] for user_id, r in results.items() if r["ok"]} == {
+        user_id: f"script for {user_id}" for user_id in ("alice", "carol", "dave", "erin")
+    }
+    assert all(r["latency"] > 0 for r in results.values())
+    out = capsys.readouterr().out
+    assert "Users:       5 (4 ok, 1 failed)" in out
+    assert "Failed users: bob" in out
+
+
+@pytest.mark.parametrize("latencies, p50, p95", [([], "0.00", "0.00"), ([1.5], "1.50", "1.50"), ([1.0, 2.0, 4.0], "2.00", "4.00")])
+def test_batch_summary_reports_latency_percentiles(latencies, p50, p95, capsys):
+    results = {f"user{i}": {"ok": True, "latency": latency} for i, latency in enumerate(latencies)}
+
+    main._print_batch_summary(results, elapsed=2.0)
+
+    out = capsys.readouterr().out
+    assert f"Users:       {len(latencies)} ({len(latencies)} ok, 0 failed)" in out
+    assert f"Latency p50: {p50}s" in out
+    assert f"Latency p95: {p95}s" in out
+    assert "Failed users" not in out
@@ -0,0 +1,97 @@
+import asyncio
+
+import pytest
+
+import agents.manager as manager
+from agents.manager import ManagerAgent
+from utils.session import InMemorySessionService, KEY_NEWS_DATA, KEY_TRAFFIC_DATA, KEY_WEATHER_DATA
+
+
+def _manager(mode="direct"):
+    session = InMemorySessionService()
+    session.initialize_user_context({"name": "Alex", "location": {"city": "San Francisco"}}, user_id="user_123")
+    return ManagerAgent(session, mode=mode)
+
+
+def _stub_sources(monkeypatch, started):
+    """Every source waits until all four have started; weather is slow and traffic raises."""
+    everyone = asyncio.Event()
+
+    async def start(source):
+        started.append(source)
+        if len(started) == 4:
+            everyone.set()
+        await asyncio.wait_for(everyone.wait(), timeout=1)
+
+    async def news(self, query):
+        await start("news")
+        self.session.state[KEY_NEWS_DATA].append({"query": query, "result": [{"headline": "A"}]})
+        return "news saved"
+
+    async def tailored_news(self):
+        await start("tailored_news")
+        self.session.state[KEY_NEWS_DATA].append({"query": "Interest: AI", "result": [{"headline": "B"}]})
+        return "tailored news saved"
+
+    async def weather(self):
+        await start("weather")
+        await asyncio.sleep(0.05)
+        self.session.state[KEY_WEATHER_DATA] = {"summary": "Sunny"}
+        return "weather saved"
+
+    async def traffic(self):
+        await start("traffic")
+        raise RuntimeError("maps down")
+
+    monkeypatch.setattr(ManagerAgent, "_wrap_news_tool", news)
+    monkeypatch.setattr(ManagerAgent, "_wrap_tailored_news_tool", tailored_news)
+    monkeypatch.setattr(ManagerAgent, "_wrap_weather_tool", weather)
+    monkeypatch.setattr(ManagerAgent, "_wrap_traffic_tool", traffic)
+
+
+@pytest.mark.asyncio
+async def test_direct_mode_starts_every_source_at_once_and_isolates_failures(monkeypatch):
+    started = []
+    _stub_sources(monkeypatch, started)
+    agent = _manager()
+
+    await agent.execute_gathering_async()
+
+    assert sorted(started) == ["news", "tailored_news", "traffic", "weather"]
+    state = agent.session.state
+    assert [item["query"] for item in state[KEY_NEWS_DATA]] == ["San Francisco", "Interest: AI"]
+    assert state[KEY_WEATHER_DATA] == {"summary": "Sunny"}
+    assert state.get(KEY_TRAFFIC_DATA) is None
+
+
+@pytest.fixture
+def cleanups(monkeypatch):
+    calls = []
+
+    async def close_http_client():
+        calls.append("http")
+
+    async def flush_memory_service():
+        calls.append("memory")
+
+    monkeypatch.setattr(manager, "close_http_client", close_http_client)
+    monkeypatch.setattr(manager, "flush_memory_service", flush_memory_service)
+    return calls
+
+
+def test_execute_gathering_cleans_up_after_its_own_loop(monkeypatch, cleanups):
+    _stub_sources(monkeypatch, [])
+
+    assert _manager().execute_gathering() is None
+    assert cleanups == ["http", "memory"]
+
+
+@pytest.mark.asyncio
+async def test_execute_gathering_in_a_running_loop_cleans_up_too(monkeypatch, cleanups):
+    _stub_sources(monkeypatch, [])
+    agent = _manager()
+
+    await agent.execute_gathering()
+
+    assert agent.session.state[KEY_WEATHER_DATA] == {"summary": "Sunny"}
+    assert cleanups == ["http", "memory"]
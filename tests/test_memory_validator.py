@@ -1 +1,203 @@
 # Tests for memory validator agent
+import asyncio
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from agents.memory_validator import MemoryValidator, MemoryValidatorService
+from db.memory_store import GLOBAL_PARTITION, SQLiteMemoryStore, create_memory_store
+
+
+def _item(item_id, headline=None):
+    return {
+        "id": item_id,
+        "headline": headline or f"{item_id} headline",
+        "summary": f"Details about {item_id} only.",
+        "source": "Source",
+    }
+
+
+@pytest.fixture(params=["sqlite", "json"])
+def validator(request, tmp_path):
+    return MemoryValidator(log_file=str(tmp_path / "memory_log.json"), backend=request.param)
+
+
+def test_duplicates_are_filtered_within_and_across_batches(validator):
+    first = validator.validate_and_log([_item("a"), _item("b"), _item("a")])
+    second = validator.validate_and_log([_item("b"), _item("c")])
+
+    assert [i["id"] for i in first] == ["a", "b"]
+    assert [i["id"] for i in second] == ["c"]
+
+
+def test_items_without_id_are_deduplicated_by_content(validator):
+    items = [{"headline": "No id"}, {"headline": "No id"}]
+    assert validator.validate_and_log(items) == items[:1]
+
+
+def test_near_duplicate_stories_with_different_ids_are_filtered(validator):
+    summary = ("The city council approved a new budget on Tuesday that adds 40 million dollars "
+               "for public transit, expands bike lanes and funds two new libraries downtown.")
+    first = dict(_item("council-budget-approved", "Council approves new city budget"), summary=summary)
+    reworded = dict(_item("city-budget-passes", "City council approves new budget"),
+                    summary=summary + " The vote was 7 to 2.")
+    unrelated = dict(_item("storm-warning"), summary="A storm warning was issued for the coast tonight.")
+
+    validator.validate_and_log([first])
+    kept = validator.validate_and_log([reworded, unrelated])
+
+    assert [i["id"] for i in kept] == ["storm-warning"]
+
+
+def test_near_duplicate_index_persists_next_to_log(tmp_path):
+    log_file = str(tmp_path / "memory_log.json")
+    story = dict(_item("a", "Rocket launch delayed by weather"),
+                 summary="The launch was pushed back two days after high winds at the pad.")
+    validator = MemoryValidator(log_file=log_file)
+    validator.validate_and_log([story])
+    # Saved on flush, not on every batch
+    assert not (tmp_path / "memory_log.minhash.json").exists()
+    validator.flush()
+
+    reloaded = MemoryValidator(log_file=log_file)
+    assert (tmp_path / "memory_log.minhash.json").exists()
+    assert reloaded.validate_and_log([dict(story, id="b")]) == []
+
+
+def test_entries_older_than_retention_are_pruned(validator):
+    old = (datetime.now() - timedelta(days=8)).isoformat()
+    validator.store.add(GLOBAL_PARTITION, [dict(_item("old"), timestamp=old)])
+
+    assert [i["id"] for i in validator.validate_and_log([_item("old")])] == ["old"]
+
+
+def test_sqlite_store_imports_existing_json_log(tmp_path):
+    log_file = tmp_path / "memory_log.json"
+    recent = datetime.now().isoformat()
+    log_file.write_text(json.dumps({"recent_topics": [dict(_item("seen"), timestamp=recent)]}))
+
+    store = create_memory_store(str(log_file), backend="sqlite")
+
+    assert isinstance(store, SQLiteMemoryStore)
+    assert store.existing_ids(GLOBAL_PARTITION, ["seen", "new"]) == {"seen"}
+
+
+def test_sqlite_store_prunes_and_trims_without_delete_returning(tmp_path):
+    store = SQLiteMemoryStore(str(tmp_path / "memory_log.sqlite3"))
+    statements = []
+    store._conn.set_trace_callback(statements.append)
+    now = datetime.now()
+    store.add("alice", [dict(_item(f"s{n}"), timestamp=(now - timedelta(days=n)).isoformat()) for n in range(5)])
+    store.add("bob", [dict(_item("s4"), timestamp=(now - timedelta(days=4)).isoformat())])
+
+    assert sorted(store.prune("alice", now - timedelta(days=3))) == ["s3", "s4"]
+    assert sorted(store.trim("alice", 1)) == ["s1", "s2"]
+    assert store.existing_ids("alice", ["s0", "s1", "s2"]) == {"s0"}
+    assert store.existing_ids("bob", ["s4"]) == {"s4"}
+    # RETURNING needs SQLite 3.35+
+    assert not any("RETURNING" in statement.upper() for statement in statements)
+
+
+def test_shared_service_keeps_entries_from_parallel_runs(tmp_path):
+    service = MemoryValidatorService(log_file=str(tmp_path / "memory_log.json"), backend="sqlite",
+                                     flush_every=1000, flush_interval=3600)
+
+    async def run():
+        batches = [[_item("shared"), _item(f"own-{n}")] for n in range(5)]
+        results = await asyncio.gather(*(service.validate_and_log(b) for b in batches))
+        await service.flush()
+        return results
+
+    results = asyncio.run(run())
+
+    kept = [item["id"] for batch in results for item in batch]
+    assert kept.count("shared") == 1
+    assert service.store.existing_ids(GLOBAL_PARTITION, kept) == set(kept)
+
+
+def test_shared_service_writes_in_batches(tmp_path):
+    service = MemoryValidatorService(log_file=str(tmp_path / "memory_log.json"), backend="sqlite",
+                                     flush_every=3, flush_interval=3600)
+
+    async def run():
+        await service.validate_and_log([_item("a"), _item("b")])
+        assert service.store.existing_ids(GLOBAL_PARTITION, ["a", "b"]) == set()
+        await service.validate_and_log([_item("c")])
+
+    asyncio.run(run())
+    assert service.store.existing_ids(GLOBAL_PARTITION, ["a", "b", "c"]) == {"a", "b", "c"}
+
+
+def test_users_have_separate_partitions(tmp_path):
+    service = MemoryValidatorService(log_file=str(tmp_path / "memory_log.json"), backend="sqlite")
+
+    async def run():
+        alice = await service.validate_and_log([_item("story")], partition="alice")
+        bob = await service.validate_and_log([_item("story")], partition="bob")
+        alice_again = await service.validate_and_log([_item("story")], partition="alice")
+        return alice, bob, alice_again
+
+    alice, bob, alice_again = asyncio.run(run())
+    assert [i["id"] for i in alice] == ["story"]
+    assert [i["id"] for i in bob] == ["story"]
+    assert alice_again == []
+
+
+def test_partition_size_is_capped(validator):
+    validator.max_entries = 2
+    for n in range(4):
+        validator.validate_and_log([_item(f"story-{n}")])
+
+    assert validator.store.existing_ids(GLOBAL_PARTITION, [f"story-{n}" for n in range(4)]) == {"story-2", "story-3"}
+
+
+def test_failed_flush_keeps_pending_entries(tmp_path, monkeypatch):
+    service = MemoryValidatorService(log_file=str(tmp_path / "memory_log.json"), backend="sqlite",
+                                     flush_every=1000, flush_interval=3600)
+    real_add = service.store.add
+
+    def locked(partition, entries):
+        raise RuntimeError("database is locked")
+
+    async def run():
+        await service.validate_and_log([_item("a"), _item("b")])
+        monkeypatch.setattr(service.store, "add", locked)
+        await service.flush()
+        monkeypatch.setattr(service.store, "add", real_add)
+        await service.flush()
+
+    asyncio.run(run())
+    assert service.store.existing_ids(GLOBAL_PARTITION, ["a", "b"]) == {"a", "b"}
+
+
+def test_least_recently_used_partitions_are_written_and_dropped(tmp_path):
+    service = MemoryValidatorService(log_file=str(tmp_path / "memory_log.json"), backend="sqlite",
+                                     flush_every=1000, flush_interval=3600, max_partitions=2)
+
+    async def run():
+        for user in ("alice", "bob", "carol"):
+            await service.validate_and_log([_item("story")], partition=user)
+        return await service.validate_and_log([_item("story")], partition="alice")
+
+    alice_again = asyncio.run(run())
+
+    assert list(service._partitions) == ["carol", "alice"]
+    # Evicted partitions keep their memory in the store
+    assert alice_again == []
+    assert service.store.existing_ids("bob", ["story"]) == {"story"}
+
+
+def test_evicted_partitions_are_unloaded_from_the_json_store(tmp_path):
+    service = MemoryValidatorService(log_file=str(tmp_path / "memory_log.json"), backend="json",
+                                     flush_every=1000, flush_interval=3600, max_partitions=2)
+
+    async def run():
+        for user in ("alice", "bob", "carol"):
+            await service.validate_and_log([_item(f"{user}-story")], partition=user)
+
+    asyncio.run(run())
+
+    assert sorted(service.store._docs) == ["bob", "carol"]
+    # Read back from its file on next use
+    assert service.store.existing_ids("alice", ["alice-story"]) == {"alice-story"}
@@ -0,0 +1,86 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+import utils.metrics as metrics
+from utils.cache import TTLCache
+from utils.llm import run_agent
+from utils.metrics import MetricsRegistry, export_run_metrics
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    """A fresh registry in place of the process-wide one, so counts are exact."""
+    registry = MetricsRegistry()
+    monkeypatch.setattr(metrics, "_registry", registry)
+    return registry
+
+
+def _counter(registry, name, **labels):
+    for row in registry.summary()["counters"].get(name, []):
+        if row["labels"] == {k: str(v) for k, v in labels.items()}:
+            return row["value"]
+    return 0
+
+
+def test_track_records_latency_and_errors():
+    registry = MetricsRegistry()
+    with registry.track("WeatherAgent", "http_fetch"):
+        pass
+    with pytest.raises(TimeoutError):
+        with registry.track("WeatherAgent", "http_fetch"):
+            raise TimeoutError()
+
+    [latency] = registry.summary()["histograms"]["pipeline_operation_seconds"]
+    assert latency["labels"] == {"agent": "WeatherAgent", "operation": "http_fetch"}
+    assert latency["count"] == 2
+    assert _counter(registry, "pipeline_errors_total",
+                    agent="WeatherAgent", operation="http_fetch", error="TimeoutError") == 1
+
+
+def test_histogram_quantiles_and_prometheus_text():
+    registry = MetricsRegistry()
+    for value in [0.02] * 90 + [3.0] * 10:
+        registry.observe("latency_seconds", value, agent='News"Agent')
+
+    [row] = registry.summary()["histograms"]["latency_seconds"]
+    assert 0.01 < row["p50"] <= 0.025
+    assert 2.5 < row["p95"] <= 3.0
+
+    text = registry.to_prometheus()
+    assert '# TYPE latency_seconds histogram' in text
+    assert 'latency_seconds_bucket{agent="News\\"Agent",le="0.025"} 90' in text
+    assert 'latency_seconds_bucket{agent="News\\"Agent",le="+Inf"} 100' in text
+    assert 'latency_seconds_count{agent="News\\"Agent"} 100' in text
+
+
+@pytest.mark.asyncio
+async def test_run_agent_counts_tokens(registry):
+    usage = SimpleNamespace(prompt_token_count=120, candidates_token_count=30)
+
+    class _Runner:
+        async def run_debug(self, prompt, **kwargs):
+            return [SimpleNamespace(usage_metadata=usage, partial=False), SimpleNamespace(usage_metadata=None)]
+
+    await run_agent(_Runner(), "hi", agent="TestAgent")
+
+    assert _counter(registry, "llm_calls_total", agent="TestAgent") == 1
+    assert _counter(registry, "llm_tokens_total", agent="TestAgent", kind="prompt") == 120
+    assert _counter(registry, "llm_tokens_total", agent="TestAgent", kind="completion") == 30
+
+
+def test_named_caches_report_lookups(registry, tmp_path):
+    cache = TTLCache(name="test_cache")
+    cache.set("k", 1)
+    cache.get("k")
+    cache.get("missing")
+    cache.get("missing")
+
+    assert _counter(registry, "cache_lookups_total", cache="test_cache", result="hit") == 1
+    assert _counter(registry, "cache_lookups_total", cache="test_cache", result="miss") == 2
+
+    summary = export_run_metrics(str(tmp_path), run_name="test")
+    assert (tmp_path / "metrics.prom").read_text().startswith("# ")
+    [json_file] = tmp_path.glob("test-*.json")
+    assert json.loads(json_file.read_text())["counters"] == summary["counters"]
@@ -64,12 +64,12 @@ def test_create_news_agent_wires_llm_agent(monkeypatch):
     agent = NewsAgent()
     created_models = []
 
-    def fake_gemini(*, model, retry_options):
-        payload = SimpleNamespace(model=model, retry_options=retry_options)
+    def fake_gemini(*, model, retry_options, agent_name):
+        payload = SimpleNamespace(model=model, retry_options=retry_options, agent_name=agent_name)
         created_models.append(payload)
         return payload
 
-    monkeypatch.setattr(news_core, "Gemini", fake_gemini)
+    monkeypatch.setattr(news_core, "RateLimitedGemini", fake_gemini)
 
     created_agents = []
 
@@ -84,6 +84,7 @@ def test_create_news_agent_wires_llm_agent(monkeypatch):
     assert created_models, "Gemini should be instantiated"
     assert created_models[0].model == "gemini-2.5-flash-lite"
     assert created_models[0].retry_options is news_core.retry_config
+    assert created_models[0].agent_name == "NewsAgent"
 
     assert created_agents, "LlmAgent should be instantiated"
     call_kwargs = created_agents[0]
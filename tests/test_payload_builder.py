@@ -0,0 +1,69 @@
+import json
+
+from agents.payload_builder import build_writer_payload, estimate_tokens, parse_time_limit, rank_stories
+
+LONG_SUMMARY = "First sentence here. Second sentence here. " + "Filler sentence for length. " * 20
+
+
+def _story(story_id, headline, queries, summary=LONG_SUMMARY):
+    return {"id": story_id, "headline": headline, "summary": summary, "source": "Wire", "queries": queries}
+
+
+def _payload(stories):
+    return {
+        "user_name": "Alex",
+        "location": {"city": "San Francisco", "country": "USA", "coordinates": {"lat": 37.7, "lon": -122.4}},
+        "interests": ["NVIDIA Stock Performance"],
+        "tone": ["Sarcastic"],
+        "news": stories,
+        "weather": {"summary": "Sunny"},
+        "traffic": {"duration": "45 mins"},
+    }
+
+
+def test_parse_time_limit():
+    assert parse_time_limit("5 minutes") == 300
+    assert parse_time_limit("90 seconds") == 90
+    assert parse_time_limit("1 hour") == 3600
+    assert parse_time_limit(2) == 120
+    assert parse_time_limit(None) == 300
+
+
+def test_interest_stories_rank_first():
+    stories = [
+        _story("local", "City council meets", ["San Francisco, USA"]),
+        _story("nvda", "Nvidia stock climbs", ["Interest: NVIDIA Stock Performance"]),
+    ]
+
+    ranked = rank_stories(stories, ["NVIDIA Stock Performance"])
+
+    assert [s["id"] for s in ranked] == ["nvda", "local"]
+
+
+def test_budget_trims_then_drops_lowest_ranked_stories():
+    stories = [_story(f"local-{i}", f"Local story {i}", ["San Francisco, USA"]) for i in range(10)]
+    stories.append(_story("nvda", "Nvidia stock climbs", ["Interest: NVIDIA Stock Performance"]))
+    payload = _payload(stories)
+
+    payload_json, report = build_writer_payload(payload, time_limit="1 minute", budget_tokens=700)
+    sent = json.loads(payload_json)
+
+    assert report["tokens_after"] <= 700 < report["tokens_before"]
+    assert report["stories_kept"] + report["stories_dropped"] == 11
+    assert report["stories_dropped"] > 0 and report["stories_trimmed"] > 0
+    assert sent["news"][0]["headline"] == "Nvidia stock climbs"
+    assert sent["news"][-1]["summary"] == "First sentence here. Second sentence here."
+    # Non-news context is always kept, in compact form
+    assert sent["location"] == "San Francisco, USA"
+    assert sent["time_limit"] == "1 minute"
+    assert sent["weather"] == {"summary": "Sunny"}
+    assert estimate_tokens(payload_json) == report["tokens_after"]
+
+
+def test_everything_fits_within_a_generous_budget():
+    payload = _payload([_story("nvda", "Nvidia stock climbs", ["Interest: NVIDIA Stock Performance"])])
+
+    _, report = build_writer_payload(payload, time_limit="10 minutes")
+
+    assert report["stories_kept"] == 1
+    assert report["stories_trimmed"] == report["stories_dropped"] == 0
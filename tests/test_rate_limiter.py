@@ -0,0 +1,200 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import utils.metrics as metrics
+import utils.rate_limiter as rate_limiter
+from utils.metrics import MetricsRegistry
+from utils.rate_limiter import ModelLimiter, clear_rate_limiters, is_rate_limit_error, retry_hint, runner_model
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class RateLimited(Exception):
+    code = 429
+
+
+def test_rate_limit_errors_are_recognised_by_code_or_message():
+    assert is_rate_limit_error(RateLimited("quota"))
+    assert is_rate_limit_error(RuntimeError("Fake LLM error (503 UNAVAILABLE)"))
+    assert is_rate_limit_error(RuntimeError("RESOURCE_EXHAUSTED"))
+    assert not is_rate_limit_error(ValueError("bad JSON at 4290"))
+    assert retry_hint(RuntimeError("429 Quota exceeded. Please retry in 17.5s.")) == 17.5
+    assert retry_hint(RuntimeError("{'retryDelay': '3s'}")) == 3.0
+    assert retry_hint(RuntimeError("429")) is None
+
+
+def test_runner_model_reads_the_agents_model():
+    assert runner_model(SimpleNamespace(agent=SimpleNamespace(model=SimpleNamespace(model="gemini-x")))) == "gemini-x"
+    assert runner_model(SimpleNamespace(agent=SimpleNamespace(model="gemini-y"))) == "gemini-y"
+    assert runner_model(SimpleNamespace()) == "default"
+
+
+def test_limit_grows_on_success_and_halves_once_per_round_of_rate_limits():
+    clock = _Clock()
+    limiter = ModelLimiter("m", rpm=0, initial_concurrency=4, max_concurrency=16, backoff=2, clock=clock)
+
+    # Slow start: +1 per success until the first rate limit
+    for _ in range(4):
+        limiter.record_success()
+    assert limiter.limit == 8
+
+    started = clock.now
+    clock.now += 1
+    assert limiter.record_rate_limit(started) == 2
+    assert limiter.limit == 4
+    # Another call from the same round is counted, but does not shrink the limit again
+    assert limiter.record_rate_limit(started) == 4
+    assert limiter.limit == 4
+    assert limiter.stats["rate_limited"] == 2 and limiter.stats["decreases"] == 1
+
+    # Congestion avoidance: about +1 per `limit` successes
+    for _ in range(4):
+        limiter.record_success()
+    assert 4.9 < limiter.limit < 5.0
+
+
+def test_limit_stays_within_bounds():
+    clock = _Clock()
+    limiter = ModelLimiter("m", rpm=0, initial_concurrency=2, min_concurrency=1, max_concurrency=3, clock=clock)
+    for _ in range(10):
+        limiter.record_success()
+    assert limiter.limit == 3
+    for _ in range(5):
+        clock.now += 1
+        limiter.record_rate_limit(clock.now)
+    assert limiter.limit == 1
+
+
+def test_calls_queue_behind_the_concurrency_limit():
+    limiter = ModelLimiter("m", rpm=0, initial_concurrency=2, max_concurrency=2)
+    peak = 0
+
+    async def call():
+        nonlocal peak
+        peak = max(peak, limiter.in_flight)
+        await asyncio.sleep(0.02)
+        return "ok"
+
+    async def main():
+        return await asyncio.gather(*(limiter.run(call, agent="A") for _ in range(6)))
+
+    assert asyncio.run(main()) == ["ok"] * 6
+    assert peak == 2
+    assert limiter.in_flight == 0
+    assert limiter.stats["acquired"] == 6
+    assert limiter.stats["max_queue_seconds"] >= 0.03
+
+
+def test_token_bucket_spaces_out_requests():
+    # 600 rpm = 10/s with a burst of 10
+    limiter = ModelLimiter("m", rpm=600, initial_concurrency=64, max_concurrency=64)
+
+    async def main():
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        for _ in range(12):
+            await limiter.acquire()
+            limiter.release(started)
+        return loop.time() - started
+
+    assert asyncio.run(main()) >= 0.15
+
+
+def test_rate_limited_calls_are_retried_after_the_pause():
+    limiter = ModelLimiter("m", rpm=0, initial_concurrency=4, backoff=0.05)
+    attempts = []
+
+    async def call():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise RateLimited("429 RESOURCE_EXHAUSTED")
+        return "ok"
+
+    assert asyncio.run(limiter.run(call, retries=2)) == "ok"
+    assert len(attempts) == 2
+    # Halved to 2, then +1/2 for the successful retry
+    assert limiter.limit == 2.5
+    assert limiter.stats["retries"] == 1
+
+
+def test_other_errors_are_not_retried():
+    limiter = ModelLimiter("m", rpm=0)
+
+    async def call():
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError):
+        asyncio.run(limiter.run(call))
+    assert limiter.in_flight == 0
+    assert limiter.stats["decreases"] == 0
+
+
+def _stub_model(agent_name, fail_first=True):
+    """A RateLimitedGemini whose client answers two responses per request; the first request answers 429."""
+    from utils.fetch_tools import RateLimitedGemini
+
+    requests = []
+
+    class _Client(RateLimitedGemini.__bases__[0]):
+        async def generate_content_async(self, llm_request, stream=False):
+            requests.append(stream)
+            if fail_first and len(requests) == 1:
+                raise RateLimited("quota")
+            for text in ("a", "b"):
+                yield SimpleNamespace(text=text)
+
+    # The client sits between RateLimitedGemini and Gemini, where the real request is made
+    class _Model(RateLimitedGemini, _Client):
+        pass
+
+    return _Model(model="test-model", agent_name=agent_name), requests
+
+
+def _collect(model, limiter, stream=False):
+    """The responses, each with the limiter's in-flight count when the agent receives it."""
+    async def collect():
+        return [(response.text, limiter.in_flight) async for response in model.generate_content_async(None, stream=stream)]
+
+    return asyncio.run(collect())
+
+
+def test_each_model_request_is_limited_and_retried_on_its_own(monkeypatch):
+    registry = MetricsRegistry()
+    monkeypatch.setattr(metrics, "_registry", registry)
+    limiter = ModelLimiter("test-model", rpm=0, backoff=0.01)
+    monkeypatch.setitem(rate_limiter._limiters, "test-model", limiter)
+    model, requests = _stub_model("NewsAgent")
+
+    responses = _collect(model, limiter)
+
+    assert requests == [False, False]
+    # Made inside the slot, handed to the agent (which may run tools) after it is released
+    assert responses == [("a", 0), ("b", 0)]
+    assert limiter.stats["retries"] == 1
+    retries = registry.summary()["counters"]["pipeline_retries_total"]
+    assert [row["value"] for row in retries if row["labels"] == {"agent": "NewsAgent", "operation": "llm_request"}] == [1]
+
+
+def test_a_streamed_model_request_holds_its_slot_and_is_not_retried(monkeypatch):
+    limiter = ModelLimiter("test-model", rpm=0, backoff=0.01)
+    monkeypatch.setitem(rate_limiter._limiters, "test-model", limiter)
+    model, _ = _stub_model("SuperWriterAgent", fail_first=False)
+
+    assert _collect(model, limiter, stream=True) == [("a", 1), ("b", 1)]
+    assert limiter.in_flight == 0
+
+    model, requests = _stub_model("SuperWriterAgent")
+    with pytest.raises(RateLimited):
+        _collect(model, limiter, stream=True)
+    assert requests == [True]
+    assert limiter.in_flight == 0
+    assert limiter.stats["retries"] == 0
+
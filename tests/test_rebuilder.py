@@ -0,0 +1,132 @@
+import pytest
+
+from agents.manager import ManagerAgent
+from agents.rebuilder import PodcastRebuilder, merge_news
+from agents.summarizer import SuperWriterAgent
+from utils.session import InMemorySessionService, KEY_NEWS_DATA, KEY_TRAFFIC_DATA, KEY_WEATHER_DATA
+
+PROFILE = {"name": "Alex", "tone_preference": ["Sarcastic"], "time_limit": "5 minutes"}
+
+
+class FakeWorld:
+    """Serves the current data for each source and records fetches and rewrites."""
+
+    def __init__(self, monkeypatch):
+        self.now = 1_000_000.0
+        self.data = {
+            "news": [{"query": "SF", "result": [{"id": "a", "headline": "A", "summary": "a"}]}],
+            "weather": {"summary": "Sunny"},
+            "traffic": {"duration": "40 mins"},
+        }
+        self.fetched = []
+        self.written = []
+        world = self
+        keys = {"news": KEY_NEWS_DATA, "weather": KEY_WEATHER_DATA, "traffic": KEY_TRAFFIC_DATA}
+
+        async def gather_sources(manager, sources):
+            world.fetched.append(list(sources))
+            for source in sources:
+                manager.session.state[keys[source]] = world.data[source]
+
+        async def generate_sections_async(writer, sections, previous_sections=None):
+            world.written.append(list(sections))
+            return {section: f"{section} v{len(world.written)}" for section in sections}
+
+        monkeypatch.setattr(ManagerAgent, "gather_sources", gather_sources)
+        monkeypatch.setattr(SuperWriterAgent, "generate_sections_async", generate_sections_async)
+
+    async def rebuild(self, state_dir, profile=PROFILE):
+        session = InMemorySessionService()
+        session.initialize_user_context(profile, user_id="user_123")
+        self.last_session = session
+        return await PodcastRebuilder(session, state_dir=str(state_dir), clock=lambda: self.now).rebuild_async()
+
+
+@pytest.mark.asyncio
+async def test_first_build_fetches_and_writes_everything(monkeypatch, tmp_path):
+    world = FakeWorld(monkeypatch)
+
+    result = await world.rebuild(tmp_path)
+
+    assert world.fetched == [["news", "weather", "traffic"]]
+    assert result["rewritten"] == ["intro", "weather", "traffic", "news", "outro"]
+    assert result["script"] == "intro v1\n\nweather v1\n\ntraffic v1\n\nnews v1\n\noutro v1"
+
+
+@pytest.mark.asyncio
+async def test_rebuild_refetches_expired_inputs_and_rewrites_only_changed_sections(monkeypatch, tmp_path):
+    world = FakeWorld(monkeypatch)
+    await world.rebuild(tmp_path)
+
+    # Ten minutes later only traffic (5 min TTL) has expired, and it changed
+    world.now += 600
+    world.data["traffic"] = {"duration": "65 mins"}
+    result = await world.rebuild(tmp_path)
+
+    assert world.fetched[-1] == ["traffic"]
+    assert result["rewritten"] == ["traffic"]
+    assert result["reused"] == ["intro", "weather", "news", "outro"]
+    assert result["script"] == "intro v1\n\nweather v1\n\ntraffic v2\n\nnews v1\n\noutro v1"
+
+    # Refetched but unchanged: nothing is rewritten
+    world.now += 600
+    result = await world.rebuild(tmp_path)
+    assert world.fetched[-1] == ["traffic"]
+    assert result["rewritten"] == []
+    assert len(world.written) == 2
+
+
+@pytest.mark.asyncio
+async def test_new_stories_are_added_to_earlier_ones(monkeypatch, tmp_path):
+    world = FakeWorld(monkeypatch)
+    await world.rebuild(tmp_path)
+
+    world.now += 3601
+    # Stories already covered are filtered out by the memory validator
+    world.data["news"] = [{"query": "SF", "result": [{"id": "b", "headline": "B", "summary": "b"}]}]
+    result = await world.rebuild(tmp_path)
+
+    assert world.fetched[-1] == ["news", "weather", "traffic"]
+    assert result["rewritten"] == ["news"]
+
+
+@pytest.mark.asyncio
+async def test_repeated_refreshes_keep_the_news_bounded(monkeypatch, tmp_path):
+    # A day of hourly refreshes without a full rebuild in between
+    monkeypatch.setattr("agents.rebuilder.REBUILD_MAX_AGE_SECONDS", 24 * 3600)
+    world = FakeWorld(monkeypatch)
+    await world.rebuild(tmp_path)
+
+    for i in range(15):
+        world.now += 3601
+        world.data["news"] = [{"query": "SF", "result": [{"id": f"n{i}", "headline": f"N{i}", "summary": "n"}]}]
+        await world.rebuild(tmp_path)
+
+    news = world.last_session.state[KEY_NEWS_DATA]
+    assert len(news) == 1
+    assert [item["id"] for item in news[0]["result"]] == [f"n{i}" for i in range(14, 4, -1)]
+
+    # Nothing new: the news section is left alone
+    world.now += 3601
+    world.data["news"] = [{"query": "SF", "result": []}]
+    result = await world.rebuild(tmp_path)
+    assert "news" not in result["rewritten"]
+    assert world.last_session.state[KEY_NEWS_DATA] == news
+
+
+def test_merge_news_dedupes_by_id_and_drops_empty_entries():
+    stored = [{"query": "SF", "result": [{"id": "a"}]}]
+    fresh = [{"query": "SF", "result": [{"id": "a"}, {"id": "b"}]}, {"query": "Interest: Jazz", "result": []}]
+
+    assert merge_news(stored, fresh) == [{"query": "SF", "result": [{"id": "b"}, {"id": "a"}]}]
+
+
+@pytest.mark.asyncio
+async def test_profile_change_forces_a_full_build(monkeypatch, tmp_path):
+    world = FakeWorld(monkeypatch)
+    await world.rebuild(tmp_path)
+
+    result = await world.rebuild(tmp_path, profile={**PROFILE, "time_limit": "2 minutes"})
+
+    assert world.fetched[-1] == ["news", "weather", "traffic"]
+    assert result["rewritten"] == ["intro", "weather", "traffic", "news", "outro"]
@@ -0,0 +1,66 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from utils.llm import run_agent
+from utils.runner_pool import RunnerPool
+
+
+class _SessionService:
+    def __init__(self):
+        self.deleted = []
+
+    async def delete_session(self, app_name, user_id, session_id):
+        self.deleted.append(session_id)
+
+
+class _Runner:
+    app_name = "test_app"
+
+    def __init__(self):
+        self.session_service = _SessionService()
+        self.session_ids = []
+
+    async def run_debug(self, prompt, session_id=None, **kwargs):
+        self.session_ids.append(session_id)
+        await asyncio.sleep(0)
+        return [SimpleNamespace(usage_metadata=None)]
+
+
+def test_runners_are_built_once_per_key_and_event_loop():
+    pool = RunnerPool()
+    builds = []
+
+    def build():
+        builds.append(1)
+        return _Runner()
+
+    async def lookups():
+        first = pool.get(("NewsAgent", "m"), build)
+        assert pool.get(("NewsAgent", "m"), build) is first
+        assert pool.get(("SuperWriter", None), build) is not first
+        return first
+
+    first = asyncio.run(lookups())
+    assert len(builds) == 2
+    assert pool.stats["reuses"] == 1 and pool.stats["builds"] == 2
+
+    # A new loop (the next asyncio.run) gets its own runner
+    assert asyncio.run(lookups()) is not first
+    assert len(builds) == 4
+
+
+def test_disabled_pool_builds_every_time():
+    pool = RunnerPool(enabled=False)
+    assert pool.get(("NewsAgent", "m"), _Runner) is not pool.get(("NewsAgent", "m"), _Runner)
+    assert pool.stats["builds"] == 2
+
+
+@pytest.mark.asyncio
+async def test_concurrent_runs_on_a_shared_runner_get_their_own_sessions():
+    runner = _Runner()
+    await asyncio.gather(*(run_agent(runner, f"prompt {i}", agent="NewsAgent") for i in range(5)))
+
+    assert len(set(runner.session_ids)) == 5
+    assert sorted(runner.session_service.deleted) == sorted(runner.session_ids)
@@ -0,0 +1,189 @@
+import asyncio
+from datetime import datetime, timezone
+
+import pytest
+
+from utils.scheduler import PodcastScheduler, delivery_date, next_delivery, spread_offset
+
+
+def _ts(*args):
+    return datetime(*args, tzinfo=timezone.utc).timestamp()
+
+
+def _profile(wake_time, tz="America/Los_Angeles"):
+    return {"schedule": {"wake_time": wake_time, "timezone": tz}}
+
+
+class FakeClock:
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        self.now += seconds
+        await asyncio.sleep(0)
+
+
+def test_next_delivery_uses_the_users_timezone_and_dst():
+    profile = _profile("07:00")
+    # 05:00 PDT -> 07:00 PDT the same day
+    assert next_delivery(profile, _ts(2026, 10, 17, 12, 0)) == _ts(2026, 10, 17, 14, 0)
+    # Already past 07:00 PDT -> tomorrow
+    assert next_delivery(profile, _ts(2026, 10, 17, 15, 0)) == _ts(2026, 10, 18, 14, 0)
+    # After the switch to PST the delivery is still 07:00 local
+    assert next_delivery(profile, _ts(2026, 11, 2, 0, 0)) == _ts(2026, 11, 2, 15, 0)
+
+
+def test_invalid_delivery_times_are_rejected():
+    for wake_time in ("7am", "25:00", "07:60", "07", 7):
+        with pytest.raises(ValueError, match="expected HH:MM"):
+            next_delivery(_profile(wake_time), _ts(2026, 10, 17, 12, 0))
+
+
+def test_delivery_date_is_the_users_local_date():
+    # 06:00 in Tokyo is still the previous day in UTC
+    assert str(delivery_date(_profile("06:00", "Asia/Tokyo"), _ts(2026, 10, 16, 21, 0))) == "2026-10-17"
+
+
+def test_spread_offset_is_stable_and_bounded():
+    assert spread_offset("user_123", 600) == spread_offset("user_123", 600)
+    assert all(0 <= spread_offset(f"user_{i}", 600) < 600 for i in range(100))
+    assert spread_offset("user_123", 0) == 0
+
+
+@pytest.mark.asyncio
+async def test_jobs_start_within_their_lead_window_in_deadline_order():
+    clock = FakeClock(_ts(2026, 10, 17, 12, 0))
+    started = []
+
+    async def run_job(user_id, profile, deadline):
+        started.append((user_id, clock()))
+
+    scheduler = PodcastScheduler(run_job, lead_seconds=1800, spread_seconds=600, concurrency=4,
+                                 expected_runtime=60, clock=clock, sleep=clock.sleep)
+    scheduler.add_profiles({
+        "london": _profile("07:00", "Europe/London"),  # 06:00 UTC tomorrow
+        "sf": _profile("07:00"),  # 14:00 UTC today
+        "ny": _profile("07:30", "America/New_York"),  # 11:30 UTC tomorrow
+    })
+    deadlines = {job.user_id: job.deadline for _, _, job in scheduler._pending}
+
+    await scheduler.run(until=_ts(2026, 10, 18, 12, 0))
+
+    assert [user_id for user_id, _ in started] == ["sf", "london", "ny"]
+    for user_id, at in started:
+        assert deadlines[user_id] - 1800 - 600 <= at <= deadlines[user_id] - 1800
+    assert scheduler.stats["completed"] == 3
+    assert scheduler.stats["missed_deadlines"] == 0
+    # Each user is queued again for the next day
+    assert sorted(job.user_id for _, _, job in scheduler._pending) == ["london", "ny", "sf"]
+
+
+@pytest.mark.asyncio
+async def test_busy_slots_go_to_the_earliest_deadline():
+    clock = FakeClock(_ts(2026, 10, 17, 13, 0))
+    started = []
+    release = asyncio.Event()
+
+    async def run_job(user_id, profile, deadline):
+        started.append(user_id)
+        if user_id == "blocker":
+            await release.wait()
+
+    scheduler = PodcastScheduler(run_job, lead_seconds=3600, spread_seconds=0, concurrency=1,
+                                 expected_runtime=1, clock=clock, sleep=clock.sleep)
+    scheduler.add_profile("blocker", _profile("06:10"))
+    scheduler.add_profile("later", _profile("06:50"))
+    scheduler.add_profile("sooner", _profile("06:40"))
+
+    # All three are due; "blocker" takes the only slot
+    scheduler._release_due(clock())
+    scheduler._start_ready(clock())
+    await asyncio.sleep(0)
+    release.set()
+    await scheduler.run(until=clock() + 600)
+
+    assert started[:3] == ["blocker", "sooner", "later"]
+
+
+@pytest.mark.asyncio
+async def test_jobs_at_risk_of_missing_the_deadline_start_early():
+    clock = FakeClock(_ts(2026, 10, 17, 12, 0))
+    started = []
+
+    async def run_job(user_id, profile, deadline):
+        started.append(clock())
+
+    # Generation is known to take 45 minutes, longer than the 30 minute lead
+    scheduler = PodcastScheduler(run_job, lead_seconds=1800, spread_seconds=0, concurrency=1,
+                                 expected_runtime=2700, clock=clock, sleep=clock.sleep)
+    job = scheduler.add_profile("sf", _profile("07:00"))
+
+    await scheduler.run(until=job.deadline)
+
+    assert started[0] <= job.deadline - 2700
+    assert job.late
+    assert scheduler.stats["late"] == 1
+
+
+@pytest.mark.asyncio
+async def test_failed_runs_are_retried_before_the_deadline():
+    clock = FakeClock(_ts(2026, 10, 17, 12, 0))
+    attempts = []
+
+    async def run_job(user_id, profile, deadline):
+        attempts.append(clock())
+        if len(attempts) == 1:
+            raise RuntimeError("LLM unavailable")
+
+    scheduler = PodcastScheduler(run_job, lead_seconds=1800, spread_seconds=0, retry_delay=120,
+                                 expected_runtime=60, clock=clock, sleep=clock.sleep)
+    job = scheduler.add_profile("sf", _profile("07:00"))
+
+    await scheduler.run(until=job.deadline)
+
+    assert len(attempts) == 2 and attempts[1] - attempts[0] >= 120
+    assert scheduler.stats == {**scheduler.stats, "completed": 1, "retries": 1, "failed": 0}
+
+
+def test_profiles_with_an_invalid_schedule_are_skipped():
+    scheduler = PodcastScheduler(lambda *args: None, clock=lambda: _ts(2026, 10, 17, 12, 0))
+    scheduler.add_profiles({"broken": _profile("7am"), "sf": _profile("07:00")})
+
+    assert [job.user_id for _, _, job in scheduler._pending] == ["sf"]
+
+
+def test_malformed_profiles_are_skipped_without_stopping_the_others():
+    scheduler = PodcastScheduler(lambda *args: None, spread_seconds=0, clock=lambda: _ts(2026, 10, 17, 12, 0))
+    scheduler.add_profiles({
+        "numeric_wake_time": {"schedule": {"wake_time": 7}},
+        "schedule_list": {"schedule": ["07:00"]},
+        "no_schedule": {"schedule": None},
+        "numeric_timezone": {"schedule": {"wake_time": "08:00", "timezone": 7}},
+    })
+
+    jobs = {job.user_id: job for _, _, job in scheduler._pending}
+    assert sorted(jobs) == ["no_schedule", "numeric_timezone"]
+    # Defaults: 07:00 in SCHEDULER_DEFAULT_TIMEZONE
+    assert jobs["no_schedule"].deadline == next_delivery({}, _ts(2026, 10, 17, 12, 0))
+    assert jobs["numeric_timezone"].deadline == next_delivery({"schedule": {"wake_time": "08:00"}}, _ts(2026, 10, 17, 12, 0))
+
+
+def test_at_risk_jobs_are_released_in_deadline_order_without_rescanning():
+    clock = FakeClock(_ts(2026, 10, 17, 12, 0))
+    scheduler = PodcastScheduler(lambda *args: None, lead_seconds=600, spread_seconds=0,
+                                 expected_runtime=6000, clock=clock)
+    soon = scheduler.add_profile("soon", _profile("06:30"))  # 13:30 UTC
+    later = scheduler.add_profile("later", _profile("09:00"))  # 16:00 UTC
+
+    scheduler._release_due(clock())
+    assert [job for _, _, job in scheduler._ready] == [soon] and soon.late and not later.late
+
+    # The released job's start-time entry is skipped once it comes due
+    clock.now = soon.start_at
+    scheduler._release_due(clock())
+    assert len(scheduler._ready) == 1
+    scheduler._idle_seconds(clock())
+    assert [job for _, _, job in scheduler._deadlines] == [later]
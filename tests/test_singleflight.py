@@ -0,0 +1,76 @@
+import asyncio
+
+from utils.singleflight import SingleFlight, normalize_query
+
+
+def test_normalize_query_ignores_case_and_whitespace():
+    assert normalize_query("  SpaceX   Starship ") == normalize_query("spacex starship")
+
+
+def test_concurrent_callers_share_one_call():
+    flight = SingleFlight()
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return ["story"]
+
+    async def run():
+        return await asyncio.gather(*(flight.do("berlin", fetch) for _ in range(5)))
+
+    results = asyncio.run(run())
+
+    assert len(calls) == 1
+    assert all(r == ["story"] for r in results)
+    assert flight.stats == {"calls": 1, "shared": 4}
+
+
+def test_key_is_released_after_completion():
+    flight = SingleFlight()
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        return len(calls)
+
+    async def run():
+        first = await flight.do("berlin", fetch)
+        second = await flight.do("berlin", fetch)
+        return first, second
+
+    assert asyncio.run(run()) == (1, 2)
+
+
+def test_exception_is_shared_by_all_waiters():
+    flight = SingleFlight()
+
+    async def fetch():
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    async def run():
+        return await asyncio.gather(
+            *(flight.do("berlin", fetch) for _ in range(3)), return_exceptions=True
+        )
+
+    results = asyncio.run(run())
+    assert all(isinstance(r, ValueError) for r in results)
+    assert flight.stats["calls"] == 1
+
+
+def test_start_claims_the_key_before_the_caller_awaits():
+    flight = SingleFlight()
+
+    async def fetch():
+        await asyncio.sleep(0.01)
+        return ["story"]
+
+    async def run():
+        task = flight.start("berlin", fetch)
+        claimed = flight.in_flight("berlin")
+        shared = await flight.do("berlin", fetch)
+        return claimed, await task, shared, flight.in_flight("berlin")
+
+    assert asyncio.run(run()) == (True, ["story"], ["story"], False)
+    assert flight.stats == {"calls": 1, "shared": 1}
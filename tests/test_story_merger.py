@@ -0,0 +1,39 @@
+from agents.story_merger import merge_news_data
+
+SUMMARY = ("Nvidia shares rose 6 percent on Thursday after the chipmaker reported record data center "
+           "revenue and raised its outlook for the next quarter above analyst expectations.")
+
+
+def test_same_story_from_two_queries_is_merged():
+    news_data = [
+        {"query": "San Francisco, USA", "result": [
+            {"id": "nvidia-earnings", "headline": "Nvidia stock jumps on earnings", "summary": SUMMARY, "source": "A"},
+            {"id": "bart-strike", "headline": "BART workers vote on strike", "summary": "Transit workers vote.", "source": "B"},
+        ]},
+        {"query": "Interest: NVIDIA Stock Performance", "result": [
+            {"id": "nvda-record-revenue", "headline": "Nvidia stock jumps after earnings",
+             "summary": SUMMARY + " Guidance topped forecasts.", "source": "C"},
+        ]},
+    ]
+
+    merged = merge_news_data(news_data)
+
+    assert [story["headline"] for story in merged] == [
+        "Nvidia stock jumps after earnings",  # richest summary wins
+        "BART workers vote on strike",
+    ]
+    assert merged[0]["queries"] == ["San Francisco, USA", "Interest: NVIDIA Stock Performance"]
+    assert merged[1]["queries"] == ["San Francisco, USA"]
+
+
+def test_same_id_is_merged_and_malformed_entries_are_ignored():
+    news_data = [
+        {"query": "q1", "result": [{"id": "x", "headline": "One", "summary": "short"}]},
+        {"query": "q2", "result": [{"id": "x", "headline": "Completely different words", "summary": "longer text"}]},
+        {"query": "q3", "result": "Error fetching news"},
+    ]
+
+    merged = merge_news_data(news_data)
+
+    assert len(merged) == 1
+    assert merged[0]["queries"] == ["q1", "q2"]
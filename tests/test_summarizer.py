@@ -0,0 +1,27 @@
+from types import SimpleNamespace
+
+import pytest
+
+from agents.summarizer import SuperWriterAgent
+from utils.session import InMemorySessionService
+
+
+def _event(text, partial):
+    return SimpleNamespace(partial=partial, content=SimpleNamespace(parts=[SimpleNamespace(text=text, thought=False)]))
+
+
+async def _fake_stream_events(self, prompt):
+    for chunk in ["Good morning, Al", "ex! Traffic is ", "light. Enjoy"]:
+        yield _event(chunk, partial=True)
+    yield _event("Good morning, Alex! Traffic is light. Enjoy", partial=False)
+
+
+@pytest.mark.asyncio
+async def test_stream_script_yields_sentences_without_repeating_final_event(monkeypatch):
+    monkeypatch.setattr(SuperWriterAgent, "_stream_events", _fake_stream_events)
+    session = InMemorySessionService()
+    session.initialize_user_context({"name": "Alex", "time_limit": "2 minutes"}, user_id="u1")
+
+    sentences = [s async for s in SuperWriterAgent(session).stream_script()]
+
+    assert sentences == ["Good morning, Alex!", "Traffic is light.", "Enjoy"]
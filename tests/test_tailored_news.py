@@ -1,7 +1,14 @@
-import pytest
 import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+import agents.news_core as news_core
+from agents.news_core import NewsBatchSizer, parse_news_batch
 from agents.tailored_news import TailoredNewsAgent
 
+
 @pytest.mark.asyncio
 async def test_tailored_news_instantiation():
     agent = TailoredNewsAgent()
@@ -9,3 +16,69 @@ async def test_tailored_news_instantiation():
 
 # Note: Integration tests would require mocking NewsAgent or having API keys.
 
+
+def _stories(topic):
+    return [{"id": f"{topic}-1", "headline": f"{topic} news", "summary": "...", "source": "AP"}]
+
+
+def test_parse_news_batch_matches_labels_and_recovers_truncated_output():
+    text = "```json\n" + json.dumps({"formula 1": _stories("f1"), "Jazz": [], "Chess": "none"}) + "\n```"
+    parsed = parse_news_batch(text, ["Formula 1", "Jazz", "Chess", "Housing"])
+    assert parsed["Formula 1"] == _stories("f1")
+    # Empty, malformed or missing lists are left for an individual retry
+    assert parsed["Jazz"] is None and parsed["Chess"] is None and parsed["Housing"] is None
+
+    truncated = '{"Formula 1": ' + json.dumps(_stories("f1")) + ', "Jazz": [{"id": "jazz-1", "headl'
+    parsed = parse_news_batch(truncated, ["Formula 1", "Jazz"])
+    assert parsed == {"Formula 1": _stories("f1"), "Jazz": None}
+
+
+def test_batch_size_adapts_to_failures_and_response_size():
+    sizer = NewsBatchSizer(initial=4, max_size=8, max_response_chars=10000)
+    sizer.record(4, 4, 4000)
+    assert sizer.size == 5
+    sizer.record(5, 3, 3000)
+    assert sizer.size == 2
+    # ~1000 characters per query so far; 3000 per query caps the batch at 3
+    sizer = NewsBatchSizer(initial=8, max_size=8, max_response_chars=9000)
+    sizer.record(2, 2, 6000)
+    assert sizer.size == 3
+    assert [len(batch) for batch in sizer.split(list("abcdefg"))] == [3, 2, 2]
+
+
+def test_batched_interests_retry_only_the_missing_ones(monkeypatch):
+    prompts = []
+
+    async def fake_run_agent(runner, prompt, agent, **kwargs):
+        prompts.append(prompt)
+        if prompt.startswith("Find news for each of these topics:"):
+            # Answers two of the three topics
+            text = json.dumps({"Jazz": _stories("jazz"), "Chess": _stories("chess")})
+        else:
+            text = json.dumps(_stories("f1"))
+        return [SimpleNamespace(content=SimpleNamespace(parts=[SimpleNamespace(text=text)]))]
+
+    class _Validator:
+        async def validate_and_log(self, items, partition=None):
+            return items
+
+    class _Cache(dict):
+        def set(self, key, value):
+            self[key] = value
+
+    cache = _Cache()
+    monkeypatch.setattr(news_core, "run_agent", fake_run_agent)
+    monkeypatch.setattr(news_core, "get_memory_service", lambda: _Validator())
+    monkeypatch.setattr(news_core, "get_news_cache", lambda: cache)
+    monkeypatch.setattr(news_core, "get_runner_pool", lambda: SimpleNamespace(get=lambda key, build: None))
+    monkeypatch.setattr(news_core, "_news_batch_sizer", NewsBatchSizer(initial=4, max_size=8))
+
+    results = asyncio.run(TailoredNewsAgent(user_id="u1").get_news_for_interests(["Jazz", "Chess", "Formula 1"]))
+
+    assert results == {"Jazz": _stories("jazz"), "Chess": _stories("chess"), "Formula 1": _stories("f1")}
+    assert len(prompts) == 2
+    assert prompts[1].endswith("specifically about: Formula 1")
+    # Batched and individual results land in the same per-interest cache entries
+    assert len(cache) == 3
+    # The incomplete batch halves the next batch size
+    assert news_core._news_batch_sizer.size == 2
@@ -0,0 +1,22 @@
+from utils.text import SentenceBuffer, split_sentences
+
+
+def test_split_sentences():
+    text = 'Good morning, Alex! It is 3.5 degrees out. "Bring a coat." \n\nTraffic is light'
+    assert split_sentences(text) == [
+        "Good morning, Alex!",
+        "It is 3.5 degrees out.",
+        '"Bring a coat."',
+        "Traffic is light",
+    ]
+
+
+def test_buffer_releases_sentences_once_their_boundary_arrives():
+    buffer = SentenceBuffer()
+
+    assert buffer.feed("Good morn") == []
+    assert buffer.feed("ing. Rain is at 3.") == ["Good morning."]
+    # "3." was not a boundary: no whitespace followed it yet
+    assert buffer.feed("5 millimeters today. Tr") == ["Rain is at 3.5 millimeters today."]
+    assert buffer.flush() == ["Tr"]
+    assert buffer.flush() == []
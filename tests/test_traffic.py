@@ -0,0 +1,128 @@
+import asyncio
+import threading
+
+import agents.traffic as traffic
+from agents.traffic import TrafficAgent, normalize_place
+from benchmarks.stub_servers import StubAPIServer, point_agents_at
+from utils.cache import TTLCache
+from utils.fetch_tools import close_http_client
+
+
+class _Clock:
+    def __init__(self, now=300 * 6_000_000):
+        # Starts on a bucket boundary
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def _stub_agent(clock, fetch_started=None, release=None):
+    """TrafficAgent on `clock` whose Directions fetch is stubbed; each result is numbered by fetch."""
+    agent = TrafficAgent(cache=TTLCache(clock=clock), bucket_seconds=300, stale_seconds=300, clock=clock)
+    fetches = []
+
+    def fake_fetch(origin, destination):
+        fetches.append((origin, destination))
+        if release is not None and len(fetches) > 1:
+            fetch_started.set()
+            release.wait(5)
+        return {"type": "traffic", "fetch": len(fetches)}
+
+    agent._fetch_traffic = fake_fetch
+    return agent, fetches
+
+
+def _wait_for_refreshes():
+    for thread in threading.enumerate():
+        if thread.name.startswith("traffic-refresh-"):
+            thread.join(5)
+
+
+def test_normalize_place_ignores_case_whitespace_and_comma_spacing():
+    assert normalize_place("  1 Main St ,Springfield ") == "1 main st, springfield"
+    assert normalize_place("1  MAIN st,  springfield") == "1 main st, springfield"
+    assert normalize_place("Main St, Springfield") != normalize_place("Main St Springfield")
+
+
+def test_departures_in_the_same_bucket_share_one_fetch():
+    clock = _Clock()
+    agent, fetches = _stub_agent(clock)
+
+    first = agent.get_traffic_data("Home", "Work")
+    clock.now += 299
+    second = agent.get_traffic_data(" home", "WORK ")
+
+    assert first == second == {"type": "traffic", "fetch": 1}
+    assert fetches == [("Home", "Work")]
+    # Callers get their own copy
+    second["fetch"] = 99
+    assert agent.get_traffic_data("Home", "Work")["fetch"] == 1
+
+
+def test_the_previous_bucket_is_served_while_a_single_refresh_runs():
+    clock = _Clock()
+    fetch_started, release = threading.Event(), threading.Event()
+    agent, fetches = _stub_agent(clock, fetch_started, release)
+    agent.get_traffic_data("Stale Rd", "Work")
+
+    # Next bucket, within the stale window: served at once, refreshed in the background
+    clock.now += 300
+    served = [agent.get_traffic_data("Stale Rd", "Work")["fetch"] for _ in range(3)]
+    assert fetch_started.wait(5)
+
+    assert served == [1, 1, 1]
+    assert len(fetches) == 2
+    release.set()
+    _wait_for_refreshes()
+    assert agent.get_traffic_data("Stale Rd", "Work")["fetch"] == 2
+    assert len(fetches) == 2
+    assert "stale rd|work" not in traffic._revalidating
+
+
+def test_results_past_the_stale_window_are_fetched_again():
+    clock = _Clock()
+    agent, fetches = _stub_agent(clock)
+    agent.get_traffic_data("Home", "Airport")
+
+    # Bucket end plus the stale window
+    clock.now += 600
+    assert agent.get_traffic_data("Home", "Airport")["fetch"] == 2
+    _wait_for_refreshes()
+    assert len(fetches) == 2
+
+
+def test_async_traffic_is_fetched_from_the_directions_api_once_per_route():
+    async def run(agent):
+        try:
+            return [await agent.get_traffic_data_async("1 Main St, Springfield", "Airport"),
+                    await agent.get_traffic_data_async("1 main st,springfield ", "AIRPORT")]
+        finally:
+            await close_http_client()
+
+    with StubAPIServer(latency_scale=0) as server, point_agents_at(server):
+        # The API key is read when the agent is created
+        agent = TrafficAgent(cache=TTLCache())
+        first, second = asyncio.run(run(agent))
+
+    assert first["type"] == "traffic"
+    assert first["start_address"] == "1 Main St, Springfield"
+    assert first["has_delay"] == (first["duration_in_traffic_value"] > first["normal_duration_value"])
+    assert second == first
+    assert server.requests == {"/maps/api/directions/json": 1}
+
+
+def test_async_traffic_errors_are_returned_and_not_cached(monkeypatch):
+    async def run(agent):
+        try:
+            return await agent.get_traffic_data_async("Home", "Work")
+        finally:
+            await close_http_client()
+
+    with StubAPIServer(latency_scale=0) as server, point_agents_at(server):
+        agent = TrafficAgent(cache=TTLCache())
+        monkeypatch.setattr(traffic, "DIRECTIONS_API_URL", f"{server.base_url}/missing")
+        result = asyncio.run(run(agent))
+
+    assert "404" in result["error"]
+    assert len(agent.cache) == 0
@@ -0,0 +1,129 @@
+import asyncio
+import wave
+
+import pytest
+
+from utils.cache import DiskBlobCache
+from utils.tts import LocalToneEngine, TTSEngine, TTSPipeline, chunk_script, save_wav, segment_key
+
+SCRIPT = "Good morning, Alex. It is sunny today. Traffic on the 101 is heavy. Nvidia stock is up. Have a great day."
+
+
+class _SlowFirstEngine(TTSEngine):
+    """Finishes chunks in reverse order and records peak concurrency."""
+
+    def __init__(self):
+        self.active = 0
+        self.peak = 0
+
+    async def synthesize(self, text, voice=None, tone=None):
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        await asyncio.sleep(0.05 if text.startswith("Good") else 0.01)
+        self.active -= 1
+        return text.encode("utf-8")[:1] * 2
+
+
+def test_chunk_script_packs_sentences_up_to_the_limit():
+    chunks = chunk_script(SCRIPT, max_chars=45)
+    assert chunks == [
+        "Good morning, Alex. It is sunny today.",
+        "Traffic on the 101 is heavy.",
+        "Nvidia stock is up. Have a great day.",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_audio_is_reassembled_in_script_order_with_bounded_concurrency():
+    engine = _SlowFirstEngine()
+    pipeline = TTSPipeline(engine, concurrency=2, max_chunk_chars=1, cache=False)
+
+    result = await pipeline.synthesize(SCRIPT)
+
+    # One 2-byte "sample" per sentence, first letters in script order
+    assert result["audio"] == b"GGIITTNNHH"
+    assert result["chunks"] == 5
+    assert engine.peak == 2
+
+
+@pytest.mark.asyncio
+async def test_local_engine_reports_real_time_factor(tmp_path):
+    pipeline = TTSPipeline(LocalToneEngine(sample_rate=8000, words_per_minute=600), concurrency=4, cache=False)
+
+    result = await pipeline.synthesize(SCRIPT)
+
+    words = len(SCRIPT.split())
+    assert result["audio_seconds"] == pytest.approx(words * 60 / 600)
+    assert result["rtf"] == pytest.approx(result["synthesis_seconds"] / result["audio_seconds"])
+
+    path = tmp_path / "podcast.wav"
+    save_wav(str(path), result["audio"], result["sample_rate"])
+    with wave.open(str(path)) as f:
+        assert f.getnframes() == len(result["audio"]) // 2
+
+
+@pytest.mark.asyncio
+async def test_stream_submits_sentences_as_they_arrive():
+    async def sentences():
+        for sentence in ["One two.", "Three four five."]:
+            yield sentence
+
+    engine = LocalToneEngine(sample_rate=8000, words_per_minute=600)
+    result = await TTSPipeline(engine, cache=False).synthesize_stream(sentences())
+
+    assert result["chunks"] == 2
+    assert result["audio_seconds"] == pytest.approx(0.5)
+
+
+class _CountingEngine(LocalToneEngine):
+    def __init__(self):
+        super().__init__(sample_rate=8000, words_per_minute=600)
+        self.calls = []
+
+    async def synthesize(self, text, voice=None, tone=None):
+        self.calls.append(text)
+        return await super().synthesize(text, voice, tone)
+
+
+def test_segment_key_covers_voice_tone_and_engine_params_but_not_whitespace():
+    engine = LocalToneEngine()
+    key = segment_key("Good morning,  Alex.", engine, "en-1", ["Sarcastic"])
+    assert key == segment_key(" Good morning, Alex. ", engine, "en-1", ["Sarcastic"])
+    assert key != segment_key("Good morning, Alex.", engine, "en-2", ["Sarcastic"])
+    assert key != segment_key("Good morning, Alex.", engine, "en-1", ["Energetic"])
+    assert key != segment_key("Good morning, Alex.", LocalToneEngine(words_per_minute=180), "en-1", ["Sarcastic"])
+    assert key == segment_key("Good morning, Alex.", LocalToneEngine(latency=0.5), "en-1", ["Sarcastic"])
+
+
+@pytest.mark.asyncio
+async def test_recurring_segments_are_served_from_the_cache(tmp_path):
+    cache = DiskBlobCache(str(tmp_path / "audio"), max_bytes=10_000_000)
+    engine = _CountingEngine()
+    pipeline = TTSPipeline(engine, cache=cache)
+
+    first = await pipeline.synthesize("Good morning, Alex. Rain today. See you tomorrow.", tone=["Sarcastic"])
+    second = await pipeline.synthesize("Good morning, Alex. Sunny today. See you tomorrow.", tone=["Sarcastic"])
+
+    assert sorted(engine.calls[:3]) == ["Good morning, Alex.", "Rain today.", "See you tomorrow."]
+    assert engine.calls[3:] == ["Sunny today."]
+    assert first["cached_chunks"] == 0 and second["cached_chunks"] == 2
+    stats = cache.stats()
+    assert stats["hit_ratio"] == pytest.approx(2 / 6, abs=1e-4)
+    # 6 cached words at 0.1s each, 8 kHz, 16-bit
+    assert stats["bytes_saved"] == 6 * 800 * 2
+
+
+def test_blob_cache_evicts_least_recently_used_by_size(tmp_path):
+    cache = DiskBlobCache(str(tmp_path), max_bytes=10)
+    cache.set("aa01", b"1234")
+    cache.set("bb02", b"5678")
+    assert cache.get("aa01") == b"1234"  # now most recently used
+    cache.set("cc03", b"9012")
+
+    assert cache.get("bb02") is None
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["size_bytes"] == 8
+
+    # The surviving entries are found again after a restart
+    reopened = DiskBlobCache(str(tmp_path), max_bytes=10)
+    assert len(reopened) == 2 and reopened.get("cc03") == b"9012"
@@ -0,0 +1,197 @@
+import asyncio
+import random
+from datetime import datetime
+
+import agents.weather as weather
+from agents.weather import (
+    WeatherAgent,
+    compute_weather_insights,
+    compute_weather_insights_batch,
+    grid_cell,
+    seconds_until_next_hour,
+)
+from benchmarks.stub_servers import StubAPIServer, daily_forecast, hourly_forecast, point_agents_at
+from utils.cache import TTLCache
+from utils.fetch_tools import close_http_client
+
+
+def _hourly_payload(rng, hours=24):
+    forecast_hours = []
+    for hour in range(hours):
+        entry = {
+            "interval": {"startTime": f"2025-11-20T{hour:02d}:00:00Z"},
+            "uvIndex": rng.choice([0, 1, 2, 3, 5, 5, 8]),
+            "temperature": {"degrees": rng.choice([9, 12.5, 14, 14, 17.25])},
+            "precipitation": {"probability": {"percent": rng.choice([0, 10, 25, 30, 45, 60, 60])}},
+        }
+        forecast_hours.append(entry)
+    rng.shuffle(forecast_hours)
+    return {"forecastHours": forecast_hours}
+
+
+def _daily_payload():
+    return {
+        "forecastDays": [{
+            "daytimeForecast": {"weatherCondition": {"description": {"text": "Cloudy"}}, "uvIndex": 3},
+            "nighttimeForecast": {"weatherCondition": {"description": {"text": "Clear"}}},
+            "maxTemperature": {"degrees": 17.25},
+            "minTemperature": {"degrees": 9},
+        }]
+    }
+
+
+def test_batch_matches_per_location_insights():
+    rng = random.Random(7)
+    hourly_payloads = [_hourly_payload(rng, hours=rng.randint(0, 24)) for _ in range(200)]
+    daily_payloads = [_daily_payload() for _ in hourly_payloads]
+
+    expected = [compute_weather_insights(d, h) for d, h in zip(daily_payloads, hourly_payloads)]
+
+    assert compute_weather_insights_batch(daily_payloads, hourly_payloads) == expected
+
+
+def test_batch_skips_missing_and_malformed_times():
+    hourly = {"forecastHours": [
+        {"interval": {}, "uvIndex": 11},
+        {"interval": {"startTime": "not-a-time"}, "uvIndex": 10},
+        {"interval": {"startTime": "2025-11-20T09:00:00Z"}, "uvIndex": 4,
+         "precipitation": {"probability": {"percent": 20}}},
+    ]}
+
+    [result] = compute_weather_insights_batch([{}], [hourly])
+
+    assert result == compute_weather_insights({}, hourly)
+    assert result["max_uv_value"] == 4
+    assert result["rain_window"] == {"start": None, "end": None, "peak_chance": 20, "peak_time": "09:00"}
+
+
+def _batch_agent(monkeypatch, fail_at=(), malformed_at=()):
+    """WeatherAgent with a fresh cache whose forecast fetch is stubbed and counted per cell."""
+    agent = WeatherAgent(cache=TTLCache())
+    fetches = []
+
+    async def fake_fetch(self, latitude, longitude, unit="metric"):
+        fetches.append((latitude, longitude))
+        await asyncio.sleep(0.01)
+        if (latitude, longitude) in fail_at:
+            raise RuntimeError("503 from weather API")
+        hourly = _hourly_payload(random.Random(latitude))
+        if (latitude, longitude) in malformed_at:
+            hourly["forecastHours"][0]["temperature"]["degrees"] = None
+        return _daily_payload(), hourly
+
+    monkeypatch.setattr(WeatherAgent, "_fetch_forecast_async", fake_fetch)
+    return agent, fetches
+
+
+def test_batch_returns_an_error_entry_for_a_failed_cell(monkeypatch):
+    agent, _ = _batch_agent(monkeypatch, fail_at=[(2.0, 2.0)])
+
+    results = asyncio.run(agent.get_weather_insights_batch_async([(1.0, 1.0), (2.0, 2.0), (3.0, 3.0)]))
+
+    assert results[1] == {"error": "503 from weather API"}
+    assert "daily_summary" in results[0] and "daily_summary" in results[2]
+    # Failures are not cached, the next batch tries the cell again
+    assert agent.cache.get("2.0,2.0|metric") is None
+
+
+def test_a_malformed_forecast_fails_only_its_own_cell(monkeypatch):
+    agent, _ = _batch_agent(monkeypatch, malformed_at=[(2.0, 2.0)])
+
+    async def run():
+        return await asyncio.gather(
+            agent.get_weather_insights_batch_async([(1.0, 1.0), (2.0, 2.0), (3.0, 3.0)]),
+            # Joins the batch's flight for the cell
+            agent.get_weather_insights_async(3.0, 3.0),
+        )
+
+    results, joined = asyncio.run(run())
+
+    assert set(results[1]) == {"error"}
+    assert agent.cache.get("2.0,2.0|metric") is None
+    expected = compute_weather_insights(_daily_payload(), _hourly_payload(random.Random(3.0)))
+    assert results[2] == joined == expected
+    assert results[0] == compute_weather_insights(_daily_payload(), _hourly_payload(random.Random(1.0)))
+
+
+def test_concurrent_batches_fetch_a_shared_cell_once(monkeypatch):
+    agent, fetches = _batch_agent(monkeypatch)
+
+    async def run():
+        return await asyncio.gather(
+            agent.get_weather_insights_batch_async([(1.0, 1.0), (2.0, 2.0)]),
+            agent.get_weather_insights_batch_async([(2.0, 2.0), (3.0, 3.0)]),
+            agent.get_weather_insights_async(3.0, 3.0),
+        )
+
+    first, second, single = asyncio.run(run())
+
+    assert sorted(fetches) == [(1.0, 1.0), (2.0, 2.0), (3.0, 3.0)]
+    assert first[1] == second[0]
+    assert second[1] == single
+
+
+def test_async_insights_are_fetched_from_the_forecast_api_once_per_cell():
+    agent = WeatherAgent(cache=TTLCache())
+
+    async def run():
+        try:
+            return [await agent.get_weather_insights_async(52.5201, 13.4049),
+                    await agent.get_weather_insights_async(52.5169, 13.4012)]
+        finally:
+            await close_http_client()
+
+    with StubAPIServer(latency_scale=0) as server, point_agents_at(server):
+        first, second = asyncio.run(run())
+
+    assert first == compute_weather_insights(daily_forecast(52.52, 13.4), hourly_forecast(52.52, 13.4))
+    assert second == first
+    assert server.requests == {"/v1/forecast/days:lookup": 1, "/v1/forecast/hours:lookup": 1}
+
+
+class _Clock:
+    def __init__(self, now=1_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def test_grid_cell_rounds_coordinates_to_the_precision():
+    assert grid_cell(37.77493, -122.41942) == (37.77, -122.42)
+    assert grid_cell(37.7749, -122.4194, precision=1) == (37.8, -122.4)
+    # Neighbours a few hundred metres apart share a cell
+    assert grid_cell(52.5201, 13.4049) == grid_cell(52.5169, 13.4012)
+
+
+def test_forecasts_expire_at_the_top_of_the_hour():
+    assert seconds_until_next_hour(datetime(2025, 11, 20, 7, 45, 30)) == 870
+    assert seconds_until_next_hour(datetime(2025, 11, 20, 23, 59, 59)) == 1
+    assert seconds_until_next_hour(datetime(2025, 11, 20, 8, 0, 0)) == 3600
+
+
+def test_nearby_users_share_a_cached_forecast_until_it_expires(monkeypatch):
+    clock = _Clock()
+    agent = WeatherAgent(cache=weather.TTLCache(clock=clock))
+    fetches = []
+
+    def fake_fetch(self, latitude, longitude, unit="metric"):
+        fetches.append((latitude, longitude))
+        return _daily_payload(), _hourly_payload(random.Random(1))
+
+    monkeypatch.setattr(WeatherAgent, "_fetch_forecast", fake_fetch)
+    monkeypatch.setattr(weather, "seconds_until_next_hour", lambda now=None: 120)
+
+    first = agent.get_weather_insights(52.5201, 13.4049)
+    second = agent.get_weather_insights(52.5169, 13.4012)
+    assert fetches == [(52.52, 13.4)]
+    assert first == second
+    assert agent.cache.stats()["hits"] == 1
+
+    # Another cell, or the same one after the hour turns, is fetched again
+    agent.get_weather_insights(48.1372, 11.5756)
+    clock.now += 121
+    agent.get_weather_insights(52.5201, 13.4049)
+    assert fetches == [(52.52, 13.4), (48.14, 11.58), (52.52, 13.4)]
+    # Per-cell locks are not kept once released
+    assert len(weather._cell_locks) == 0
@@ -0,0 +1,316 @@
+# TTL + LRU result caches (in-memory and disk-backed) and a size-bounded blob store
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from utils.metrics import get_metrics
+
+logger = logging.getLogger(__name__)
+
+
+def _record_lookup(cache_name: str | None, hit: bool):
+    if cache_name:
+        get_metrics().inc("cache_lookups_total", cache=cache_name, result="hit" if hit else "miss",
+                          help="Cache lookups by cache and hit/miss.")
+
+
+class TTLCache:
+    """
+    In-memory cache with a per-entry TTL and size-bounded LRU eviction.
+    Thread-safe, since the synchronous fetchers run in worker threads.
+    Named caches also count their lookups in the pipeline metrics.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 3600, clock=time.time, name: str | None = None):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._lock = threading.RLock()
+        # key -> {"value": ..., "expires_at": epoch seconds}, least recently used first
+        self._entries: OrderedDict[str, dict] = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                _record_lookup(self.name, hit=False)
+                return default
+
+            if entry["expires_at"] <= self._clock():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                _record_lookup(self.name, hit=False)
+                self._on_change()
+                return default
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            _record_lookup(self.name, hit=True)
+            self._on_change()
+            return entry["value"]
+
+    def set(self, key: str, value, ttl_seconds: float | None = None):
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        with self._lock:
+            self._entries[key] = {"value": value, "expires_at": self._clock() + ttl}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            self._on_change()
+
+    def delete(self, key: str):
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                self._on_change()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._on_change()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+    def _on_change(self):
+        """Hook for subclasses that persist the entries; called under the lock when they or their order change."""
+
+
+class KeyedLocks:
+    """
+    One lock per cache key, so concurrent misses for the same key do a
+    single fetch while different keys proceed in parallel. A key's lock only
+    exists while some thread holds or waits for it, so the map does not grow
+    with every key ever seen.
+
+        with locks(key):
+            ...
+    """
+
+    def __init__(self):
+        # key -> [lock, threads holding or waiting for it]
+        self._locks: dict[str, list] = {}
+        self._guard = threading.Lock()
+
+    @contextmanager
+    def __call__(self, key: str):
+        with self._guard:
+            entry = self._locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._guard:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._locks[key]
+
+    def __len__(self):
+        return len(self._locks)
+
+
+class DiskTTLCache(TTLCache):
+    """
+    TTLCache persisted to a JSON file so it survives process restarts.
+    Values must be JSON-serializable. Changes (including the LRU order from
+    hits) mark the cache dirty; the file is rewritten atomically at most once
+    per `flush_interval` seconds, on `flush()` and at exit. LRU order is
+    saved as list order.
+    """
+
+    def __init__(self, path: str, max_entries: int = 1024, ttl_seconds: float = 3600, clock=time.time,
+                 name: str | None = None, flush_interval: float = 30.0):
+        super().__init__(max_entries=max_entries, ttl_seconds=ttl_seconds, clock=clock, name=name)
+        # Resolved now: the exit-time flush may run under another working directory
+        self.path = os.path.abspath(path)
+        self.flush_interval = flush_interval
+        self.writes = 0
+        self._dirty = False
+        self._last_write = time.monotonic()
+        self._load()
+        # Changes since the last write would otherwise be lost at exit
+        atexit.register(self.flush)
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                stored = json.load(f)
+        except (json.JSONDecodeError, OSError) as e:
+            logger.warning(f"Ignoring unreadable cache file {self.path}: {e}")
+            return
+
+        now = self._clock()
+        for row in stored.get("entries", []):
+            if row.get("expires_at", 0) > now:
+                self._entries[row["key"]] = {"value": row["value"], "expires_at": row["expires_at"]}
+
+        # The limit may have been lowered since the file was written
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def flush(self):
+        """Writes the entries if anything changed since the last write."""
+        with self._lock:
+            if self._dirty:
+                self._write()
+
+    def _on_change(self):
+        self._dirty = True
+        if time.monotonic() - self._last_write >= self.flush_interval:
+            self._write()
+
+    def _write(self):
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+
+            rows = [{"key": key, **entry} for key, entry in self._entries.items()]
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({"entries": rows}, f, separators=(",", ":"))
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            # Still dirty, the next write retries
+            logger.warning(f"Could not write cache file {self.path}: {e}")
+            return
+        finally:
+            self._last_write = time.monotonic()
+        self._dirty = False
+        self.writes += 1
+
+
+class DiskBlobCache:
+    """
+    Content-addressed byte store on disk, bounded by total size with LRU
+    eviction. Each value is one file named by its key (a hex digest);
+    recency is the file's mtime, so the order survives restarts without
+    an index file.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 256 * 1024 * 1024, name: str | None = None):
+        self.name = name
+        self.directory = os.path.abspath(directory)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # key -> size in bytes, least recently used first
+        self._entries: OrderedDict[str, int] = OrderedDict()
+        self.total_bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bytes_saved = 0
+        self._scan()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.bin")
+
+    def _scan(self):
+        if not os.path.isdir(self.directory):
+            return
+        found = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith(".bin"):
+                    continue
+                stat = os.stat(os.path.join(root, name))
+                found.append((stat.st_mtime, name[:-len(".bin")], stat.st_size))
+        for _, key, size in sorted(found):
+            self._entries[key] = size
+            self.total_bytes += size
+        # The limit may have been lowered since the files were written
+        with self._lock:
+            self._evict()
+
+    def get(self, key: str) -> bytes | None:
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                _record_lookup(self.name, hit=False)
+                return None
+            path = self._path(key)
+            try:
+                with open(path, 'rb') as f:
+                    data = f.read()
+                os.utime(path)
+            except OSError:
+                # Removed behind our back
+                self.total_bytes -= self._entries.pop(key)
+                self.misses += 1
+                _record_lookup(self.name, hit=False)
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            self.bytes_saved += len(data)
+            _record_lookup(self.name, hit=True)
+            return data
+
+    def set(self, key: str, data: bytes):
+        if len(data) > self.max_bytes:
+            return
+        path = self._path(key)
+        with self._lock:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+
+            self.total_bytes += len(data) - self._entries.pop(key, 0)
+            self._entries[key] = len(data)
+            self._evict()
+
+    def _evict(self):
+        while self.total_bytes > self.max_bytes and self._entries:
+            key, size = self._entries.popitem(last=False)
+            self.total_bytes -= size
+            self.evictions += 1
+            try:
+                os.remove(self._path(key))
+            except OSError as e:
+                logger.warning(f"Could not remove cached blob {key}: {e}")
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "size_bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "bytes_saved": self.bytes_saved,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
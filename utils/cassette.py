@@ -0,0 +1,354 @@
+# Record/replay of LLM runs and HTTP fetches, keyed by request fingerprint
+import asyncio
+import atexit
+import hashlib
+import inspect
+import json
+import logging
+import os
+import threading
+import time
+from types import SimpleNamespace
+
+from utils.metrics import get_metrics
+
+logger = logging.getLogger(__name__)
+
+# off: call through; record: call through and store; replay: serve from the cassette only;
+# auto: replay what is recorded, record the rest
+CASSETTE_MODES = ("off", "record", "replay", "auto")
+CASSETTE_MODE = os.getenv("CASSETTE_MODE", "off")
+CASSETTE_PATH = os.getenv("CASSETTE_PATH", "db/cassettes/default.jsonl")
+# zero: replay instantly; real: wait as long as the recorded call took
+CASSETTE_LATENCY = os.getenv("CASSETTE_LATENCY", "zero")
+# exact: only identical requests match; agent: an LLM request that was not recorded
+# gets the same agent's recordings in turn (prompts shift with local state like the memory log)
+CASSETTE_MATCH = os.getenv("CASSETTE_MATCH", "exact")
+# New recordings are appended to the file in batches of this many (and at exit)
+CASSETTE_FLUSH_EVERY = int(os.getenv("CASSETTE_FLUSH_EVERY", 64))
+
+# Request parameters that never change the response (and must not end up on disk)
+_SECRET_PARAMS = ("key", "api_key")
+
+
+class CassetteMissError(LookupError):
+    """Raised in replay mode for a request that was never recorded."""
+
+
+def fingerprint(kind: str, request: dict) -> str:
+    """Stable key of a request: its kind plus a canonical JSON of the request fields."""
+    canonical = json.dumps({"kind": kind, **request}, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:32]
+
+
+def http_request(url: str, params: dict | None) -> dict:
+    """Fingerprint fields of a GET, without API keys."""
+    params = {k: str(v) for k, v in (params or {}).items() if k not in _SECRET_PARAMS}
+    return {"url": url, "params": params}
+
+
+def llm_request(runner, prompt: str, agent: str) -> dict:
+    """Fingerprint fields of an agent run: the agent, its model and instruction, and the prompt."""
+    blueprint = getattr(runner, "agent", None)
+    model = getattr(blueprint, "model", None)
+    instruction = getattr(blueprint, "instruction", None)
+    return {
+        "agent": agent,
+        "model": model if isinstance(model, str) else getattr(model, "model", None),
+        "instruction": instruction if isinstance(instruction, str) else None,
+        "prompt": prompt,
+    }
+
+
+# --- Event (de)serialization ---
+
+def _encode_part(part) -> dict:
+    encoded = {}
+    if getattr(part, "text", None) is not None:
+        encoded["text"] = part.text
+    if getattr(part, "thought", None):
+        encoded["thought"] = True
+    call = getattr(part, "function_call", None)
+    if call is not None:
+        encoded["function_call"] = {"name": call.name, "args": dict(getattr(call, "args", None) or {})}
+    response = getattr(part, "function_response", None)
+    if response is not None:
+        encoded["function_response"] = {"name": response.name}
+    return encoded
+
+
+def encode_event(event) -> dict:
+    """
+    The fields of an ADK event the pipeline reads: author, partial flag,
+    text/thought/function-call parts and token usage.
+    """
+    encoded = {}
+    if getattr(event, "author", None):
+        encoded["author"] = event.author
+    if getattr(event, "partial", False):
+        encoded["partial"] = True
+    content = getattr(event, "content", None)
+    if content is not None:
+        encoded["content"] = {
+            "role": getattr(content, "role", None),
+            "parts": [_encode_part(part) for part in getattr(content, "parts", None) or []],
+        }
+    usage = getattr(event, "usage_metadata", None)
+    if usage is not None:
+        encoded["usage"] = [getattr(usage, "prompt_token_count", None) or 0,
+                            getattr(usage, "candidates_token_count", None) or 0]
+    return encoded
+
+
+def encode_events(events) -> list:
+    return [encode_event(event) for event in events]
+
+
+def decode_events(encoded: list) -> list:
+    return [decode_event(event) for event in encoded]
+
+
+def decode_event(encoded: dict):
+    """Attribute-style event equivalent to the recorded one, as far as `encode_event` captured it."""
+    content = encoded.get("content")
+    if content is not None:
+        parts = []
+        for part in content["parts"]:
+            fields = dict(part)
+            if "function_call" in fields:
+                fields["function_call"] = SimpleNamespace(**fields["function_call"])
+            if "function_response" in fields:
+                fields["function_response"] = SimpleNamespace(**fields["function_response"])
+            parts.append(SimpleNamespace(**fields))
+        content = SimpleNamespace(role=content.get("role"), parts=parts)
+    usage = None
+    if "usage" in encoded:
+        usage = SimpleNamespace(prompt_token_count=encoded["usage"][0], candidates_token_count=encoded["usage"][1])
+    return SimpleNamespace(
+        author=encoded.get("author"),
+        partial=encoded.get("partial", False),
+        content=content,
+        usage_metadata=usage,
+    )
+
+
+# --- Cassette ---
+
+class Cassette:
+    """
+    One JSON Lines file of recorded responses: {"key", "kind", "agent",
+    "elapsed", "data"} per line, where `data` is a JSON response or a list
+    of encoded events (with per-event offsets for streams). A key recorded
+    again is appended, and the last recording wins on load.
+
+    Recordings are served from memory at once but written in batches of
+    `flush_every` lines, so recording does not put a file append on the
+    event loop per call; call `flush()` (also run at exit) to write the rest.
+    """
+
+    def __init__(self, path: str = CASSETTE_PATH, mode: str = CASSETTE_MODE,
+                 latency: str = CASSETTE_LATENCY, match: str = CASSETTE_MATCH,
+                 flush_every: int = CASSETTE_FLUSH_EVERY):
+        if mode not in CASSETTE_MODES or mode == "off":
+            raise ValueError(f"Unknown cassette mode '{mode}'. Expected one of {CASSETTE_MODES[1:]}.")
+        # Resolved now: the exit-time flush may run under another working directory
+        self.path = os.path.abspath(path)
+        self.mode = mode
+        self.latency = latency
+        self.match = match
+        self.flush_every = max(1, flush_every)
+        self._lock = threading.Lock()
+        # Lines not written yet; in record mode the first write replaces the previous cassette
+        self._unwritten: list[str] = []
+        self._replace_file = mode == "record"
+        self._entries: dict[str, dict] = {}
+        # (kind, agent) -> keys in recording order, and the next one to serve (CASSETTE_MATCH=agent)
+        self._by_agent: dict[tuple, list] = {}
+        self._agent_turn: dict[tuple, int] = {}
+        self.stats = {"replayed": 0, "recorded": 0, "missed": 0}
+        self._load()
+        atexit.register(self.flush)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _load(self):
+        if self.mode == "record" or not os.path.exists(self.path):
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line_number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # A run killed mid-write leaves a truncated last line
+                    logger.warning(f"Skipping unreadable cassette line {line_number} in {self.path}")
+                    continue
+                self._index(entry)
+        logger.info(f"Cassette: loaded {len(self._entries)} recordings from {self.path}")
+
+    def _index(self, entry: dict):
+        if entry["key"] not in self._entries:
+            self._by_agent.setdefault((entry["kind"], entry.get("agent")), []).append(entry["key"])
+        self._entries[entry["key"]] = entry
+
+    def lookup(self, key: str, kind: str, agent: str | None = None):
+        """The recording for `key`, or (match=agent, LLM runs only) the next recording of the same agent."""
+        with self._lock:
+            entry = self._entries.get(key)
+            group = (kind, agent)
+            if (entry is None and self.match == "agent" and self.mode == "replay"
+                    and kind.startswith("llm") and self._by_agent.get(group)):
+                keys = self._by_agent[group]
+                turn = self._agent_turn.get(group, 0)
+                self._agent_turn[group] = turn + 1
+                entry = self._entries[keys[turn % len(keys)]]
+            if entry is not None:
+                self.stats["replayed"] += 1
+        if entry is not None:
+            get_metrics().inc("cassette_replays_total", kind=kind, agent=agent or "unknown",
+                              help="Requests served from the cassette instead of the model or API.")
+        return entry
+
+    def store(self, key: str, kind: str, agent: str, elapsed: float, data):
+        entry = {"key": key, "kind": kind, "agent": agent, "elapsed": round(elapsed, 4), "data": data}
+        line = json.dumps(entry, separators=(",", ":"), default=str)
+        with self._lock:
+            self._index(entry)
+            self.stats["recorded"] += 1
+            self._unwritten.append(line)
+            if len(self._unwritten) >= self.flush_every:
+                self._write()
+
+    def flush(self):
+        """Writes the recordings not on disk yet."""
+        with self._lock:
+            self._write()
+
+    def _write(self):
+        if not self._unwritten:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, 'w' if self._replace_file else 'a', encoding='utf-8') as f:
+            f.write("".join(line + "\n" for line in self._unwritten))
+        self._unwritten.clear()
+        self._replace_file = False
+
+    def _miss(self, kind: str, agent: str, request: dict):
+        with self._lock:
+            self.stats["missed"] += 1
+        get_metrics().inc("cassette_misses_total", kind=kind, agent=agent,
+                          help="Replayed requests that were not on the cassette.")
+        summary = request.get("url") or (request.get("prompt") or "")[:80]
+        raise CassetteMissError(f"No recording of {kind} request from {agent} ({summary!r}) in {self.path}")
+
+    def _delay(self, entry: dict) -> float:
+        return entry["elapsed"] if self.latency == "real" else 0.0
+
+    # --- Call wrappers ---
+
+    async def call(self, kind: str, agent: str, request: dict, fn, encode=None, decode=None, after_replay=None):
+        """
+        Returns `decode(recorded)` when the request is on the cassette, otherwise
+        `await fn()` (recording `encode(result)` in record/auto mode).
+        `after_replay(result)` is awaited for replayed results only.
+        """
+        key = fingerprint(kind, request)
+        if self.mode != "record":
+            entry = self.lookup(key, kind, agent)
+            if entry is not None:
+                if self._delay(entry):
+                    await asyncio.sleep(self._delay(entry))
+                result = decode(entry["data"]) if decode else entry["data"]
+                if after_replay is not None:
+                    await after_replay(result)
+                return result
+            if self.mode == "replay":
+                self._miss(kind, agent, request)
+
+        started = time.perf_counter()
+        result = await fn()
+        self.store(key, kind, agent, time.perf_counter() - started, encode(result) if encode else result)
+        return result
+
+    def call_sync(self, kind: str, agent: str, request: dict, fn, encode=None, decode=None):
+        """Blocking counterpart of `call`, for `fetch_json_sync`."""
+        key = fingerprint(kind, request)
+        if self.mode != "record":
+            entry = self.lookup(key, kind, agent)
+            if entry is not None:
+                if self._delay(entry):
+                    time.sleep(self._delay(entry))
+                return decode(entry["data"]) if decode else entry["data"]
+            if self.mode == "replay":
+                self._miss(kind, agent, request)
+
+        started = time.perf_counter()
+        result = fn()
+        self.store(key, kind, agent, time.perf_counter() - started, encode(result) if encode else result)
+        return result
+
+    async def stream(self, kind: str, agent: str, request: dict, stream_fn):
+        """
+        Async iterator over a streamed run's events: replayed with their
+        recorded spacing (latency=real), or passed through from
+        `stream_fn()` and recorded once the stream completes.
+        """
+        key = fingerprint(kind, request)
+        if self.mode != "record":
+            entry = self.lookup(key, kind, agent)
+            if entry is not None:
+                previous = 0.0
+                for offset, encoded in entry["data"]:
+                    if self.latency == "real" and offset > previous:
+                        await asyncio.sleep(offset - previous)
+                    previous = offset
+                    yield decode_event(encoded)
+                return
+            if self.mode == "replay":
+                self._miss(kind, agent, request)
+
+        started = time.perf_counter()
+        recorded = []
+        async for event in stream_fn():
+            recorded.append([round(time.perf_counter() - started, 4), encode_event(event)])
+            yield event
+        # Only complete streams are stored
+        self.store(key, kind, agent, time.perf_counter() - started, recorded)
+
+
+_cassette = None
+_cassette_guard = threading.Lock()
+
+
+def get_cassette():
+    """
+    Returns the process-wide cassette for CASSETTE_MODE/CASSETTE_PATH, or
+    None when recording and replay are off.
+    """
+    global _cassette
+    if CASSETTE_MODE == "off":
+        return None
+    with _cassette_guard:
+        if _cassette is None:
+            _cassette = Cassette()
+    return _cassette
+
+
+async def replay_tool_calls(blueprint, events: list):
+    """
+    Re-runs the tool calls in replayed events against the agent's tools, so
+    their side effects (e.g. the Manager's tools filling the session)
+    happen as they did while recording.
+    """
+    tools = {getattr(tool, "__name__", None): tool for tool in getattr(blueprint, "tools", None) or []}
+    for event in events:
+        for part in getattr(getattr(event, "content", None), "parts", None) or []:
+            call = getattr(part, "function_call", None)
+            tool = tools.get(call.name) if call is not None else None
+            if tool is None:
+                continue
+            result = tool(**(call.args or {}))
+            if inspect.isawaitable(result):
+                await result
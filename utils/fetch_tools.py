@@ -7,11 +7,188 @@ from google.adk.sessions import InMemorySessionService
 from google.adk.tools import google_search, AgentTool, ToolContext
 from google.adk.code_executors import BuiltInCodeExecutor
 
+import asyncio
+import logging
+import os
+import threading
 
+from utils.cassette import get_cassette, http_request
+from utils.metrics import get_metrics
+from utils.rate_limiter import get_rate_limiter
 
+try:
+    import aiohttp
+except ImportError:  # pragma: no cover - only needed by the async fetchers
+    aiohttp = None
+
+logger = logging.getLogger(__name__)
+
+# Transient server errors only: 429/503 are left to the LLM rate limiter (utils.rate_limiter),
+# which backs off all calls to the model together instead of each one sleeping for minutes
 retry_config = types.HttpRetryOptions(
-    attempts=5,  # Maximum retry attempts
-    exp_base=7,  # Delay multiplier
+    attempts=3,  # Maximum retry attempts
+    exp_base=2,  # Delay multiplier
     initial_delay=1,
-    http_status_codes=[429, 500, 503, 504],  # Retry on these HTTP errors
-)
\ No newline at end of file
+    http_status_codes=[500, 504],  # Retry on these HTTP errors
+)
+
+
+class RateLimitedGemini(Gemini):
+    """
+    Gemini model whose every request waits for the model's rate limiter
+    (utils.rate_limiter): each turn of a multi-turn run takes its own
+    requests-per-minute token and concurrency slot, and holds the slot only
+    while the request is open, not while the agent runs its tools.
+    A 429/503 retries that one request, so tools already run are not run again.
+    `agent_name` labels the queue-wait and retry metrics.
+    """
+
+    agent_name: str | None = None
+
+    async def generate_content_async(self, llm_request, stream: bool = False):
+        limiter = get_rate_limiter(self.model)
+        generate = super().generate_content_async
+        if stream:
+            # Partial responses may already be spoken, so a stream is not retried
+            async with limiter.slot(self.agent_name):
+                async for response in generate(llm_request, stream=True):
+                    yield response
+            return
+
+        async def request():
+            return [response async for response in generate(llm_request)]
+
+        # The agent handles each response (and runs its tools) after the slot is released
+        for response in await limiter.run(request, agent=self.agent_name):
+            yield response
+
+
+# --- Shared HTTP clients (weather, traffic) ---
+
+HTTP_TIMEOUT_SECONDS = float(os.getenv("HTTP_TIMEOUT_SECONDS", 10))
+HTTP_CONNECT_TIMEOUT_SECONDS = float(os.getenv("HTTP_CONNECT_TIMEOUT_SECONDS", 3))
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", 100))
+HTTP_MAX_CONNECTIONS_PER_HOST = int(os.getenv("HTTP_MAX_CONNECTIONS_PER_HOST", 20))
+HTTP_KEEPALIVE_SECONDS = float(os.getenv("HTTP_KEEPALIVE_SECONDS", 30))
+
+_http_client = None
+_http_client_loop = None
+_closing_connectors = set()
+_sync_session = None
+_sync_session_guard = threading.Lock()
+
+
+def get_http_client():
+    """
+    Returns the process-wide aiohttp session for the running event loop.
+    Connections are kept alive and pooled, with a per-host limit.
+
+    A session is bound to the loop that created it: callers must await
+    `close_http_client()` before their loop ends. A session left open by an
+    earlier loop is closed (and logged) when another loop asks for one.
+    """
+    global _http_client, _http_client_loop
+    if aiohttp is None:
+        raise RuntimeError("aiohttp is required for async HTTP fetching. Install it with `pip install aiohttp`.")
+
+    loop = asyncio.get_running_loop()
+    # A session is bound to the loop that created it (e.g. each asyncio.run in main.py)
+    if _http_client is None or _http_client.closed or _http_client_loop is not loop:
+        if _http_client is not None and not _http_client.closed:
+            _close_stale_client(_http_client, _http_client_loop)
+        connector = aiohttp.TCPConnector(
+            limit=HTTP_MAX_CONNECTIONS,
+            limit_per_host=HTTP_MAX_CONNECTIONS_PER_HOST,
+            keepalive_timeout=HTTP_KEEPALIVE_SECONDS,
+        )
+        timeout = aiohttp.ClientTimeout(
+            total=HTTP_TIMEOUT_SECONDS,
+            connect=HTTP_CONNECT_TIMEOUT_SECONDS,
+        )
+        _http_client = aiohttp.ClientSession(connector=connector, timeout=timeout)
+        _http_client_loop = loop
+    return _http_client
+
+
+def _close_stale_client(client, loop):
+    """Closes a session an earlier event loop did not close with `close_http_client()`."""
+    logger.warning("Closing an HTTP client left open by another event loop; "
+                   "await close_http_client() before the loop ends")
+    if loop.is_running():
+        # Still serving another thread: close it there
+        asyncio.run_coroutine_threadsafe(client.close(), loop)
+        return
+    # Nothing runs on a stopped loop: detach the connector (which marks the
+    # session closed) and drop its pooled connections from the running loop
+    connector = client.connector
+    client.detach()
+    if connector is not None:
+        task = asyncio.get_running_loop().create_task(_close_connector(connector))
+        _closing_connectors.add(task)
+        task.add_done_callback(_closing_connectors.discard)
+
+
+async def _close_connector(connector):
+    try:
+        await connector.close()
+    except Exception as e:
+        logger.debug(f"Could not close a stale HTTP connector: {e}")
+
+
+async def fetch_json(url: str, params: dict | None = None, agent: str = "http") -> dict:
+    """
+    GETs a JSON document through the shared async client. Raises on HTTP errors.
+    Latency and errors are recorded under `agent`. With a cassette
+    (CASSETTE_MODE) the response is recorded or replayed.
+    """
+    with get_metrics().track(agent, "http_fetch"):
+        cassette = get_cassette()
+        if cassette is not None:
+            return await cassette.call("http", agent, http_request(url, params), lambda: _get_json(url, params))
+        return await _get_json(url, params)
+
+
+async def _get_json(url: str, params: dict | None) -> dict:
+    client = get_http_client()
+    async with client.get(url, params=params) as response:
+        response.raise_for_status()
+        return await response.json(content_type=None)
+
+
+async def close_http_client():
+    """Closes the shared async client. Call on pipeline shutdown."""
+    global _http_client, _http_client_loop
+    if _http_client is not None and not _http_client.closed and _http_client_loop is asyncio.get_running_loop():
+        await _http_client.close()
+    _http_client = None
+    _http_client_loop = None
+
+
+def fetch_json_sync(url: str, params: dict | None = None, agent: str = "http") -> dict:
+    """Blocking counterpart of `fetch_json`, on a shared keep-alive requests session."""
+    with get_metrics().track(agent, "http_fetch"):
+        cassette = get_cassette()
+        if cassette is not None:
+            return cassette.call_sync("http", agent, http_request(url, params), lambda: _get_json_sync(url, params))
+        return _get_json_sync(url, params)
+
+
+def _get_json_sync(url: str, params: dict | None) -> dict:
+    global _sync_session
+    import requests
+
+    with _sync_session_guard:
+        if _sync_session is None:
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections=HTTP_MAX_CONNECTIONS,
+                pool_maxsize=HTTP_MAX_CONNECTIONS_PER_HOST,
+            )
+            _sync_session = requests.Session()
+            _sync_session.mount("https://", adapter)
+            _sync_session.mount("http://", adapter)
+
+    response = _sync_session.get(
+        url, params=params, timeout=(HTTP_CONNECT_TIMEOUT_SECONDS, HTTP_TIMEOUT_SECONDS)
+    )
+    response.raise_for_status()
+    return response.json()
@@ -0,0 +1,85 @@
+# Single entry point for running ADK agents, so every LLM call is measured the same way
+import logging
+import uuid
+
+from utils.cassette import decode_events, encode_events, get_cassette, llm_request, replay_tool_calls
+from utils.metrics import get_metrics
+
+logger = logging.getLogger(__name__)
+
+# run_debug's default user, used when the caller does not pass one
+DEBUG_USER_ID = "debug_user_id"
+
+
+def record_usage(agent: str, events) -> dict:
+    """
+    Adds the token counts reported on model events to `llm_tokens_total`.
+    Partial (streamed) events are skipped, their final event carries the totals.
+    """
+    totals = {"prompt": 0, "completion": 0}
+    for event in events:
+        usage = getattr(event, 'usage_metadata', None)
+        if usage is None or getattr(event, 'partial', False):
+            continue
+        totals["prompt"] += getattr(usage, 'prompt_token_count', None) or 0
+        totals["completion"] += getattr(usage, 'candidates_token_count', None) or 0
+
+    metrics = get_metrics()
+    for kind, count in totals.items():
+        if count:
+            metrics.inc("llm_tokens_total", count, agent=agent, kind=kind,
+                        help="Tokens reported by the model, by agent and prompt/completion.")
+    return totals
+
+
+async def run_agent(runner, prompt: str, agent: str, **kwargs) -> list:
+    """
+    `runner.run_debug(prompt)` with latency, error and token accounting under `agent`.
+    Each model request in the run waits for the model's rate limiter, which
+    also retries it after a 429/503 (`RateLimitedGemini`); other transient
+    errors are retried inside the model client (`retry_config`) and only show
+    up here as added latency.
+    With a cassette (CASSETTE_MODE) the run is recorded or replayed; replayed
+    tool calls are executed again so their side effects still happen. Replayed
+    runs never reach the model, so they are not counted in `llm_calls_total`
+    or `llm_tokens_total` (the cassette counts them in `cassette_replays_total`).
+
+    Each run gets its own session (deleted afterwards), so pooled runners can
+    serve concurrent runs without sharing conversation history.
+    """
+    metrics = get_metrics()
+    kwargs.setdefault("session_id", f"run-{uuid.uuid4().hex}")
+    cassette = get_cassette()
+    try:
+        with metrics.track(agent, "llm_run"):
+            if cassette is None:
+                events = await _run_live(runner, prompt, agent, kwargs)
+            else:
+                events = await cassette.call(
+                    "llm", agent, llm_request(runner, prompt, agent),
+                    lambda: _run_live(runner, prompt, agent, kwargs),
+                    encode=encode_events, decode=decode_events,
+                    after_replay=lambda replayed: replay_tool_calls(getattr(runner, "agent", None), replayed),
+                )
+    finally:
+        await release_session(runner, kwargs["session_id"], kwargs.get("user_id", DEBUG_USER_ID))
+    return events
+
+
+async def _run_live(runner, prompt: str, agent: str, kwargs: dict) -> list:
+    """`run_debug`, counted as a model call with its token usage (replayed runs never get here)."""
+    get_metrics().inc("llm_calls_total", agent=agent, help="LLM agent runs by agent.")
+    events = await runner.run_debug(prompt, **kwargs)
+    record_usage(agent, events)
+    return events
+
+
+async def release_session(runner, session_id: str, user_id: str):
+    """Drops a finished run's session from the runner's session service (no-op for runners without one)."""
+    delete_session = getattr(getattr(runner, "session_service", None), "delete_session", None)
+    if delete_session is None:
+        return
+    try:
+        await delete_session(app_name=runner.app_name, user_id=user_id, session_id=session_id)
+    except Exception as e:
+        logger.debug(f"Could not delete session {session_id}: {e}")
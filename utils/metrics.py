@@ -0,0 +1,205 @@
+# Pipeline instrumentation: counters and latency histograms, exported as Prometheus text and JSON
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Where export_run_metrics() writes (empty disables the export)
+METRICS_DIR = os.getenv("METRICS_DIR", "metrics")
+
+# Upper bounds (seconds) of the latency buckets; a final +Inf bucket is implicit
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(key: tuple, extra: tuple = ()) -> str:
+    pairs = key + extra
+    if not pairs:
+        return ""
+    escaped = (f'{k}="{_escape(v)}"' for k, v in pairs)
+    return "{" + ",".join(escaped) + "}"
+
+
+class _Histogram:
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        """Estimate by linear interpolation inside the bucket holding the q-th observation."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, bucket_count in enumerate(self.counts):
+            if seen + bucket_count >= rank and bucket_count:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.max
+                return min(lower + (upper - lower) * (rank - seen) / bucket_count, self.max)
+            seen += bucket_count
+        return self.max
+
+
+class MetricsRegistry:
+    """
+    Process-wide counters and histograms keyed by name + labels.
+    Thread-safe, since the synchronous fetchers run in worker threads.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: dict[str, dict[tuple, float]] = {}
+        self._histograms: dict[str, dict[tuple, _Histogram]] = {}
+        self._help: dict[str, str] = {}
+        self.started_at = time.time()
+
+    def inc(self, name: str, amount: float = 1, help: str | None = None, **labels):
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            key = _label_key(labels)
+            series[key] = series.get(key, 0) + amount
+            if help:
+                self._help.setdefault(name, help)
+
+    def observe(self, name: str, value: float, buckets: tuple = LATENCY_BUCKETS, help: str | None = None, **labels):
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            key = _label_key(labels)
+            if key not in series:
+                series[key] = _Histogram(buckets)
+            series[key].observe(value)
+            if help:
+                self._help.setdefault(name, help)
+
+    @contextmanager
+    def track(self, agent: str, operation: str):
+        """
+        Times the block into `pipeline_operation_seconds` and counts any
+        exception in `pipeline_errors_total` (the exception is re-raised).
+        Works around `await` too, since only wall time is measured.
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            self.inc("pipeline_errors_total", agent=agent, operation=operation, error=type(e).__name__,
+                     help="Failed operations by agent, operation and exception type.")
+            raise
+        finally:
+            self.observe("pipeline_operation_seconds", time.perf_counter() - started, agent=agent, operation=operation,
+                         help="Latency of pipeline operations by agent.")
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+            self.started_at = time.time()
+
+    # --- Export ---
+
+    def to_prometheus(self) -> str:
+        """Prometheus text exposition format (counters and cumulative histograms)."""
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} counter")
+                for key, value in sorted(series.items()):
+                    lines.append(f"{name}{_format_labels(key)} {value:g}")
+            for name, series in sorted(self._histograms.items()):
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} histogram")
+                for key, hist in sorted(series.items()):
+                    cumulative = 0
+                    for bound, count in zip(hist.buckets + ("+Inf",), hist.counts):
+                        cumulative += count
+                        le = bound if bound == "+Inf" else f"{bound:g}"
+                        lines.append(f"{name}_bucket{_format_labels(key, (('le', le),))} {cumulative}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {hist.sum:.6f}")
+                    lines.append(f"{name}_count{_format_labels(key)} {hist.count}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> dict:
+        """JSON-friendly snapshot: counter values and histogram count/sum/p50/p95/max per label set."""
+        with self._lock:
+            counters = {
+                name: [{"labels": dict(key), "value": value} for key, value in sorted(series.items())]
+                for name, series in sorted(self._counters.items())
+            }
+            histograms = {
+                name: [
+                    {
+                        "labels": dict(key),
+                        "count": hist.count,
+                        "sum": round(hist.sum, 6),
+                        "p50": round(hist.quantile(0.5), 6),
+                        "p95": round(hist.quantile(0.95), 6),
+                        "max": round(hist.max, 6),
+                    }
+                    for key, hist in sorted(series.items())
+                ]
+                for name, series in sorted(self._histograms.items())
+            }
+        return {
+            "started_at": datetime.fromtimestamp(self.started_at).isoformat(),
+            "exported_at": datetime.now().isoformat(),
+            "counters": counters,
+            "histograms": histograms,
+        }
+
+
+_registry = MetricsRegistry()
+
+
+def get_metrics() -> MetricsRegistry:
+    """Returns the process-wide metrics registry."""
+    return _registry
+
+
+def _write_atomic(path: str, text: str):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def export_run_metrics(directory: str | None = None, run_name: str = "run") -> dict:
+    """
+    Writes the registry to `<dir>/metrics.prom` (overwritten, for a textfile
+    collector) and `<dir>/<run_name>-<timestamp>.json` (one summary per run).
+    Returns the summary.
+    """
+    directory = METRICS_DIR if directory is None else directory
+    summary = _registry.summary()
+    if not directory:
+        return summary
+    _write_atomic(os.path.join(directory, "metrics.prom"), _registry.to_prometheus())
+    json_path = os.path.join(directory, f"{run_name}-{datetime.now():%Y%m%d-%H%M%S}.json")
+    _write_atomic(json_path, json.dumps(summary, indent=2))
+    logger.info(f"Metrics written to {directory}")
+    return summary
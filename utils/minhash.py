@@ -0,0 +1,161 @@
+# MinHash signatures + LSH banding for near-duplicate text detection
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+
+logger = logging.getLogger(__name__)
+
+_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+
+def story_text(item: dict) -> str:
+    """The text a news story is fingerprinted by: headline and summary."""
+    return f"{item.get('headline', '')} {item.get('summary', '')}"
+
+
+def shingles(text: str, size: int = 3) -> set:
+    """Word n-grams of the lowercased text (the whole text if it is shorter than `size`)."""
+    words = _WORD_RE.findall(text.lower())
+    if len(words) <= size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def _choose_bands(num_perm: int, threshold: float) -> tuple:
+    """
+    Picks (bands, rows) with bands * rows == num_perm whose LSH threshold
+    (1 / bands) ** (1 / rows) is closest to the requested similarity.
+    """
+    options = [(b, num_perm // b) for b in range(1, num_perm + 1) if num_perm % b == 0]
+    return min(options, key=lambda br: abs((1 / br[0]) ** (1 / br[1]) - threshold))
+
+
+class MinHasher:
+    """Estimates Jaccard similarity of shingle sets with `num_perm` hash permutations."""
+
+    def __init__(self, num_perm: int = 64, seed: int = 1):
+        self.num_perm = num_perm
+        self.seed = seed
+        rng = random.Random(seed)
+        self._perms = [(rng.randint(1, _PRIME - 1), rng.randint(0, _PRIME - 1)) for _ in range(num_perm)]
+
+    def signature(self, shingle_set: set) -> list:
+        hashes = [
+            int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "big")
+            for s in shingle_set
+        ]
+        if not hashes:
+            return []
+        return [min(((a * h + b) % _PRIME) & _MAX_HASH for h in hashes) for a, b in self._perms]
+
+    @staticmethod
+    def similarity(sig_a: list, sig_b: list) -> float:
+        if not sig_a or len(sig_a) != len(sig_b):
+            return 0.0
+        return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / len(sig_a)
+
+
+class LSHIndex:
+    """
+    Near-duplicate index: signatures are split into bands and only keys that
+    share a band bucket are compared, so lookups stay sublinear in the index size.
+    Persisted as JSON (signatures + timestamps); buckets are rebuilt on load.
+    """
+
+    def __init__(self, threshold: float = 0.6, num_perm: int = 64, seed: int = 1):
+        self.threshold = threshold
+        self.hasher = MinHasher(num_perm=num_perm, seed=seed)
+        self.bands, self.rows = _choose_bands(num_perm, threshold)
+
+        self._signatures: dict[str, list] = {}
+        self._timestamps: dict[str, float] = {}
+        self._buckets: dict[tuple, set] = {}
+
+    def __len__(self):
+        return len(self._signatures)
+
+    def signature_for(self, text: str) -> list:
+        return self.hasher.signature(shingles(text))
+
+    def _band_keys(self, signature: list):
+        for band in range(self.bands):
+            start = band * self.rows
+            yield (band, tuple(signature[start:start + self.rows]))
+
+    def add(self, key: str, signature: list, timestamp: float):
+        if not signature:
+            return
+        self.remove(key)
+        self._signatures[key] = signature
+        self._timestamps[key] = timestamp
+        for band_key in self._band_keys(signature):
+            self._buckets.setdefault(band_key, set()).add(key)
+
+    def remove(self, key: str):
+        signature = self._signatures.pop(key, None)
+        self._timestamps.pop(key, None)
+        if signature is None:
+            return
+        for band_key in self._band_keys(signature):
+            bucket = self._buckets.get(band_key)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._buckets[band_key]
+
+    def query(self, signature: list) -> list:
+        """Returns [(key, estimated_similarity)] at or above the threshold, best first."""
+        if not signature:
+            return []
+        candidates = set()
+        for band_key in self._band_keys(signature):
+            candidates.update(self._buckets.get(band_key, ()))
+
+        matches = []
+        for key in candidates:
+            similarity = MinHasher.similarity(signature, self._signatures[key])
+            if similarity >= self.threshold:
+                matches.append((key, similarity))
+        return sorted(matches, key=lambda m: m[1], reverse=True)
+
+    def prune(self, cutoff_ts: float) -> int:
+        expired = [key for key, ts in self._timestamps.items() if ts <= cutoff_ts]
+        for key in expired:
+            self.remove(key)
+        return len(expired)
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        data = {
+            "num_perm": self.hasher.num_perm,
+            "seed": self.hasher.seed,
+            "entries": [
+                {"key": key, "timestamp": self._timestamps[key], "signature": sig}
+                for key, sig in self._signatures.items()
+            ],
+        }
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, separators=(",", ":"))
+        os.replace(tmp_path, path)
+
+    def load(self, path: str):
+        if not os.path.exists(path):
+            return
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (json.JSONDecodeError, OSError) as e:
+            logger.warning(f"Ignoring unreadable near-duplicate index {path}: {e}")
+            return
+        # Signatures from different permutations can't be compared
+        if (data.get("num_perm"), data.get("seed")) != (self.hasher.num_perm, self.hasher.seed):
+            logger.warning(f"Discarding near-duplicate index {path}: built with different permutations")
+            return
+        for row in data.get("entries", []):
+            self.add(row["key"], row["signature"], row["timestamp"])
@@ -0,0 +1,271 @@
+# Process-wide admission control for LLM calls: a requests-per-minute token bucket and AIMD concurrency per model
+import asyncio
+import logging
+import math
+import os
+import re
+import threading
+import time
+from contextlib import asynccontextmanager
+
+from utils.metrics import get_metrics
+
+logger = logging.getLogger(__name__)
+
+# Set LLM_RATE_LIMIT_ENABLED=0 to send every LLM call straight to the model
+LLM_RATE_LIMIT_ENABLED = os.getenv("LLM_RATE_LIMIT_ENABLED", "1") != "0"
+# Requests per minute per model (0 = no bucket); LLM_MODEL_RPM overrides it per model,
+# e.g. "gemini-2.5-flash-lite=4000,gemini-2.0-flash-exp=10"
+LLM_REQUESTS_PER_MINUTE = float(os.getenv("LLM_REQUESTS_PER_MINUTE", 4000))
+LLM_MODEL_RPM = os.getenv("LLM_MODEL_RPM", "")
+# Concurrent calls per model: starts at the initial limit, doubles per window of successes until
+# the first rate limit, then grows by one per window and halves on every 429/503
+LLM_INITIAL_CONCURRENCY = int(os.getenv("LLM_INITIAL_CONCURRENCY", 16))
+LLM_MIN_CONCURRENCY = int(os.getenv("LLM_MIN_CONCURRENCY", 1))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 64))
+# Pause for all calls to a model after a rate limit: doubles per consecutive rate limit, unless
+# the error says how long to wait
+LLM_BACKOFF_SECONDS = float(os.getenv("LLM_BACKOFF_SECONDS", 1))
+LLM_MAX_BACKOFF_SECONDS = float(os.getenv("LLM_MAX_BACKOFF_SECONDS", 30))
+# Attempts after a rate-limited one, each queued behind the pause
+LLM_RATE_LIMIT_RETRIES = int(os.getenv("LLM_RATE_LIMIT_RETRIES", 4))
+
+RATE_LIMIT_CODES = (429, 503)
+_RATE_LIMIT_PATTERN = re.compile(r"\b(429|503)\b|RESOURCE_EXHAUSTED|UNAVAILABLE")
+# "Please retry in 17.5s." / "'retryDelay': '17s'" in Gemini quota errors
+_RETRY_HINT_PATTERN = re.compile(r"retry(?:Delay['\"]?\s*:\s*['\"]?| in )(\d+(?:\.\d+)?)s")
+
+
+def is_rate_limit_error(error: BaseException) -> bool:
+    """True for 429 (quota) and 503 (overloaded) errors, by status code or message."""
+    code = getattr(error, "code", None) or getattr(error, "status_code", None)
+    if code in RATE_LIMIT_CODES:
+        return True
+    return bool(_RATE_LIMIT_PATTERN.search(str(error)))
+
+
+def retry_hint(error: BaseException) -> float | None:
+    """Seconds the model asked us to wait before retrying, if the error says."""
+    match = _RETRY_HINT_PATTERN.search(str(error))
+    return float(match.group(1)) if match else None
+
+
+def runner_model(runner) -> str:
+    """Model name of a runner's agent (`Gemini(model=...)` or a plain string)."""
+    model = getattr(getattr(runner, "agent", None), "model", None)
+    if not isinstance(model, str):
+        model = getattr(model, "model", None)
+    return model or "default"
+
+
+def _model_rpm(model: str) -> float:
+    for entry in LLM_MODEL_RPM.split(","):
+        name, _, rpm = entry.partition("=")
+        if name.strip() == model and rpm.strip():
+            return float(rpm)
+    return LLM_REQUESTS_PER_MINUTE
+
+
+class ModelLimiter:
+    """
+    Admits calls to one model while fewer than `limit` are in flight, a
+    requests-per-minute token is available and no rate-limit pause is on.
+    `limit` adapts (AIMD): it grows as calls succeed and halves when the
+    model answers 429/503, at most once per round of in-flight calls, since
+    those were all sent at the old limit. Rate limits also pause the model's
+    queue, so callers back off together instead of each sleeping on its own.
+
+    Waiters are futures of the running event loop; admission state is
+    plain data, so each asyncio.run in main.py can share the limiter.
+    """
+
+    def __init__(self, model: str, rpm: float | None = None, initial_concurrency: int = LLM_INITIAL_CONCURRENCY,
+                 min_concurrency: int = LLM_MIN_CONCURRENCY, max_concurrency: int = LLM_MAX_CONCURRENCY,
+                 backoff: float = LLM_BACKOFF_SECONDS, max_backoff: float = LLM_MAX_BACKOFF_SECONDS,
+                 enabled: bool = LLM_RATE_LIMIT_ENABLED, clock=time.monotonic):
+        self.model = model
+        self.enabled = enabled
+        self.rpm = _model_rpm(model) if rpm is None else rpm
+        self.min_concurrency = max(1, min_concurrency)
+        self.max_concurrency = max(self.min_concurrency, max_concurrency)
+        self.limit = float(min(max(initial_concurrency, self.min_concurrency), self.max_concurrency))
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._clock = clock
+
+        # One second's worth of requests can go out at once
+        self._capacity = max(1.0, self.rpm / 60)
+        self._tokens = self._capacity
+        self._refilled_at = clock()
+        self._in_flight = 0
+        self._waiters: list[asyncio.Future] = []
+        self._paused_until = 0.0
+        self._slow_start = True
+        self._rate_limit_streak = 0
+        self._decreased_at = -math.inf
+        self._stats_lock = threading.Lock()
+        self.stats = {"acquired": 0, "rate_limited": 0, "decreases": 0, "retries": 0,
+                      "queue_seconds": 0.0, "max_queue_seconds": 0.0}
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    # --- Admission ---
+
+    def _refill(self, now: float):
+        if self.rpm > 0:
+            self._tokens = min(self._capacity, self._tokens + (now - self._refilled_at) * self.rpm / 60)
+        self._refilled_at = now
+
+    def _try_admit(self, now: float):
+        """Takes a slot and returns 0, or returns how long to wait (None: until a call finishes)."""
+        if now < self._paused_until:
+            return self._paused_until - now
+        if self._in_flight >= int(self.limit):
+            return None
+        if self.rpm > 0:
+            self._refill(now)
+            if self._tokens < 1:
+                return (1 - self._tokens) * 60 / self.rpm
+            self._tokens -= 1
+        self._in_flight += 1
+        return 0
+
+    def _wake(self):
+        for waiter in self._waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+    async def acquire(self, agent: str | None = None) -> float:
+        """Waits for a slot and returns the time spent queued."""
+        if not self.enabled:
+            return 0.0
+        started = self._clock()
+        loop = asyncio.get_running_loop()
+        while True:
+            delay = self._try_admit(self._clock())
+            if delay == 0:
+                break
+            waiter = loop.create_future()
+            self._waiters.append(waiter)
+            try:
+                await asyncio.wait_for(waiter, timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                self._waiters.remove(waiter)
+
+        waited = self._clock() - started
+        with self._stats_lock:
+            self.stats["acquired"] += 1
+            self.stats["queue_seconds"] += waited
+            self.stats["max_queue_seconds"] = max(self.stats["max_queue_seconds"], waited)
+        get_metrics().observe("llm_queue_wait_seconds", waited, model=self.model, agent=agent or "unknown",
+                              help="Time LLM calls waited for the model's rate limiter.")
+        return waited
+
+    def release(self, started: float, error: BaseException | None = None):
+        """Frees a slot taken at `started`, adapting the limit to how the call went."""
+        if not self.enabled:
+            return
+        self._in_flight = max(0, self._in_flight - 1)
+        if error is None:
+            self.record_success()
+        elif is_rate_limit_error(error):
+            self.record_rate_limit(started, error)
+        self._wake()
+
+    # --- AIMD ---
+
+    def record_success(self):
+        self._rate_limit_streak = 0
+        step = 1.0 if self._slow_start else 1.0 / self.limit
+        self.limit = min(float(self.max_concurrency), self.limit + step)
+
+    def record_rate_limit(self, started: float, error: BaseException | None = None) -> float:
+        """Pauses the model's queue and halves the limit; returns the pause in seconds."""
+        now = self._clock()
+        self._rate_limit_streak += 1
+        hint = retry_hint(error) if error is not None else None
+        pause = hint if hint is not None else self.backoff * 2 ** (self._rate_limit_streak - 1)
+        pause = min(pause, self.max_backoff)
+        self._paused_until = max(self._paused_until, now + pause)
+
+        with self._stats_lock:
+            self.stats["rate_limited"] += 1
+        get_metrics().inc("llm_rate_limited_total", model=self.model,
+                          help="LLM calls answered with 429/503, by model.")
+        # Calls sent before the last decrease already saw the old limit
+        if started >= self._decreased_at:
+            self._slow_start = False
+            self.limit = max(float(self.min_concurrency), self.limit / 2)
+            self._decreased_at = now
+            with self._stats_lock:
+                self.stats["decreases"] += 1
+            logger.warning(f"LLM rate limited on {self.model}: concurrency limit {self.limit:.0f}, "
+                           f"pausing {pause:.1f}s")
+        return pause
+
+    # --- Call wrappers ---
+
+    @asynccontextmanager
+    async def slot(self, agent: str | None = None):
+        """Holds one admission for the block; yields the queue wait."""
+        waited = await self.acquire(agent)
+        started = self._clock()
+        try:
+            yield waited
+        except Exception as e:
+            self.release(started, e)
+            raise
+        except BaseException:
+            # Cancelled: neither a success nor a rate limit
+            if self.enabled:
+                self._in_flight = max(0, self._in_flight - 1)
+                self._wake()
+            raise
+        else:
+            self.release(started)
+
+    async def run(self, call, agent: str | None = None, retries: int = LLM_RATE_LIMIT_RETRIES):
+        """`await call()` in a slot, retried (behind the pause) when rate limited."""
+        attempt = 0
+        while True:
+            try:
+                async with self.slot(agent):
+                    return await call()
+            except Exception as e:
+                if not self.enabled or attempt >= retries or not is_rate_limit_error(e):
+                    raise
+                attempt += 1
+                with self._stats_lock:
+                    self.stats["retries"] += 1
+                get_metrics().inc("pipeline_retries_total", agent=agent or "unknown", operation="llm_request",
+                                  help="Retried operations by agent.")
+                logger.info(f"Retrying rate-limited {agent or 'LLM'} call on {self.model} ({attempt}/{retries})")
+
+
+_limiters: dict[str, ModelLimiter] = {}
+_limiters_guard = threading.Lock()
+
+
+def get_rate_limiter(model: str) -> ModelLimiter:
+    """Returns the process-wide limiter for `model`."""
+    with _limiters_guard:
+        limiter = _limiters.get(model)
+        if limiter is None:
+            limiter = _limiters[model] = ModelLimiter(model)
+        return limiter
+
+
+def rate_limiters() -> dict:
+    """The limiters created so far, by model."""
+    with _limiters_guard:
+        return dict(_limiters)
+
+
+def clear_rate_limiters():
+    """Forgets learned limits (each model starts over at LLM_INITIAL_CONCURRENCY)."""
+    with _limiters_guard:
+        _limiters.clear()
@@ -0,0 +1,87 @@
+# Process-wide reuse of LlmAgent/InMemoryRunner instances: built once, every run gets a fresh session
+import asyncio
+import os
+import threading
+import time
+
+from utils.metrics import get_metrics
+
+# Set RUNNER_POOL_ENABLED=0 to build a new agent and runner for every call
+RUNNER_POOL_ENABLED = os.getenv("RUNNER_POOL_ENABLED", "1") != "0"
+
+
+class RunnerPool:
+    """
+    Runners keyed by (agent name, variant), e.g. ("SuperWriter", ("news",)).
+    A runner only holds the agent blueprint, model client and session
+    service, so concurrent runs can share it as long as each uses its own
+    session (see `utils.llm.run_agent`).
+
+    Like the shared HTTP client, a runner is bound to the event loop that
+    first used it; a different loop (e.g. each asyncio.run in main.py) gets
+    a fresh one. Building is timed as the `agent_setup` operation.
+    """
+
+    def __init__(self, enabled: bool = RUNNER_POOL_ENABLED):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        # key -> (event loop, runner)
+        self._runners: dict[tuple, tuple] = {}
+        self.stats = {"builds": 0, "reuses": 0, "setup_seconds": 0.0}
+
+    def _current_loop(self):
+        try:
+            return asyncio.get_running_loop()
+        except RuntimeError:
+            return None
+
+    def build(self, agent: str, build):
+        """Runs `build()` (returns a runner) with its setup time recorded, without pooling it."""
+        metrics = get_metrics()
+        with metrics.track(agent, "agent_setup"):
+            started = time.perf_counter()
+            runner = build()
+        with self._lock:
+            self.stats["builds"] += 1
+            self.stats["setup_seconds"] += time.perf_counter() - started
+        return runner
+
+    def get(self, key: tuple, build):
+        """The pooled runner for `key`, built with `build()` on first use (per event loop)."""
+        agent = key[0]
+        if not self.enabled:
+            return self.build(agent, build)
+
+        loop = self._current_loop()
+        with self._lock:
+            pooled = self._runners.get(key)
+            if pooled is not None and pooled[0] is loop:
+                self.stats["reuses"] += 1
+                _record_lookup(agent, hit=True)
+                return pooled[1]
+
+        _record_lookup(agent, hit=False)
+        runner = self.build(agent, build)
+        with self._lock:
+            self._runners[key] = (loop, runner)
+        return runner
+
+    def clear(self):
+        with self._lock:
+            self._runners.clear()
+
+    def __len__(self):
+        return len(self._runners)
+
+
+def _record_lookup(agent: str, hit: bool):
+    get_metrics().inc("runner_pool_lookups_total", agent=agent, result="hit" if hit else "miss",
+                      help="Pooled runner lookups by agent and hit/miss.")
+
+
+_runner_pool = RunnerPool()
+
+
+def get_runner_pool() -> RunnerPool:
+    """Returns the process-wide runner pool."""
+    return _runner_pool
@@ -0,0 +1,295 @@
+# Deadline-driven scheduler: pre-generates each user's podcast before their delivery time
+import asyncio
+import hashlib
+import heapq
+import itertools
+import logging
+import os
+import time
+from datetime import date, datetime, timedelta, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from utils.metrics import get_metrics
+
+logger = logging.getLogger(__name__)
+
+# Generation starts this long before the delivery time...
+SCHEDULER_LEAD_SECONDS = float(os.getenv("SCHEDULER_LEAD_SECONDS", 30 * 60))
+# ...minus a per-user offset in [0, spread) so users with the same wake time don't all start at once
+SCHEDULER_SPREAD_SECONDS = float(os.getenv("SCHEDULER_SPREAD_SECONDS", 20 * 60))
+SCHEDULER_CONCURRENCY = int(os.getenv("SCHEDULER_CONCURRENCY", 8))
+# Initial guess for one podcast's generation time, refined from observed runs
+SCHEDULER_EXPECTED_RUNTIME_SECONDS = float(os.getenv("SCHEDULER_EXPECTED_RUNTIME_SECONDS", 120))
+SCHEDULER_MAX_ATTEMPTS = int(os.getenv("SCHEDULER_MAX_ATTEMPTS", 3))
+SCHEDULER_RETRY_DELAY_SECONDS = float(os.getenv("SCHEDULER_RETRY_DELAY_SECONDS", 60))
+SCHEDULER_DEFAULT_TIMEZONE = os.getenv("SCHEDULER_DEFAULT_TIMEZONE", "UTC")
+
+# Upper bound on one idle sleep, so newly added jobs are noticed
+_MAX_IDLE_SECONDS = 60
+# Weight of the newest run in the runtime estimate
+_RUNTIME_SMOOTHING = 0.3
+
+
+def _schedule(profile: dict) -> dict:
+    schedule = profile.get("schedule") or {}
+    if not isinstance(schedule, dict):
+        raise ValueError(f"Invalid schedule {schedule!r}, expected an object")
+    return schedule
+
+
+def _user_timezone(schedule: dict):
+    name = schedule.get("timezone") or SCHEDULER_DEFAULT_TIMEZONE
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError, TypeError):
+        logger.warning(f"Unknown timezone '{name}', using {SCHEDULER_DEFAULT_TIMEZONE}")
+        return ZoneInfo(SCHEDULER_DEFAULT_TIMEZONE)
+
+
+def _delivery_time(schedule: dict) -> tuple:
+    text = schedule.get("delivery_time") or schedule.get("wake_time") or "07:00"
+    try:
+        hour, minute = map(int, text.split(":"))
+    except (ValueError, AttributeError):
+        hour = minute = -1
+    if not (0 <= hour < 24 and 0 <= minute < 60):
+        raise ValueError(f"Invalid delivery time {text!r}, expected HH:MM")
+    return hour, minute
+
+
+def next_delivery(profile: dict, after: float) -> float:
+    """
+    Epoch time of the user's next delivery strictly after `after`, from
+    schedule.delivery_time (or wake_time, "HH:MM") in schedule.timezone.
+    """
+    schedule = _schedule(profile)
+    hour, minute = _delivery_time(schedule)
+    tz = _user_timezone(schedule)
+
+    local_after = datetime.fromtimestamp(after, tz=timezone.utc).astimezone(tz)
+    day = local_after.date()
+    while True:
+        # Built from the local wall clock, so DST changes keep the same local time
+        delivery = datetime(day.year, day.month, day.day, hour, minute, tzinfo=tz)
+        if delivery.timestamp() > after:
+            return delivery.timestamp()
+        day += timedelta(days=1)
+
+
+def delivery_date(profile: dict, deadline: float) -> date:
+    """The user's local date of a delivery at `deadline`."""
+    tz = _user_timezone(_schedule(profile))
+    return datetime.fromtimestamp(deadline, tz=timezone.utc).astimezone(tz).date()
+
+
+def spread_offset(user_id: str, spread_seconds: float) -> float:
+    """Stable per-user offset in [0, spread_seconds)."""
+    if spread_seconds <= 0:
+        return 0.0
+    digest = int(hashlib.sha1(user_id.encode("utf-8")).hexdigest()[:8], 16)
+    return digest / 0x100000000 * spread_seconds
+
+
+class ScheduledJob:
+    def __init__(self, user_id: str, profile: dict, deadline: float, start_at: float):
+        self.user_id = user_id
+        self.profile = profile
+        self.deadline = deadline
+        self.start_at = start_at
+        self.attempts = 0
+        self.late = False
+        # Sequence number of the job's live queue entries (None once released)
+        self._queued = None
+
+    def __repr__(self):
+        return f"ScheduledJob({self.user_id!r}, deadline={self.deadline:.0f}, start_at={self.start_at:.0f})"
+
+
+class PodcastScheduler:
+    """
+    Long-running scheduler for `run_job(user_id, profile, deadline)` (a
+    coroutine function; `deadline` is the delivery time in epoch seconds).
+
+    Jobs wait in a heap ordered by start time (deadline - lead - spread offset)
+    and move to a ready heap ordered by deadline once due, so the most urgent
+    podcast always gets the next free slot. A second, deadline-ordered heap of
+    the waiting jobs releases a job early, flagged late, when the observed
+    generation time says it would otherwise miss its deadline. Failed runs are retried while there is time left, and
+    every finished job is rescheduled for the user's next delivery.
+    """
+
+    def __init__(self, run_job, lead_seconds: float = SCHEDULER_LEAD_SECONDS,
+                 spread_seconds: float = SCHEDULER_SPREAD_SECONDS,
+                 concurrency: int = SCHEDULER_CONCURRENCY,
+                 expected_runtime: float = SCHEDULER_EXPECTED_RUNTIME_SECONDS,
+                 max_attempts: int = SCHEDULER_MAX_ATTEMPTS,
+                 retry_delay: float = SCHEDULER_RETRY_DELAY_SECONDS,
+                 clock=time.time, sleep=asyncio.sleep):
+        self.run_job = run_job
+        self.lead_seconds = lead_seconds
+        self.spread_seconds = min(spread_seconds, lead_seconds)
+        self.concurrency = max(1, concurrency)
+        self.expected_runtime = expected_runtime
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self._clock = clock
+        self._sleep = sleep
+
+        self._seq = itertools.count()
+        # Waiting jobs by start time and by deadline; entries of released jobs are skipped when popped
+        self._pending = []  # (start_at, seq, job)
+        self._deadlines = []  # (deadline, seq, job)
+        self._ready = []  # (deadline, seq, job)
+        self._running: set[asyncio.Task] = set()
+        self._wakeup = None
+
+        self.stats = {"completed": 0, "failed": 0, "retries": 0, "late": 0, "missed_deadlines": 0, "max_lateness": 0.0}
+
+    # --- Queueing ---
+
+    def add_profile(self, user_id: str, profile: dict, after: float | None = None) -> ScheduledJob:
+        """Schedules the user's next delivery after `after` (default: now)."""
+        deadline = next_delivery(profile, self._clock() if after is None else after)
+        start_at = deadline - self.lead_seconds - spread_offset(user_id, self.spread_seconds)
+        job = ScheduledJob(user_id, profile, deadline, start_at)
+        self._push_pending(job)
+        return job
+
+    def add_profiles(self, profiles: dict):
+        """Schedules every user; a profile with an invalid schedule is logged and skipped."""
+        scheduled = 0
+        for user_id, profile in profiles.items():
+            try:
+                self.add_profile(user_id, profile)
+            except (ValueError, TypeError, AttributeError) as e:
+                # One malformed profile must not stop everyone else's deliveries
+                logger.error(f"Scheduler: not scheduling {user_id}: {e}")
+                continue
+            scheduled += 1
+        logger.info(f"Scheduler: {scheduled} users scheduled")
+
+    def _push_pending(self, job: ScheduledJob):
+        seq = next(self._seq)
+        job._queued = seq
+        heapq.heappush(self._pending, (job.start_at, seq, job))
+        heapq.heappush(self._deadlines, (job.deadline, seq, job))
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _push_ready(self, job: ScheduledJob):
+        job._queued = None
+        heapq.heappush(self._ready, (job.deadline, next(self._seq), job))
+
+    @staticmethod
+    def _drop_released(heap: list):
+        while heap and heap[0][2]._queued != heap[0][1]:
+            heapq.heappop(heap)
+
+    def _release_due(self, now: float):
+        """Moves due jobs, and jobs at risk of missing their deadline, to the ready heap."""
+        while self._pending and self._pending[0][0] <= now:
+            _, seq, job = heapq.heappop(self._pending)
+            if job._queued == seq:
+                self._push_ready(job)
+
+        # Only the jobs with the earliest deadlines can be at risk
+        while self._deadlines and self._deadlines[0][0] <= now + self.expected_runtime:
+            _, seq, job = heapq.heappop(self._deadlines)
+            if job._queued != seq:
+                continue
+            job.late = True
+            logger.warning(f"Scheduler: {job.user_id} is running late "
+                           f"(~{self.expected_runtime:.0f}s to generate, {job.deadline - now:.0f}s left), starting now")
+            self._push_ready(job)
+
+    def _start_ready(self, now: float):
+        # Earliest deadline first
+        while self._ready and len(self._running) < self.concurrency:
+            _, _, job = heapq.heappop(self._ready)
+            if not job.late and now + self.expected_runtime >= job.deadline:
+                job.late = True
+                logger.warning(f"Scheduler: {job.user_id} waited for a free slot and is running late")
+            task = asyncio.ensure_future(self._run(job))
+            self._running.add(task)
+            task.add_done_callback(self._on_done)
+
+    def _on_done(self, task: asyncio.Task):
+        self._running.discard(task)
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    # --- Execution ---
+
+    async def _run(self, job: ScheduledJob):
+        job.attempts += 1
+        started = self._clock()
+        try:
+            await self.run_job(job.user_id, job.profile, job.deadline)
+        except Exception:
+            logger.exception(f"Scheduler: generation failed for {job.user_id} (attempt {job.attempts})")
+            self._retry_or_give_up(job)
+            return
+
+        finished = self._clock()
+        runtime = finished - started
+        self.expected_runtime += _RUNTIME_SMOOTHING * (runtime - self.expected_runtime)
+        self.stats["completed"] += 1
+        self.stats["late"] += job.late
+        lateness = finished - job.deadline
+        if lateness > 0:
+            self.stats["missed_deadlines"] += 1
+            self.stats["max_lateness"] = max(self.stats["max_lateness"], lateness)
+            logger.warning(f"Scheduler: {job.user_id} was delivered {lateness:.0f}s after the deadline")
+        else:
+            logger.info(f"Scheduler: {job.user_id} ready {-lateness:.0f}s before delivery ({runtime:.0f}s to generate)")
+        self.add_profile(job.user_id, job.profile, after=job.deadline)
+
+    def _retry_or_give_up(self, job: ScheduledJob):
+        retry_at = self._clock() + self.retry_delay
+        if job.attempts < self.max_attempts and retry_at < job.deadline:
+            self.stats["retries"] += 1
+            get_metrics().inc("pipeline_retries_total", agent="Scheduler", operation="generate_podcast",
+                              help="Retried operations by agent.")
+            job.start_at = retry_at
+            self._push_pending(job)
+            return
+        self.stats["failed"] += 1
+        logger.error(f"Scheduler: giving up on {job.user_id} for this delivery after {job.attempts} attempts")
+        self.add_profile(job.user_id, job.profile, after=job.deadline)
+
+    def _idle_seconds(self, now: float) -> float:
+        candidates = [_MAX_IDLE_SECONDS]
+        self._drop_released(self._pending)
+        self._drop_released(self._deadlines)
+        if self._pending:
+            candidates.append(self._pending[0][0] - now)
+        if self._deadlines:
+            # Also wake up when the earliest deadline would become at risk
+            candidates.append(self._deadlines[0][0] - self.expected_runtime - now)
+        return max(0.0, min(candidates))
+
+    async def run(self, until: float | None = None):
+        """
+        Runs until `until` (epoch seconds; default forever), then waits for
+        the jobs already started.
+        """
+        self._wakeup = asyncio.Event()
+        try:
+            while until is None or self._clock() < until:
+                now = self._clock()
+                self._release_due(now)
+                self._start_ready(now)
+
+                idle = self._idle_seconds(now)
+                if until is not None:
+                    idle = min(idle, max(0.0, until - now))
+                self._wakeup.clear()
+                sleeper = asyncio.ensure_future(self._sleep(idle))
+                woken = asyncio.ensure_future(self._wakeup.wait())
+                await asyncio.wait({sleeper, woken}, return_when=asyncio.FIRST_COMPLETED)
+                sleeper.cancel()
+                woken.cancel()
+            if self._running:
+                await asyncio.gather(*self._running, return_exceptions=True)
+        finally:
+            self._wakeup = None
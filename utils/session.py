@@ -13,6 +13,7 @@ class SessionState:
         return self.state[key]
 
 # Keys for session state
+KEY_USER_ID = "user_id"
 KEY_USER_NAME = "user_name"
 KEY_LOCATION = "location"
 KEY_INTERESTS = "interests"
@@ -21,15 +22,20 @@ KEY_WEATHER_DATA = "weather_data"
 KEY_TRAFFIC_DATA = "traffic_data"
 KEY_ORIGIN = "origin"
 KEY_DESTINATION = "destination"
+KEY_TONE = "tone_preference"
+KEY_TIME_LIMIT = "time_limit"
 
 class InMemorySessionService:
     def __init__(self):
         self.state = {}
 
-    def initialize_user_context(self, profile_data):
+    def initialize_user_context(self, profile_data, user_id=None):
+        self.state[KEY_USER_ID] = user_id
         self.state[KEY_USER_NAME] = profile_data.get("name")
         self.state[KEY_LOCATION] = profile_data.get("location")
         self.state[KEY_INTERESTS] = profile_data.get("interests")
+        self.state[KEY_TONE] = profile_data.get("tone_preference")
+        self.state[KEY_TIME_LIMIT] = profile_data.get("time_limit")
         
         commute = profile_data.get("commute", {})
         self.state[KEY_ORIGIN] = commute.get("origin")
@@ -0,0 +1,59 @@
+# Coalesces identical concurrent requests into a single in-flight call
+import asyncio
+
+
+def normalize_query(query: str) -> str:
+    """Case- and whitespace-insensitive key for a free-text query."""
+    return " ".join(query.lower().split())
+
+
+class SingleFlight:
+    """
+    Runs at most one call per key at a time.
+    Concurrent callers for the same key await the in-flight call and share its
+    result (or its exception). Once the call finishes the key is released, so
+    later callers trigger a fresh call.
+    """
+
+    def __init__(self):
+        self._inflight: dict[str, asyncio.Task] = {}
+        self.stats = {"calls": 0, "shared": 0}
+
+    async def do(self, key: str, fn):
+        """
+        Returns the result of `fn()` (a coroutine function), sharing one
+        execution between all concurrent callers with the same key.
+        """
+        # Shield so one cancelled caller does not cancel the fetch for everyone else
+        return await asyncio.shield(self.start(key, fn))
+
+    def start(self, key: str, fn) -> asyncio.Task:
+        """
+        The in-flight task for `key`, started from `fn()` if there is none.
+        Unlike `do`, the key is claimed before the caller's next `await`.
+        """
+        loop = asyncio.get_running_loop()
+        task = self._inflight.get(key)
+
+        # A task left behind by another (closed) event loop can't be awaited here
+        if task is not None and task.get_loop() is not loop:
+            task = None
+
+        if task is None:
+            self.stats["calls"] += 1
+            task = loop.create_task(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t, key=key: self._release(key, t))
+        else:
+            self.stats["shared"] += 1
+        return task
+
+    def in_flight(self, key: str) -> bool:
+        """True while a call for `key` is running on the current event loop."""
+        task = self._inflight.get(key)
+        # Same test as `start`, so a key reported free is claimed by the next `start`
+        return task is not None and task.get_loop() is asyncio.get_running_loop()
+
+    def _release(self, key: str, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
@@ -0,0 +1,40 @@
+# Sentence splitting shared by script streaming and TTS
+import re
+
+# End of a sentence (optionally followed by closing quotes/brackets) plus the
+# whitespace after it, or a blank line between paragraphs
+_BOUNDARY = re.compile(r"(?<=[.!?])[\"')\]]*\s+|\n\s*\n")
+
+
+def split_sentences(text: str) -> list:
+    """Splits text into stripped, non-empty sentences."""
+    buffer = SentenceBuffer()
+    return buffer.feed(text) + buffer.flush()
+
+
+class SentenceBuffer:
+    """
+    Accumulates streamed text and releases whole sentences as soon as their
+    boundary has arrived. A sentence is only complete once the whitespace
+    after its punctuation is seen, so "3." followed later by "5%" is not cut.
+    """
+
+    def __init__(self):
+        self._pending = ""
+
+    def feed(self, delta: str) -> list:
+        self._pending += delta
+        sentences = []
+        start = 0
+        for match in _BOUNDARY.finditer(self._pending):
+            sentence = self._pending[start:match.end()].strip()
+            if sentence:
+                sentences.append(sentence)
+            start = match.end()
+        self._pending = self._pending[start:]
+        return sentences
+
+    def flush(self) -> list:
+        """Returns whatever is left (the last sentence may lack punctuation)."""
+        rest, self._pending = self._pending.strip(), ""
+        return [rest] if rest else []
@@ -1 +1,253 @@
 # (Optional) Text-to-speech engine
+# Splits the script into chunks, synthesizes them concurrently and
+# reassembles the audio in script order.
+import asyncio
+import hashlib
+import json
+import logging
+import math
+import os
+import struct
+import time
+import wave
+
+from utils.cache import DiskBlobCache
+from utils.singleflight import SingleFlight
+from utils.text import split_sentences
+
+logger = logging.getLogger(__name__)
+
+TTS_ENGINE = os.getenv("TTS_ENGINE", "local")
+# Chunks synthesized at the same time
+TTS_CONCURRENCY = int(os.getenv("TTS_CONCURRENCY", 4))
+# Sentences are packed into chunks of up to this many characters
+TTS_MAX_CHUNK_CHARS = int(os.getenv("TTS_MAX_CHUNK_CHARS", 400))
+
+# Synthesized segments, shared across runs and users (0 bytes disables the cache)
+TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR", "db/audio_cache")
+TTS_CACHE_MAX_BYTES = int(os.getenv("TTS_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+
+SAMPLE_WIDTH = 2  # 16-bit PCM
+
+# Process-wide: concurrent podcasts with the same segment synthesize it once
+_segment_flight = SingleFlight()
+_audio_cache = None
+
+
+def get_audio_cache():
+    """
+    Returns the process-wide audio segment cache, or None when caching is disabled.
+    """
+    global _audio_cache
+    if TTS_CACHE_MAX_BYTES <= 0:
+        return None
+    if _audio_cache is None:
+        _audio_cache = DiskBlobCache(TTS_CACHE_DIR, max_bytes=TTS_CACHE_MAX_BYTES, name="tts_audio")
+    return _audio_cache
+
+
+def normalize_segment(text: str) -> str:
+    """Whitespace-insensitive form of a chunk; case and punctuation change the delivery, so they stay."""
+    return " ".join(text.split())
+
+
+def segment_key(text: str, engine, voice: str | None = None, tone=None) -> str:
+    """Content address of a segment: normalized text plus everything that changes the audio."""
+    params = {
+        "text": normalize_segment(text),
+        "engine": engine.name,
+        "sample_rate": engine.sample_rate,
+        "engine_params": engine.cache_params(),
+        "voice": voice,
+        "tone": tone,
+    }
+    return hashlib.sha256(json.dumps(params, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def chunk_script(script: str, max_chars: int = TTS_MAX_CHUNK_CHARS) -> list:
+    """
+    Packs consecutive sentences into chunks of at most `max_chars`
+    (a single longer sentence becomes its own chunk).
+    """
+    chunks, current = [], ""
+    for sentence in split_sentences(script):
+        if current and len(current) + 1 + len(sentence) > max_chars:
+            chunks.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}" if current else sentence
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+class TTSEngine:
+    """
+    Interface for speech engines. `synthesize` returns mono 16-bit PCM at
+    `sample_rate`; it must be safe to call concurrently. `tone` is the
+    user's tone preference, for engines that support speaking styles.
+    """
+
+    name = "base"
+    sample_rate = 16000
+
+    async def synthesize(self, text: str, voice: str | None = None, tone=None) -> bytes:
+        raise NotImplementedError("You must implement `synthesize()` in your subclass.")
+
+    def cache_params(self) -> dict:
+        """Engine settings that change the audio, besides name and sample rate (part of the segment key)."""
+        return {}
+
+
+class LocalToneEngine(TTSEngine):
+    """
+    Offline engine for tests and development: renders each word as a short
+    tone, so the audio length follows the text like real speech would.
+    `latency` simulates the per-request delay of a remote engine.
+    """
+
+    name = "local"
+
+    def __init__(self, sample_rate: int = 16000, words_per_minute: int = 150, latency: float = 0.0):
+        self.sample_rate = sample_rate
+        self.words_per_minute = words_per_minute
+        self.latency = latency
+
+    def cache_params(self) -> dict:
+        # Latency only delays the call, the audio is the same
+        return {"words_per_minute": self.words_per_minute}
+
+    async def synthesize(self, text: str, voice: str | None = None, tone=None) -> bytes:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        # Rendering is CPU work, keep it off the event loop
+        return await asyncio.to_thread(self._render, text, voice)
+
+    def _render(self, text: str, voice: str | None) -> bytes:
+        word_samples = int(self.sample_rate * 60 / self.words_per_minute)
+        base_pitch = 180 if voice is None else 120 + sum(map(ord, voice)) % 120
+        samples = []
+        for word in text.split():
+            pitch = base_pitch + 10 * (len(word) % 5)
+            tone = int(word_samples * 0.8)
+            samples.extend(int(8000 * math.sin(2 * math.pi * pitch * i / self.sample_rate)) for i in range(tone))
+            samples.extend([0] * (word_samples - tone))
+        return struct.pack(f"<{len(samples)}h", *samples)
+
+
+TTS_ENGINES = {"local": LocalToneEngine}
+
+
+def create_tts_engine(name: str | None = None) -> TTSEngine:
+    """Builds the configured engine (TTS_ENGINE, default "local")."""
+    name = name or TTS_ENGINE
+    if name not in TTS_ENGINES:
+        raise ValueError(f"Unknown TTS engine '{name}'. Expected one of {tuple(TTS_ENGINES)}.")
+    return TTS_ENGINES[name]()
+
+
+class TTSPipeline:
+    """
+    Synthesizes chunks on up to `concurrency` engine calls at once and
+    joins them back in script order. Each run reports its real-time factor
+    (synthesis wall time / audio duration; below 1.0 is faster than playback).
+
+    Segments are looked up in the audio cache first (pass `cache=False` to
+    skip it). With a cache the script is chunked per sentence, so intros,
+    sign-offs and shared headlines map to the same segment across podcasts.
+    """
+
+    def __init__(self, engine: TTSEngine | None = None, concurrency: int = TTS_CONCURRENCY,
+                 max_chunk_chars: int = TTS_MAX_CHUNK_CHARS, cache=None):
+        self.engine = engine or create_tts_engine()
+        self.concurrency = max(1, concurrency)
+        self.max_chunk_chars = max_chunk_chars
+        self.cache = None if cache is False else (cache if cache is not None else get_audio_cache())
+
+    async def synthesize(self, script: str, voice: str | None = None, tone=None) -> dict:
+        """
+        Returns {"audio", "sample_rate", "chunks", "cached_chunks", "audio_seconds",
+        "synthesis_seconds", "rtf"} for the whole script.
+        """
+        started = time.perf_counter()
+        semaphore = asyncio.Semaphore(self.concurrency)
+        if self.cache is not None:
+            chunks = split_sentences(script)
+        else:
+            chunks = chunk_script(script, self.max_chunk_chars)
+        tasks = [asyncio.ensure_future(self._synthesize_chunk(chunk, voice, tone, semaphore)) for chunk in chunks]
+        return await self._assemble(tasks, started)
+
+    async def synthesize_stream(self, sentences, voice: str | None = None, tone=None) -> dict:
+        """
+        Same as `synthesize`, for an async iterator of sentences (e.g.
+        `SuperWriterAgent.stream_script()`): each sentence is submitted as
+        soon as it arrives, so synthesis overlaps script generation.
+        """
+        started = time.perf_counter()
+        semaphore = asyncio.Semaphore(self.concurrency)
+        tasks = []
+        try:
+            async for sentence in sentences:
+                tasks.append(asyncio.ensure_future(self._synthesize_chunk(sentence, voice, tone, semaphore)))
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+        return await self._assemble(tasks, started)
+
+    async def _synthesize_chunk(self, text: str, voice: str | None, tone, semaphore: asyncio.Semaphore) -> tuple:
+        """Returns (pcm, served_from_cache)."""
+        if self.cache is None:
+            async with semaphore:
+                return await self.engine.synthesize(text, voice, tone), False
+
+        # Cache reads and writes are file I/O, keep them off the event loop
+        key = segment_key(text, self.engine, voice, tone)
+        audio = await asyncio.to_thread(self.cache.get, key)
+        if audio is not None:
+            return audio, True
+
+        async def _synthesize_and_store():
+            async with semaphore:
+                audio = await self.engine.synthesize(normalize_segment(text), voice, tone)
+            await asyncio.to_thread(self.cache.set, key, audio)
+            return audio
+
+        return await _segment_flight.do(key, _synthesize_and_store), False
+
+    async def _assemble(self, tasks: list, started: float) -> dict:
+        # gather keeps submission order, whatever order the chunks finish in
+        try:
+            results = await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+        audio = b"".join(pcm for pcm, _ in results)
+        cached_chunks = sum(1 for _, from_cache in results if from_cache)
+        synthesis_seconds = time.perf_counter() - started
+        audio_seconds = len(audio) / (SAMPLE_WIDTH * self.engine.sample_rate)
+        rtf = synthesis_seconds / audio_seconds if audio_seconds else 0.0
+
+        logger.info(f"TTS ({self.engine.name}): {len(tasks)} chunks ({cached_chunks} cached), {audio_seconds:.1f}s of audio "
+                    f"in {synthesis_seconds:.2f}s (RTF {rtf:.3f}, concurrency {self.concurrency})")
+        return {
+            "audio": audio,
+            "sample_rate": self.engine.sample_rate,
+            "chunks": len(tasks),
+            "cached_chunks": cached_chunks,
+            "audio_seconds": audio_seconds,
+            "synthesis_seconds": synthesis_seconds,
+            "rtf": rtf,
+        }
+
+
+def save_wav(path: str, audio: bytes, sample_rate: int):
+    """Writes mono 16-bit PCM to a WAV file."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with wave.open(path, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(SAMPLE_WIDTH)
+        f.setframerate(sample_rate)
+        f.writeframes(audio)